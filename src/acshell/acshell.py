@@ -1,8 +1,11 @@
 from logging import getLogger, StreamHandler, INFO, Formatter
-from typing import Sequence
+from typing import Optional, Sequence
 
-from .contest.contest import load_contest
-from . import cheatsheet, help, login, result, task_run
+from .contest.contest import load_contest, sync_mirror
+from . import (
+    bench, cheatsheet, complete, help, history, login, memprof, result, standings, task_run, tracer,
+)
+from .utils import set_offline
 
 
 class ACShell:
@@ -39,6 +42,8 @@ class ACShell:
             return login.login(self.logger, argv[1:])
         elif _exec_command in ('load', 'ld'):
             return load_contest(self.logger, argv[1:])
+        elif _exec_command in ('mirror', 'mr'):
+            return sync_mirror(self.logger, argv[1:])
         elif _exec_command in ('test', 't'):
             return task_run.test_code(self.logger, argv[1:])
         elif _exec_command in ('check', 'c'):
@@ -47,26 +52,44 @@ class ACShell:
             return task_run.submit_code(self.logger, argv[1:])
         elif _exec_command in ('lang', 'la'):
             return task_run.show_language(self.logger, argv[1:])
+        elif _exec_command in ('history', 'hs'):
+            return history.history(self.logger, argv[1:])
+        elif _exec_command in ('memprof', 'mp'):
+            return memprof.memprof(self.logger, argv[1:])
         elif _exec_command in ('recent', 'rc'):
             return result.recent_result(self.logger, argv[1:])
         elif _exec_command in ('status', 'rs'):
             return result.status(self.logger, argv[1:])
+        elif _exec_command in ('standings', 'st'):
+            return standings.standings(self.logger, argv[1:])
         elif _exec_command in ('edit-cheat', 'ec'):
             return cheatsheet.open_cheat_dir(self.logger, argv[1:])
         elif _exec_command in ('add-cheat', 'ac'):
             return cheatsheet.extend_cheatsheet(self.logger, argv[1:])
         elif _exec_command in ('list-cheat', 'lc'):
             return cheatsheet.list_cheat_file(self.logger, argv[1:])
+        elif _exec_command in ('bench-cheat', 'bc'):
+            return bench.bench_cheatsheet(self.logger, argv[1:])
+        elif _exec_command in ('completion', 'cm'):
+            return complete.completion_script(self.logger, argv[1:])
         else:
             # その他の入力
             raise NotImplementedError
 
-    def run(self, argv: Sequence[str]) -> None:
+    def run(self, argv: Sequence[str], trace: Optional[str] = None, offline: bool = False) -> None:
         """コマンド実行の呼び出し
+
+        Args:
+            trace (:obj:`str`, optional): 実行時間の記録先 (空文字なら標準エラー)
+            offline (bool): 通信を行わない
         """
         assert len(argv) > 0
+        set_offline(offline)
+        if trace is not None:
+            tracer.enable()
         try:
-            self.exec_code = self.operate_command(argv)
+            with tracer.span(argv[0], 'command', argv=' '.join(argv)):
+                self.exec_code = self.operate_command(argv)
         except KeyboardInterrupt:
             self.exec_code = 1
         except NotImplementedError:
@@ -75,3 +98,6 @@ class ACShell:
         except RuntimeError as e:
             self.logger.error(e)
             self.exec_code = 1
+        finally:
+            if trace is not None:
+                tracer.dump(trace or None)
@@ -0,0 +1,163 @@
+"""チートシートのベンチマーク
+
+チートシート <name>.py と同じフォルダに置いた bench_<name>.py の bench_* 関数を、
+LANG_TABLE のすべてのインタプリタで計測する
+"""
+from datetime import datetime
+import json
+from logging import Logger
+from pathlib import Path
+import subprocess
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from tabulate import tabulate
+
+from .cheatsheet import load_cheat_index
+from .consts import ENCODING, LANG_TABLE
+from .utils import file_lock, pop_regression_options, user_data_dir
+
+
+bench_history_path = user_data_dir / 'bench_history.jsonl'
+# bench_*.py を読み込み、各関数の1回あたりの実行時間 (秒) をjsonで返すスクリプト
+BENCH_SCRIPT = '''\
+import importlib.util, json, os, sys, time
+path = sys.argv[1]
+sys.path.insert(0, os.path.dirname(path))
+spec = importlib.util.spec_from_file_location("bench_target", path)
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+res = {}
+for name in sorted(dir(mod)):
+    func = getattr(mod, name)
+    if not name.startswith("bench_") or not callable(func):
+        continue
+    # 1回の計測が0.2秒以上になるまで回数を増やす (PyPyのウォームアップも兼ねる)
+    number = 1
+    while True:
+        sta = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - sta
+        if elapsed >= 0.2 or number >= 1 << 20:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(4):
+        sta = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - sta)
+    res[name] = best / number
+print(json.dumps(res))
+'''
+
+
+def _run_bench(logger: Logger, lang: str, bench_path: Path) -> Dict[str, float]:
+    """ベンチマークのファイルを指定のインタプリタで実行する
+    """
+    try:
+        res = subprocess.run(
+            LANG_TABLE[lang].split() + ['-c', BENCH_SCRIPT, str(bench_path)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except OSError:
+        logger.warning(f'インタプリタが見つかりません: {LANG_TABLE[lang]}')
+        return dict()
+
+    if res.returncode != 0:
+        logger.error(f'ベンチマークの実行に失敗しました: {bench_path.name} (in {LANG_TABLE[lang]})\n'
+                     f'{res.stderr.decode()}')
+        return dict()
+
+    return json.loads(res.stdout.decode().strip().split('\n')[-1])
+
+
+def _load_baseline() -> Dict[Tuple[str, str, str], Dict]:
+    """(モジュール, 関数, 言語) ごとに最後に記録された結果を取得する
+    """
+    baseline: Dict[Tuple[str, str, str], Dict] = dict()
+    if not bench_history_path.is_file():
+        return baseline
+    with bench_history_path.open(encoding=ENCODING) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            baseline[(record['module'], record['bench'], record['lang'])] = record
+
+    return baseline
+
+
+def _save_history(record_l: List[Dict]) -> None:
+    """計測結果を履歴に追記する
+    """
+    with file_lock(bench_history_path):
+        with bench_history_path.open(mode='a', encoding=ENCODING) as f:
+            f.writelines(json.dumps(record) + '\n' for record in record_l)
+
+
+def bench_cheatsheet(logger: Logger, argv: Sequence[str]) -> int:
+    """チートシートのベンチマークを実行し、前回からの性能低下を検出する
+
+    --lang=<lang>: 計測する言語 (カンマ区切り, 既定はすべて)
+    --threshold=<percent>: 性能低下とみなす割合 (既定は10%)
+    --no-save: 結果を履歴に保存しない
+    """
+    argv, lang_l, threshold = pop_regression_options(argv)
+    module_l = [arg for arg in argv if not arg.startswith('--')]
+    if lang_l is None:
+        lang_l = list(LANG_TABLE.keys())
+    save = '--no-save' not in argv
+    for lang in lang_l:
+        if lang not in LANG_TABLE:
+            raise RuntimeError(f'定義されていない言語: {lang}')
+
+    cheat_index = load_cheat_index()
+    if not module_l:
+        module_l = sorted(name for name in cheat_index.modules if cheat_index.bench_path(name))
+    if not module_l:
+        logger.info('ベンチマーク (bench_<name>.py) が見つかりません')
+        return 0
+
+    baseline = _load_baseline()
+    now = datetime.now().isoformat(timespec='seconds')
+    record_l: List[Dict] = []
+    out_l: List[List] = []
+    regression_l: List[str] = []
+    for name in module_l:
+        bench_path: Optional[Path] = cheat_index.bench_path(name)
+        if bench_path is None:
+            logger.warning(f'ベンチマークが見つかりません: {name}')
+            continue
+        module_hash = cheat_index.entry(name)['hash']
+        for lang in lang_l:
+            logger.info(f'計測中: {name} (in {LANG_TABLE[lang]})')
+            for bench, sec in _run_bench(logger, lang, bench_path).items():
+                record_l.append({
+                    'time': now, 'module': name, 'bench': bench, 'lang': lang,
+                    'hash': module_hash, 'sec': sec,
+                })
+                prev = baseline.get((name, bench, lang))
+                diff = ''
+                if prev is not None and prev['sec'] > 0:
+                    ratio = (sec / prev['sec'] - 1) * 100
+                    diff = f'{ratio:+.1f}%'
+                    if ratio > threshold:
+                        diff = f'\033[33m{diff}\033[0m'
+                        regression_l.append(f'{name}.{bench} (in {LANG_TABLE[lang]}): {ratio:+.1f}%')
+                out_l.append([
+                    name, bench, lang, f'{sec * 1e6:.2f}',
+                    f'{prev["sec"] * 1e6:.2f}' if prev is not None else '', diff,
+                ])
+
+    print(tabulate(out_l, ['モジュール', '関数', '言語', '時間 (usec)', '前回 (usec)', '差分'], 'github'))
+    if save and record_l:
+        _save_history(record_l)
+
+    if regression_l:
+        logger.warning(f'{threshold}% 以上の性能低下:\n' + '\n'.join(regression_l))
+        return 1
+
+    return 0
@@ -1,9 +1,182 @@
+import ast
+import hashlib
+import json
 from logging import Logger
+import os
+from pathlib import Path
 import subprocess
-from typing import Sequence
+from typing import Dict, List, Optional, Sequence
 
+from .complete import save_candidates
 from .consts import ENCODING
-from .utils import get_cheat_dir, search_contest_json
+from .utils import get_cheat_dir, search_contest_json, user_cache_dir, write_atomic
+
+
+CHEAT_INDEX_VERSION = 2
+cheat_index_path = user_cache_dir / 'cheat_index.json'
+
+
+class CheatIndex:
+    """チートシートのモジュール名とファイルの対応表
+
+    チートシートフォルダ直下の .py (initial.py を除く) と cheatsheets/ 以下の .py を対象とし、
+    フォルダの更新時刻が変わった場合のみ作り直す
+    bench_*.py はベンチマーク用のファイルとして除外する
+    """
+
+    IGNORE_FILES = ('initial.py',)
+    BENCH_PREFIX = 'bench_'
+    CHEAT_SUB_DIR = 'cheatsheets'
+
+    def __init__(self, cheat_dir: Path, data: Dict) -> None:
+        self.cheat_dir = cheat_dir
+        self.dirs: Dict[str, int] = data['dirs']
+        self.modules: Dict[str, Dict] = data['modules']
+        self.conflicts: Dict[str, List[str]] = data['conflicts']
+        self.updated = False
+
+    @property
+    def index_dict(self) -> Dict:
+        return {
+            'version': CHEAT_INDEX_VERSION,
+            'root': str(self.cheat_dir),
+            'dirs': self.dirs,
+            'modules': self.modules,
+            'conflicts': self.conflicts,
+        }
+
+    def path(self, name: str) -> Optional[Path]:
+        """モジュール名からファイルのパスを取得する
+        """
+        if name not in self.modules:
+            return None
+        return self.cheat_dir / self.modules[name]['path']
+
+    def entry(self, name: str) -> Dict:
+        """モジュールの情報を取得する (ファイルが更新されていれば読み直す)
+        """
+        module = self.modules[name]
+        try:
+            mtime_ns = self.path(name).stat().st_mtime_ns
+        except OSError:
+            return module
+        if mtime_ns != module['mtime_ns']:
+            module.update(_scan_module(self.path(name)))
+            self.updated = True
+        return module
+
+    def bench_path(self, name: str) -> Optional[Path]:
+        """モジュールと同じフォルダにあるベンチマーク用のファイル (bench_<name>.py)
+        """
+        module_path = self.path(name)
+        if module_path is None:
+            return None
+        bench_path = module_path.with_name(f'{self.BENCH_PREFIX}{name}.py')
+        return bench_path if bench_path.is_file() else None
+
+    def is_fresh(self) -> bool:
+        """記録したフォルダの更新時刻が現在と一致するかどうか
+        """
+        for dir_name, mtime_ns in self.dirs.items():
+            try:
+                if (self.cheat_dir / dir_name).stat().st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def save(self) -> None:
+        write_atomic(cheat_index_path, json.dumps(self.index_dict).encode(ENCODING))
+        self.updated = False
+        # 補完の候補も更新する
+        save_candidates(sorted(self.modules))
+
+    @classmethod
+    def build(cls, cheat_dir: Path) -> 'CheatIndex':
+        """チートシートフォルダを走査して索引を作る
+        """
+        dirs: Dict[str, int] = {'.': cheat_dir.stat().st_mtime_ns}
+        file_l: List[Path] = [
+            file for file in cheat_dir.glob('*.py')
+            if file.is_file() and file.name not in cls.IGNORE_FILES
+        ]
+        sub_dir = cheat_dir / cls.CHEAT_SUB_DIR
+        if sub_dir.is_dir():
+            for cur_dir, dir_names, file_names in os.walk(str(sub_dir)):
+                dir_names[:] = sorted(
+                    d for d in dir_names if not d.startswith('.') and d != '__pycache__')
+                cur_path = Path(cur_dir)
+                dirs[cur_path.relative_to(cheat_dir).as_posix()] = cur_path.stat().st_mtime_ns
+                file_l.extend(cur_path / f for f in file_names if f.endswith('.py'))
+
+        # 浅い階層 -> パス順で優先する
+        file_l.sort(key=lambda file: (len(file.relative_to(cheat_dir).parts), file.as_posix()))
+        modules: Dict[str, Dict] = dict()
+        conflicts: Dict[str, List[str]] = dict()
+        for file in file_l:
+            if file.name.startswith(cls.BENCH_PREFIX):
+                continue
+            rel_path = file.relative_to(cheat_dir).as_posix()
+            if file.stem in modules:
+                conflicts.setdefault(file.stem, [modules[file.stem]['path']]).append(rel_path)
+                continue
+            modules[file.stem] = {'path': rel_path, **_scan_module(file)}
+
+        index = cls(cheat_dir, {'dirs': dirs, 'modules': modules, 'conflicts': conflicts})
+        index.updated = True
+        return index
+
+
+def _scan_module(file: Path) -> Dict:
+    """モジュールのハッシュと公開シンボルを取得する
+    """
+    data = file.read_bytes()
+    symbols: List[str] = []
+    try:
+        tree = ast.parse(data)
+    except (SyntaxError, ValueError):
+        tree = None
+    if tree is not None:
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                symbols.append(node.name)
+            elif isinstance(node, ast.Assign):
+                symbols.extend(t.id for t in node.targets if isinstance(t, ast.Name))
+            elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+                symbols.append(node.target.id)
+
+    return {
+        'mtime_ns': file.stat().st_mtime_ns,
+        'hash': hashlib.sha256(data).hexdigest(),
+        'symbols': [sym for sym in symbols if not sym.startswith('_')],
+    }
+
+
+def load_cheat_index(cheat_dir: Optional[Path] = None) -> CheatIndex:
+    """キャッシュされた索引を読み込み、古くなっていれば作り直す
+    """
+    if cheat_dir is None:
+        cheat_dir = get_cheat_dir()
+    if not cheat_dir.is_dir():
+        raise RuntimeError(f'チートシートのフォルダが見つかりません: {cheat_dir}')
+
+    index: Optional[CheatIndex] = None
+    try:
+        with cheat_index_path.open(encoding=ENCODING) as f:
+            data = json.load(f)
+        if data.get('version') == CHEAT_INDEX_VERSION and data.get('root') == str(cheat_dir):
+            index = CheatIndex(cheat_dir, data)
+    except (OSError, ValueError, KeyError):
+        index = None
+
+    if index is None or not index.is_fresh():
+        index = CheatIndex.build(cheat_dir)
+        try:
+            index.save()
+        except OSError:
+            pass
+
+    return index
 
 
 def extend_cheatsheet(logger: Logger, argv: Sequence[str]) -> int:
@@ -13,32 +186,38 @@ def extend_cheatsheet(logger: Logger, argv: Sequence[str]) -> int:
         raise RuntimeError('オプションが不足しています')
 
     task_code, sheet_name = argv[:2]
-    if sheet_name[:-3] != '.py':
-        sheet_name += '.py'
+    if sheet_name.endswith('.py'):
+        sheet_name = sheet_name[:-3]
 
     # チートシートを追加するディレクトリ
     contest_json = search_contest_json()
+    if contest_json is None:
+        raise RuntimeError('コンテストのフォルダにいません')
     target_dir = contest_json.parent / task_code
     if not target_dir.is_dir():
         # コードのディレクトリがない
         raise RuntimeError(f'問題コードが見つかりません: {task_code}')
 
     # チートシート
-    cheat_dir = get_cheat_dir()
-    cheat_path = cheat_dir / sheet_name
-    if not cheat_path.is_file():
+    cheat_index = load_cheat_index()
+    cheat_path = cheat_index.path(sheet_name)
+    if cheat_path is None or not cheat_path.is_file():
         # チートシートがない
         raise RuntimeError(f'チートシートが見つかりません: {sheet_name}')
+    if sheet_name in cheat_index.conflicts:
+        logger.warning(
+            f'同名のチートシートが複数あります: {", ".join(cheat_index.conflicts[sheet_name])}'
+            f' ({cheat_index.modules[sheet_name]["path"]} を使用します)')
 
     # ファイルをコピーして追加する
     with cheat_path.open(encoding=ENCODING) as rf:
         data = rf.read()
 
-    target_path = target_dir / sheet_name
+    target_path = target_dir / cheat_path.name
     with target_path.open(mode='w', encoding=ENCODING) as wf:
         wf.write(data)
 
-    logger.info(f'チートシート: {sheet_name} -> {target_path.parent.parent}/{target_path.parent}')
+    logger.info(f'チートシート: {cheat_path.name} -> {target_path.parent.parent}/{target_path.parent}')
     return 0
 
 
@@ -54,7 +233,16 @@ def list_cheat_file(logger: Logger, argv: Sequence[str]) -> int:
     """チートシートの一覧を表示する"""
     cheat_path = get_cheat_dir()
     logger.info(f'フォルダ: {cheat_path}')
-    file_l = sorted(list(file for file in cheat_path.glob('*.py')))
-    for file in file_l:
-        print(f'\t{file.stem}')
+    cheat_index = load_cheat_index(cheat_path)
+    for name in sorted(cheat_index.modules):
+        module = cheat_index.entry(name)
+        print(f'\t{name}\t({module["path"]})')
+        if module['symbols']:
+            print(f'\t\t{", ".join(module["symbols"])}')
+
+    for name, path_l in sorted(cheat_index.conflicts.items()):
+        logger.warning(f'同名のチートシートが複数あります: {name} -> {", ".join(path_l)}')
+
+    if cheat_index.updated:
+        cheat_index.save()
     return 0
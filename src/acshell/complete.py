@@ -0,0 +1,275 @@
+"""シェルの補完
+
+補完はキー入力のたびに実行されるため、requests / bs4 などは読み込まず、
+事前に作成した候補のキャッシュ (completion.json) と .contest.json のみを読む
+キャッシュは load やチートシートのコマンドの実行時に作り直す
+"""
+import json
+import os
+from pathlib import Path
+import re
+import sys
+from typing import Dict, List, Optional, Sequence, TYPE_CHECKING
+
+import appdirs
+
+from . import consts, texts
+from .consts import ENCODING, LANG_TABLE, RUNNER_FILE_NAME, SUB_LANG_TABLE
+from .texts import HELP_TEXT
+
+if TYPE_CHECKING:
+    from logging import Logger
+
+
+COMPLETION_VERSION = 1
+completion_path = Path(appdirs.user_cache_dir('acshell')) / 'completion.json'
+cheat_index_path = Path(appdirs.user_cache_dir('acshell')) / 'cheat_index.json'
+# 全コマンド共通のオプション
+GLOBAL_OPTIONS = ['--trace', '--trace=', '--offline']
+REG_OPTION = re.compile(r'--[\w-]+(?:\[?=)?')
+# ヘルプの引数名 -> 補完する候補の種類
+ARG_KIND = {
+    'task_code': 'tasks',
+    'lang': 'langs',
+    'cheatsheet_name': 'cheats',
+    'command': 'commands',
+}
+
+BASH_SCRIPT = '''\
+# acsh completion (bash)
+_acsh_complete() {
+    local line="${COMP_LINE:0:COMP_POINT}"
+    local -a words
+    read -ra words <<< "$line"
+    [[ "$line" == *" " ]] && words+=("")
+    local IFS=$'\\n'
+    COMPREPLY=($(acsh __complete bash "${words[@]:1}" 2>/dev/null))
+    if [[ ${#COMPREPLY[@]} -eq 1 && "${COMPREPLY[0]}" == *= ]]; then
+        compopt -o nospace
+    fi
+}
+complete -o default -F _acsh_complete acsh
+'''
+ZSH_SCRIPT = '''\
+#compdef acsh
+# acsh completion (zsh)
+_acsh() {
+    local -a candidates
+    candidates=("${(@f)$(acsh __complete zsh "${(@)words[2,CURRENT]}" 2>/dev/null)}")
+    candidates=(${candidates:#})
+    if (( ${#candidates} == 0 )); then
+        _files
+        return
+    fi
+    compadd -Q -- ${candidates:#*=}
+    compadd -Q -S '' -- ${(M)candidates:#*=}
+}
+compdef _acsh acsh
+'''
+
+
+def _parse_help_args(args: str) -> Dict:
+    """ヘルプの引数の説明から、位置引数の種類とオプションを取り出す
+    """
+    option_l = []
+    for opt in REG_OPTION.findall(args):
+        if opt.endswith('[='):
+            # 値を省略できるオプション
+            option_l += [opt[:-2], opt[:-2] + '=']
+        else:
+            option_l.append(opt)
+    positional_l = []
+    for token in args.split():
+        name = token.strip('<>[].')
+        if token.startswith('...') and positional_l:
+            positional_l[-1]['repeat'] = True
+            continue
+        if '--' in token or not name:
+            continue
+        kind = ARG_KIND.get(name, '')
+        if kind == 'langs' and token.startswith('<'):
+            # 提出時の言語は必須
+            kind = 'sub_langs'
+        positional_l.append({'kind': kind, 'repeat': token.endswith('...]')})
+        if kind in ('langs', 'sub_langs') and '--lang=' not in option_l:
+            # 言語は --lang=<lang> でも指定できる
+            option_l.append('--lang=')
+    return {'options': option_l, 'positional': positional_l}
+
+
+def _runner_path() -> Optional[Path]:
+    env_path = os.environ.get('ACSHELL_PATH', '')
+    return Path(env_path) / RUNNER_FILE_NAME if env_path else None
+
+
+def _runner_names(submit: bool = False) -> List[str]:
+    """runners.json で追加された言語 (submit が True なら提出できるもののみ)"""
+    runner_path = _runner_path()
+    try:
+        with runner_path.open(encoding=ENCODING) as f:
+            return [
+                name for name, conf in json.load(f).items()
+                if name not in LANG_TABLE and (not submit or conf.get('submit'))
+            ]
+    except (AttributeError, OSError, ValueError, TypeError):
+        return []
+
+
+def _source_stamp() -> List[int]:
+    """候補の元になるファイルの更新時刻 (更新されていればキャッシュを作り直す)
+    """
+    stamp_l = [os.stat(module.__file__).st_mtime_ns for module in (consts, texts)]
+    runner_path = _runner_path()
+    try:
+        stamp_l.append(runner_path.stat().st_mtime_ns)
+    except (AttributeError, OSError):
+        stamp_l.append(0)
+    return stamp_l
+
+
+def build_candidates(cheat_l: Optional[List[str]] = None) -> Dict:
+    """補完の候補を作成する
+
+    cheat_l が指定されなければ、チートシートの索引のキャッシュから読む
+    """
+    if cheat_l is None:
+        try:
+            with cheat_index_path.open(encoding=ENCODING) as f:
+                cheat_l = sorted(json.load(f).get('modules', {}).keys())
+        except (OSError, ValueError):
+            cheat_l = []
+
+    return {
+        'version': COMPLETION_VERSION,
+        'source': _source_stamp(),
+        'commands': sorted(HELP_TEXT.keys()),
+        'aliases': {data['short']: command for command, data in HELP_TEXT.items() if data.get('short')},
+        'args': {command: _parse_help_args(data.get('args', '')) for command, data in HELP_TEXT.items()},
+        'langs': list(LANG_TABLE.keys()) + _runner_names() + ['all'],
+        'sub_langs': list(dict.fromkeys(list(SUB_LANG_TABLE.keys()) + _runner_names(submit=True))),
+        'cheats': cheat_l,
+    }
+
+
+def save_candidates(cheat_l: Optional[List[str]] = None) -> Dict:
+    candidates = build_candidates(cheat_l)
+    try:
+        completion_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = completion_path.with_name(f'{completion_path.name}.{os.getpid()}.tmp')
+        with tmp_path.open(mode='w', encoding=ENCODING) as f:
+            json.dump(candidates, f)
+        os.replace(str(tmp_path), str(completion_path))
+    except OSError:
+        pass
+    return candidates
+
+
+def refresh_candidates() -> None:
+    """チートシートの索引を確認してから、補完の候補を作り直す
+    """
+    # 通常のコマンドの実行中に呼ばれるので、索引の読み込みを行ってよい
+    from .cheatsheet import load_cheat_index
+    try:
+        cheat_l = sorted(load_cheat_index().modules.keys())
+    except RuntimeError:
+        cheat_l = []
+    save_candidates(cheat_l)
+
+
+def _load_candidates() -> Dict:
+    try:
+        with completion_path.open(encoding=ENCODING) as f:
+            candidates = json.load(f)
+        if candidates.get('version') == COMPLETION_VERSION \
+                and candidates.get('source') == _source_stamp():
+            return candidates
+    except (OSError, ValueError):
+        pass
+    return save_candidates()
+
+
+def _task_keys() -> List[str]:
+    """上位のフォルダにある .contest.json から問題の一覧を取得する
+    """
+    cur_dir = Path.cwd()
+    for directory in (cur_dir, *cur_dir.parents):
+        json_path = directory / '.contest.json'
+        if json_path.is_file():
+            try:
+                with json_path.open(encoding=ENCODING) as f:
+                    return list(json.load(f).get('tasks', {}).keys())
+            except (OSError, ValueError):
+                return []
+    return []
+
+
+def candidates_for(words: Sequence[str]) -> List[str]:
+    """入力済みの単語 (最後の単語は入力中) に対する補完の候補
+    """
+    words = list(words) or ['']
+    cur = words[-1]
+    prev_l = [word for word in words[:-1] if word not in GLOBAL_OPTIONS]
+    candidates = _load_candidates()
+    if not prev_l:
+        if cur.startswith('-'):
+            return [opt for opt in GLOBAL_OPTIONS if opt.startswith(cur)]
+        return [command for command in candidates['commands'] if command.startswith(cur)]
+
+    command = candidates['aliases'].get(prev_l[0], prev_l[0])
+    spec = candidates['args'].get(command, {'options': [], 'positional': []})
+    if cur.startswith('--lang='):
+        return [f'--lang={lang}' for lang in candidates['langs'] if f'--lang={lang}'.startswith(cur)]
+    if cur.startswith('-'):
+        return [opt for opt in spec['options'] + GLOBAL_OPTIONS if opt.startswith(cur)]
+
+    # 位置引数の何番目か
+    index = len([word for word in prev_l[1:] if not word.startswith('-')])
+    positional_l = spec['positional']
+    if not positional_l:
+        return []
+    if index >= len(positional_l):
+        if not positional_l[-1]['repeat']:
+            return []
+        index = len(positional_l) - 1
+    kind = positional_l[index]['kind']
+    if kind == 'tasks':
+        pool = _task_keys()
+        # 小文字でも指定できる
+        if cur.islower():
+            pool = [key.lower() for key in pool]
+    elif kind:
+        pool = candidates.get(kind, [])
+    else:
+        return []
+    return [value for value in pool if value.startswith(cur)]
+
+
+def complete(argv: Sequence[str]) -> int:
+    """`acsh __complete <shell> <word>...` の処理 (候補を1行ずつ出力する)
+    """
+    if not argv:
+        return 1
+    shell, words = argv[0], argv[1:]
+    result_l = candidates_for(words)
+    cur = words[-1] if words else ''
+    if shell == 'bash' and '=' in cur:
+        # bash は = で単語を区切るので、= より後ろの部分を返す
+        prefix = cur[:cur.rindex('=') + 1]
+        result_l = [value[len(prefix):] for value in result_l if value.startswith(prefix)]
+    sys.stdout.write(''.join(f'{value}\n' for value in result_l))
+    return 0
+
+
+def completion_script(logger: 'Logger', argv: Sequence[str]) -> int:
+    """bash / zsh の補完スクリプトを出力する
+    """
+    shell = argv[0] if argv else os.path.basename(os.environ.get('SHELL', 'bash'))
+    if shell == 'bash':
+        print(BASH_SCRIPT, end='')
+    elif shell == 'zsh':
+        print(ZSH_SCRIPT, end='')
+    else:
+        raise RuntimeError(f'対応していないシェル: {shell} (bash / zsh)')
+    # 候補のキャッシュも作っておく
+    refresh_candidates()
+    return 0
@@ -10,3 +10,5 @@ SUB_LANG_TABLE = {
     'pypy': 'Python (PyPy 3.10-v7.3.12)',
     'mamba': 'Python (Mambaforge / CPython 3.10.10)',
 }
+# 追加の言語の設定 (チートシートのフォルダに置く)
+RUNNER_FILE_NAME = 'runners.json'
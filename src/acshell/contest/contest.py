@@ -1,15 +1,80 @@
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from logging import Logger
 from pathlib import Path
 import re
-from typing import Dict, Optional, Sequence, List
+import shutil
+import time
+from typing import Any, Dict, Iterator, Optional, Sequence, List
 
 from bs4 import BeautifulSoup
 
+from .. import mirror
+from ..complete import refresh_candidates
 from ..consts import ENCODING
 from ..utils import (
-    CookieSession, URL, get_soup, save_json, search_contest_json, load_json,
-    get_cheat_dir,
+    CookieSession, OfflineError, RateLimiter, URL, get_soup, save_json, search_contest_json, load_json,
+    get_cheat_dir, CONTEST_JSON_NAME,
 )
+from .task import Task, fetch_testcases
+
+
+# まとめて取得する際のコンテストの同時処理数と、リクエストの間隔 (秒)
+BULK_CONCURRENCY = 4
+BULK_INTERVAL = 0.5
+# abc300..abc320 / abc300..320 形式の範囲指定
+REG_CONTEST_RANGE = re.compile(r'^([A-Za-z_-]*?)(\d+)\.\.(?:\1)?(\d+)$')
+
+
+class TaskRecord(MutableMapping):
+    """コンテストの問題1件の情報
+
+    .contest.json にある概要 (code, name, score) 以外の項目が参照されたときに、
+    はじめて .task.json を読み込む (問題の一覧だけが必要な処理で、テストケースなどを読まずに済む)
+    """
+
+    def __init__(self, summary: Dict, json_path: Path) -> None:
+        self._summary = dict(summary)
+        self._json_path = json_path
+        # 読み込み前に書き換えられた項目 (読み込んだ値より優先する)
+        self._updated: Dict = dict()
+        self._data: Optional[Dict] = None
+
+    def _load(self) -> Dict:
+        if self._data is None:
+            task_info = load_json(self._json_path) if self._json_path.is_file() else dict()
+            self._data = {**self._summary, **task_info, **self._updated}
+        return self._data
+
+    def __getitem__(self, key: str) -> Any:
+        if self._data is None:
+            if key in self._updated:
+                return self._updated[key]
+            if key in self._summary:
+                return self._summary[key]
+        return self._load()[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self._data is None:
+            self._updated[key] = value
+        else:
+            self._data[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        self._load()
+        del self._data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __repr__(self) -> str:
+        return f'TaskRecord({self._data if self._data is not None else self._summary})'
 
 
 class Contest:
@@ -39,18 +104,16 @@ class Contest:
             raise RuntimeError('コンテストフォルダにいません')
 
         self.json_path = json_path
-        self.tasks = dict()
+        self.tasks: Dict[str, TaskRecord] = dict()
         # contest_infoの情報をattrに格納する
         for key, value in contest_info.items():
             self.__setattr__(f'{key}', value)
 
-        # task_infoについても追加する
-        for task_key in self.tasks:
-            if not self.task_path(task_key).is_file():
-                continue
-
-            task_info = load_json(self.task_path(task_key))
-            self.tasks[task_key].update(task_info)
+        # task_infoは参照されたときに読み込む
+        self.tasks = {
+            task_key: TaskRecord(summary, self.task_path(task_key))
+            for task_key, summary in self.tasks.items()
+        }
 
     def __str__(self):
         return self.__getattribute__('code')
@@ -77,60 +140,170 @@ class Contest:
         return self.json_path.parent / key / '.task.json'
 
     def task_dict(self, key: str) -> Dict:
-        resp = self.tasks[key]
+        resp = dict(self.tasks[key])
         resp['contest'] = self.code  # contest.code
         resp['key'] = key
         return resp
 
-    def update_info(self):
+    def is_complete(self) -> bool:
+        """終了したコンテストで、すべての問題のテストケースを取得済みかどうか
+
+        終了したコンテストの問題は変わらないので、取得し直す必要はない
+        """
+        if not self.tasks or not getattr(self, 'end_dt', None):
+            return False
+        end_dt = datetime.strptime(self.end_dt, '%Y-%m-%d %H:%M:%S%z')
+        if end_dt > datetime.now(timezone.utc):
+            return False
+        return all(
+            self.task_path(key).is_file() and self.tasks[key].get('testcases')
+            for key in self.tasks
+        )
+
+    def update_info(self, session: Optional[CookieSession] = None):
         """コンテストの情報を更新する
+
+        session が指定された場合はそのセッションを使う
         """
-        with CookieSession() as session:
-            # コンテスト情報
-            try:
-                contest_soup = get_soup(session, URL.contest(self.code))
-            except RuntimeError:
-                raise RuntimeError(f'未公開のコンテストです: {self.code}')
+        if session is None:
+            with CookieSession() as session:
+                return self.update_info(session)
 
-            contest_info = self.__scrape_contest_info(contest_soup)
-            for key, value in contest_info.items():
-                self.__setattr__(f'{key}', value)
-            save_json(self.json_path, self.contest_dict)
+        contest_soup = self.fetch_contest_info(session)
+        self.fetch_task_info(session, contest_soup)
+        # コードファイルのテンプレート準備
+        self.generate_task_dirs(self.__fetch_init_code())
 
-            # 設問情報
+    def update_info_at_start(self):
+        """コンテスト開始時刻まで待機し、開始と同時に問題と問題文を取得する
+
+        開始前に可能な処理 (コンテスト情報・テンプレートの取得) は先に済ませておく
+        """
+        with CookieSession() as session:
+            self.fetch_contest_info(session)
+            code_template = self.__fetch_init_code()
+            start_dt = datetime.strptime(self.start_dt, '%Y-%m-%d %H:%M:%S%z')
+            _wait_until(self.logger, session, start_dt)
+
+            # 問題一覧とトップページ (配点) を並列に取得する
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                tasklist_future = executor.submit(
+                    _get_soup_with_retry, session, URL.task(self.code))
+                contest_future = executor.submit(
+                    _get_soup_with_retry, session, URL.contest(self.code))
+                tasklist_soup = tasklist_future.result()
+                contest_soup = contest_future.result()
+            self.fetch_task_info(session, contest_soup, tasklist_soup)
+            self.generate_task_dirs(code_template)
+            # 問題文 (テストケース) を並列に取得する
+            self.fetch_testcases(session)
+
+    def fetch_contest_info(self, session: CookieSession) -> BeautifulSoup:
+        """コンテストのトップページから情報を取得して保存する
+        """
+        try:
+            contest_soup = get_soup(session, URL.contest(self.code))
+        except RuntimeError:
+            raise RuntimeError(f'未公開のコンテストです: {self.code}')
+
+        contest_info = self.__scrape_contest_info(contest_soup)
+        for key, value in contest_info.items():
+            self.__setattr__(f'{key}', value)
+        save_json(self.json_path, self.contest_dict)
+        return contest_soup
+
+    def fetch_task_info(
+        self, session: CookieSession, contest_soup: BeautifulSoup,
+        tasklist_soup: Optional[BeautifulSoup] = None,
+    ) -> None:
+        """問題一覧と配点を取得して保存する
+        """
+        # 設問情報
+        if tasklist_soup is None:
             try:
                 tasklist_soup = get_soup(session, URL.task(self.code))
             except RuntimeError:
                 raise RuntimeError(f'未公開のコンテストです: {self.code}')
 
-            task_info = self.__scrape_task_list(tasklist_soup)
-            for key in task_info:
-                if key not in self.tasks:
-                    self.tasks[key] = dict()
-                self.tasks[key].update(task_info[key])
-
-            # 設問のスコア情報の追加
-            score_info = self.__scrape_task_score(contest_soup)
-            for key, score in score_info.items():
-                if key in self.tasks:
-                    self.tasks[key]['score'] = score
-                else:
-                    self.logger.warning(f'問題のスコア情報が不明です: {key} - {score}')
-
-            # 設問情報を保存
-            save_json(self.json_path, self.contest_dict)
-            # コードファイルのテンプレート準備
-            code_template = self.__fetch_init_code()
-            for key in self.tasks:
-                # フォルダが未作成なら作成する
-                task_dir = self.task_path(key).parent
-                task_dir.mkdir(exist_ok=True)
-                # コードファイルも作成する
-                codefile_path = task_dir.joinpath(f'{self.tasks[key]["code"]}.py')
-                if not codefile_path.is_file():
-                    self.__generate__code_file(codefile_path, code_template)
-                # 保存
-                save_json(self.task_path(key), self.task_dict(key))
+        task_info = self.__scrape_task_list(tasklist_soup)
+        for key in task_info:
+            if key not in self.tasks:
+                self.tasks[key] = TaskRecord(dict(), self.task_path(key))
+            self.tasks[key].update(task_info[key])
+
+        # 設問のスコア情報の追加
+        score_info = self.__scrape_task_score(self.logger, contest_soup)
+        for key, score in score_info.items():
+            if key in self.tasks:
+                self.tasks[key]['score'] = score
+            else:
+                self.logger.warning(f'問題のスコア情報が不明です: {key} - {score}')
+
+        # 設問情報を保存
+        save_json(self.json_path, self.contest_dict)
+
+    def generate_task_dirs(self, code_template: List[str]) -> None:
+        """問題ごとのフォルダ・コードファイル・task.json を作成する
+        """
+        for key in self.tasks:
+            # フォルダが未作成なら作成する
+            task_dir = self.task_path(key).parent
+            task_dir.mkdir(exist_ok=True)
+            # コードファイルも作成する
+            codefile_path = task_dir.joinpath(f'{self.tasks[key]["code"]}.py')
+            if not codefile_path.is_file():
+                self.__generate__code_file(codefile_path, code_template)
+            # 保存
+            save_json(self.task_path(key), self.task_dict(key))
+
+    def fetch_testcases(self, session: CookieSession, missing_only: bool = False) -> None:
+        """すべての問題のテストケースを並列に取得する
+
+        missing_only が True の場合は、テストケースが未取得の問題のみ取得する
+        """
+        task_l = [Task(self.logger, self.task_path(key)) for key in self.tasks]
+        if missing_only:
+            task_l = [task for task in task_l if not task.testcases]
+        with ThreadPoolExecutor(max_workers=max(len(task_l), 1)) as executor:
+            future_l = [executor.submit(task.update_testcase, session) for task in task_l]
+            for task, future in zip(task_l, future_l):
+                try:
+                    future.result()
+                except RuntimeError as e:
+                    self.logger.warning(f'{e} ({task.key})')
+
+    @classmethod
+    def fetch_record(cls, logger: Logger, session: CookieSession, contest_code: str) -> Dict:
+        """フォルダを作らずに、コンテストと問題の情報・テストケースを取得する (ミラー用)
+        """
+        try:
+            contest_soup = get_soup(session, URL.contest(contest_code))
+            tasklist_soup = get_soup(session, URL.task(contest_code))
+        except RuntimeError:
+            raise RuntimeError(f'未公開のコンテストです: {contest_code}')
+
+        task_info = cls.__scrape_task_list(tasklist_soup)
+        for key, score in cls.__scrape_task_score(logger, contest_soup).items():
+            if key in task_info:
+                task_info[key]['score'] = score
+        for task in task_info.values():
+            task['testcases'] = fetch_testcases(session, contest_code, task['code'])
+
+        return {'code': contest_code, **cls.__scrape_contest_info(contest_soup), 'tasks': task_info}
+
+    def restore_from_mirror(self, record: Dict) -> None:
+        """ミラーの記録からコンテストフォルダを作成する (通信しない)
+        """
+        for key in ('title', 'start_dt', 'end_dt'):
+            self.__setattr__(key, record[key])
+        for key, task in record['tasks'].items():
+            self.tasks[key] = TaskRecord(
+                {k: v for k, v in task.items() if k != 'testcases'}, self.task_path(key))
+        save_json(self.json_path, self.contest_dict)
+        self.generate_task_dirs(self.__fetch_init_code())
+        for key in self.tasks:
+            # テストケースもミラーから取得する (入力例のない問題も通信しない)
+            Task(self.logger, self.task_path(key)).update_testcase(mirror_only=True)
 
     @staticmethod
     def __scrape_contest_info(soup: BeautifulSoup) -> Dict:
@@ -171,7 +344,8 @@ class Contest:
 
         return task_info
 
-    def __scrape_task_score(self, soup: BeautifulSoup) -> Dict:
+    @staticmethod
+    def __scrape_task_score(logger: Logger, soup: BeautifulSoup) -> Dict:
         """トップページの配点情報を取得する
         """
         score_info = dict()
@@ -187,7 +361,7 @@ class Contest:
                 score_info[_code] = _score
             break
         else:
-            self.logger.warning('スコア情報の取得に失敗しました')
+            logger.warning('スコア情報の取得に失敗しました')
 
         return score_info
 
@@ -224,22 +398,99 @@ class Contest:
             self.logger.warning(f'コードファイルの生成に失敗しました: {str(target_path)}')
 
 
-def __generate_contest_dir(logger: Logger, contest_code: str) -> Contest:
-    """新たにコンテストフォルダを作成する
+def _server_time_offset(session: CookieSession) -> float:
+    """サーバーの時刻 (Date ヘッダ) とローカルの時刻の差 (秒) を推定する
     """
-    with CookieSession() as session:
-        # ログインしていることを確認する
-        res = session.get(URL.SETTINGS)
-        if res.url not in URL.SETTINGS:
-            # ログインしていない
-            raise RuntimeError('ログインしてください')
+    sta = time.time()
+    res = session.head(URL.BASE)
+    end = time.time()
+    if 'Date' not in res.headers:
+        return 0.0
+    # Date ヘッダは秒単位なので、0.5秒を足して中央値とする
+    server_t = parsedate_to_datetime(res.headers['Date']).timestamp() + 0.5
+    return server_t - (sta + end) / 2
+
+
+def _wait_until(logger: Logger, session: CookieSession, start_dt: datetime) -> None:
+    """サーバーの時刻で start_dt になるまで待機する
+    """
+    offset = _server_time_offset(session)
+    target_t = start_dt.timestamp() - offset
+    remain = target_t - time.time()
+    if remain <= 0:
+        return
+
+    logger.info(
+        f'コンテスト開始まで待機します: {start_dt.astimezone()} '
+        f'(残り {int(remain)} 秒, サーバーとの時差 {offset:+.2f} 秒)')
+    while True:
+        remain = target_t - time.time()
+        if remain <= 0:
+            break
+        # 開始直前は細かく確認する
+        time.sleep(min(remain, max(remain / 2, 0.01), 60))
 
-        # コンテストが存在することを確認する
+
+def _get_soup_with_retry(
+    session: CookieSession, url: str, retry: int = 10, interval: float = 0.5,
+) -> BeautifulSoup:
+    """開始直後はページが公開されていないことがあるため、数回再試行する
+    """
+    for _ in range(retry - 1):
         try:
-            get_soup(session, URL.contest(contest_code))
+            return get_soup(session, url)
+        except OfflineError:
+            # 接続できない場合は再試行しても失敗する
+            raise
         except RuntimeError:
-            # 存在しない
-            raise RuntimeError(f'未公開のコンテストです: {contest_code}')
+            time.sleep(interval)
+
+    return get_soup(session, url)
+
+
+def _check_login(session: CookieSession) -> None:
+    """ログインしていることを確認する
+    """
+    res = session.get(URL.SETTINGS)
+    if res.url not in URL.SETTINGS:
+        # ログインしていない
+        raise RuntimeError('ログインしてください')
+
+
+def _expand_contest_codes(text: str) -> List[str]:
+    """カンマ区切り・範囲指定 (abc300..abc320) のコンテストを展開する
+    """
+    code_l = []
+    for part in text.split(','):
+        res = REG_CONTEST_RANGE.match(part)
+        if res is None:
+            if part:
+                code_l.append(part)
+            continue
+        prefix, sta, end = res.groups()
+        if int(sta) > int(end):
+            raise RuntimeError(f'不正なコンテストの範囲: {part}')
+        # 桁数は開始側に合わせる (arc058..arc070 など)
+        code_l += [f'{prefix}{i:0{len(sta)}d}' for i in range(int(sta), int(end) + 1)]
+
+    return list(dict.fromkeys(code_l))
+
+
+def __generate_contest_dir(logger: Logger, contest_code: str, check: bool = True) -> Contest:
+    """新たにコンテストフォルダを作成する
+
+    check が False の場合 (ミラーから作成する場合) は、ログインとコンテストの確認を行わない
+    """
+    if check:
+        with CookieSession() as session:
+            _check_login(session)
+
+            # コンテストが存在することを確認する
+            try:
+                get_soup(session, URL.contest(contest_code))
+            except RuntimeError:
+                # 存在しない
+                raise RuntimeError(f'未公開のコンテストです: {contest_code}')
 
     # フォルダを作成する
     current_dir = Path.cwd()
@@ -258,16 +509,144 @@ def __generate_contest_dir(logger: Logger, contest_code: str) -> Contest:
     return Contest(logger, json_path)
 
 
+def __load_contest_bulk(logger: Logger, contest_code_l: List[str]) -> int:
+    """複数のコンテストをまとめて取得する
+
+    1つのセッションを共有し、リクエストの間隔を制限しながら並列に取得する
+    取得済みのコンテストは飛ばすので、中断した場合は同じコマンドで再開できる
+    """
+    base_dir = Path.cwd()
+    summary: Dict[str, str] = dict()
+
+    def load(contest_code: str) -> str:
+        contest_dir = base_dir / contest_code
+        json_path = contest_dir / CONTEST_JSON_NAME
+        created = False
+        if not json_path.is_file():
+            created = not contest_dir.exists()
+            contest_dir.mkdir(parents=True, exist_ok=True)
+            save_json(contest_dir, {'code': contest_code})
+        contest = Contest(logger, json_path)
+        if contest.is_complete():
+            return 'スキップ (取得済み)'
+        record = mirror.contest_record(contest_code)
+        if record is not None:
+            contest.restore_from_mirror(record)
+            return f'{len(record["tasks"])} 問 (ミラーから取得)'
+
+        try:
+            contest.update_info(session)
+        except RuntimeError:
+            if created:
+                # 存在しないコンテストのフォルダは残さない
+                shutil.rmtree(str(contest_dir))
+            raise
+        contest.fetch_testcases(session, missing_only=True)
+        # 取得したテストケースを反映して確認する
+        contest = Contest(logger, json_path)
+        if not contest.is_complete():
+            return f'{len(contest.tasks)} 問 (一部のテストケースが未取得です)'
+        return f'{len(contest.tasks)} 問'
+
+    # すべてミラーから作成できる場合は通信しない
+    online = any(code not in mirror.load_index()['contests'] for code in contest_code_l)
+    with CookieSession() if online else nullcontext() as session:
+        if online:
+            _check_login(session)
+            session.rate_limiter = RateLimiter(BULK_INTERVAL)
+        with ThreadPoolExecutor(max_workers=BULK_CONCURRENCY) as executor:
+            future_l = [executor.submit(load, code) for code in contest_code_l]
+            for contest_code, future in zip(contest_code_l, future_l):
+                try:
+                    summary[contest_code] = f'OK: {future.result()}'
+                except RuntimeError as e:
+                    summary[contest_code] = f'NG: {e}'
+
+    refresh_candidates()
+    for contest_code in contest_code_l:
+        text = f'{contest_code}: {summary[contest_code]}'
+        if summary[contest_code].startswith('OK'):
+            logger.info(text)
+        else:
+            logger.error(text)
+
+    return 0 if all(text.startswith('OK') for text in summary.values()) else 1
+
+
 def load_contest(logger: Logger, argv: Sequence[str]) -> int:
     """コンテスト情報を取得し、コードファイルなどを生成する
+
+    コンテストを範囲 (abc300..abc320) やカンマ区切りで指定した場合は、まとめて取得する
+    --at-start: コンテストの開始時刻まで待機し、開始と同時に問題を取得する
     """
+    at_start = '--at-start' in argv
+    argv = [arg for arg in argv if not arg.startswith('--')]
     contest_code: str = ''
-    if len(argv) > 0:
+    if len(argv) > 0 and ('..' in argv[0] or ',' in argv[0]):
+        if at_start:
+            raise RuntimeError('--at-start は複数のコンテストには指定できません')
+        return __load_contest_bulk(logger, _expand_contest_codes(argv[0]))
+    elif len(argv) > 0:
         contest_code = argv[0]
+        record = None if at_start else mirror.contest_record(contest_code)
+        if record is not None:
+            contest = __generate_contest_dir(logger, contest_code, check=False)
+            contest.restore_from_mirror(record)
+            logger.info(f'ミラーからコンテストを作成しました: {contest_code}')
+            refresh_candidates()
+            return 0
         contest = __generate_contest_dir(logger, contest_code)
     else:
         contest = Contest(logger)
 
     # 情報の取得
-    contest.update_info()
+    if at_start:
+        contest.update_info_at_start()
+    else:
+        contest.update_info()
+    refresh_candidates()
     return 0
+
+
+def sync_mirror(logger: Logger, argv: Sequence[str]) -> int:
+    """過去のコンテストの問題情報とテストケースをローカルミラーに保存する
+
+    `mirror sync <contests>` の形式で、コンテストを範囲 (abc300..abc320) やカンマ区切りで指定する
+    終了後に保存したコンテストは飛ばすので、同じコマンドで差分のみ取得できる
+    --force: 保存済みのコンテストも取得し直す
+    """
+    force = '--force' in argv
+    argv = [arg for arg in argv if not arg.startswith('--')]
+    if len(argv) < 2 or argv[0] != 'sync':
+        raise RuntimeError('オプションが不足しています (mirror sync <contests>)')
+    contest_code_l = _expand_contest_codes(argv[1])
+    target_l = [code for code in contest_code_l if force or not mirror.is_synced(code)]
+    summary: Dict[str, str] = {
+        code: 'OK: スキップ (保存済み)' for code in contest_code_l if code not in target_l
+    }
+
+    with CookieSession() as session:
+        session.rate_limiter = RateLimiter(BULK_INTERVAL)
+        with ThreadPoolExecutor(max_workers=BULK_CONCURRENCY) as executor:
+            future_l = [
+                executor.submit(Contest.fetch_record, logger, session, code) for code in target_l
+            ]
+            for contest_code, future in zip(target_l, future_l):
+                try:
+                    record = future.result()
+                except RuntimeError as e:
+                    summary[contest_code] = f'NG: {e}'
+                    continue
+                # 1件ずつ保存し、中断しても取得済みの分は残す
+                mirror.save_records([record])
+                case_cnt = sum(len(task['testcases']) for task in record['tasks'].values())
+                summary[contest_code] = f'OK: {len(record["tasks"])} 問, {case_cnt} ケース'
+
+    for contest_code in contest_code_l:
+        text = f'{contest_code}: {summary[contest_code]}'
+        if summary[contest_code].startswith('OK'):
+            logger.info(text)
+        else:
+            logger.error(text)
+
+    return 0 if all(text.startswith('OK') for text in summary.values()) else 1
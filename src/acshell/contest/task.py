@@ -1,17 +1,53 @@
+from concurrent.futures import as_completed, ThreadPoolExecutor
+import html
+import json
 from logging import Logger
+import mmap
 import os
 from pathlib import Path
 import re
+import shlex
+import shutil
 import subprocess
+import sys
 import time
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
+from tabulate import tabulate
+
+from .. import history, mirror, tracer
 from ..consts import ENCODING, LANG_TABLE
+from ..diff import format_diff, truncate_lines
+from ..cheatsheet import load_cheat_index
+from ..interactive import run_interactive
+from ..process import run_process, ProcessResult
+from ..runner import build, build_digest, get_runner, load_runners, runner_label
+from ..stable import median_ci, stable_env, stable_preexec
+from ..verdict_cache import VerdictCache
 from ..utils import (
-    get_soup, load_json, get_cheat_dir, print_bar, save_json, CookieSession, URL
+    get_soup, load_json, parse_html, print_bar, print_ndjson, save_json, user_cache_dir,
+    CookieSession, OfflineError, URL,
 )
 
 
+REG_CSRF_TOKEN = re.compile(r'name="csrf_token"\s+value="([^"]+)"')
+
+
+class CaseResult(NamedTuple):
+    """テストケース1件の実行結果
+    """
+    verdict: str  # OK / NG / RE / TLE
+    proc_t: int  # msec
+    text: str
+    cpu_t: Optional[int] = None  # msec
+    memory: Optional[int] = None  # KB
+    cached: bool = False  # 前回の判定結果を再利用した
+
+    @property
+    def ok(self) -> bool:
+        return self.verdict == 'OK'
+
+
 class Task:
     """設問
     """
@@ -19,7 +55,30 @@ class Task:
     TASK_KEY = [
         'contest', 'key', 'code', 'time_limit', 'memory_limit', 'testcases',
     ]
+    # テストケースのファイルを格納するフォルダ
+    TESTCASE_IN_DIR = 'in'
+    TESTCASE_OUT_DIR = 'out'
+    # インタラクティブ問題のジャッジ (問題フォルダに置く)
+    INTERACTOR_NAME = 'interactor.py'
+    # ジャッジのコンパイル時の引数 (これを含むコードはコンパイル処理を行う)
+    COMPILE_ARG = 'ONLINE_JUDGE'
+    COMPILE_TIMEOUT = 60
+    # コンパイル結果の保存先 (結合後のコードのハッシュと言語ごと)
+    compile_cache_dir = user_cache_dir / 'compiled'
     REG_IMPORT = re.compile(r'^(?:from ([^.]+) )?import (?:([^.]+)\.)?(?:.+\.)*([^.]+)$')
+    # 対象のインタプリタでバイトコンパイルし、構文エラーをjsonで返すスクリプト
+    PRECHECK_SCRIPT = (
+        'import json, sys\n'
+        'try:\n'
+        '    with open(sys.argv[1], "rb") as f:\n'
+        '        compile(f.read(), sys.argv[1], "exec")\n'
+        'except (SyntaxError, ValueError) as err:\n'
+        '    print(json.dumps({\n'
+        '        "type": type(err).__name__, "msg": getattr(err, "msg", str(err)),\n'
+        '        "lineno": getattr(err, "lineno", None), "text": getattr(err, "text", None),\n'
+        '    }))\n'
+        '    sys.exit(1)\n'
+    )
 
     def __init__(self, logger: Logger, json_path: Path) -> None:
         """コンストラクタ
@@ -33,10 +92,22 @@ class Task:
 
         self.json_path = json_path
         self.testcases = []
+        # 結合後のファイルの行番号 -> (元ファイル, 元の行番号)
+        self.merged_line_map: Dict[int, Tuple[Path, int]] = dict()
+        # 言語 -> 実行のコマンドと、実行するコードのハッシュ (実行の前処理で設定する)
+        self.run_cmd: Dict[str, str] = dict()
+        self.source_hash: Dict[str, str] = dict()
+        # 判定結果のキャッシュ (実行の前処理で設定する)
+        self.verdict_cache: Optional[VerdictCache] = None
         # task_infoの情報をattrに格納する
         for key, value in task_info.items():
             self.__setattr__(f'{key}', value)
 
+        if any('input' in case for case in self.testcases):
+            # 旧形式 (json内にテストケースを保持) からファイル形式に移行する
+            self.__store_testcases(self.testcases)
+            save_json(self.json_path, self.task_info)
+
     def __str__(self):
         return self.__getattribute__('code')
 
@@ -48,6 +119,7 @@ class Task:
 
         return resp
 
+    @tracer.traced('merge_code', 'merge')
     def __merge_code_file(self) -> Path:
         """フォルダ内のpyファイルをimport文に従って結合する
         """
@@ -64,21 +136,33 @@ class Task:
             codefile_table[file.stem] = file
 
         # チートシートも取得しておく
+        cheat_conflicts: Dict[str, List[str]] = dict()
         try:
-            cheat_dir = get_cheat_dir()
-            for file in cheat_dir.joinpath('cheatsheets').glob('**/*.py'):
-                codefile_table[file.stem] = file
+            cheat_index = load_cheat_index()
+            cheat_conflicts = dict(cheat_index.conflicts)
+            for name in cheat_index.modules:
+                cheat_path = cheat_index.path(name)
+                if name in codefile_table:
+                    # 問題フォルダのファイル (add-cheat でコピーして編集したものなど) を優先する
+                    local_path = codefile_table[name]
+                    if cheat_path.is_file() and local_path.read_bytes() != cheat_path.read_bytes():
+                        cheat_conflicts[name] = [str(local_path), str(cheat_path)]
+                    continue
+                codefile_table[name] = cheat_path
         except RuntimeError as e:
             self.logger.warning(str(e))
             pass
 
         # マージ対象となるモジュールをインポートしている場合は、そのモジュールのコードを追加する
         text_l = []
-        for line in code_l:
+        # text_l の各要素の由来 (元ファイル, 元の行番号)
+        origin_l: List[Optional[Tuple[Path, int]]] = []
+        for base_no, line in enumerate(code_l, start=1):
             reg_res = self.REG_IMPORT.match(line.strip())
             if reg_res is None:
                 # インポート文の条件を満たさない
                 text_l.append(line)
+                origin_l.append((base_py, base_no))
                 continue
 
             for module_name in reg_res.groups():
@@ -86,16 +170,33 @@ class Task:
                     # モジュールを読み込んでいた場合
                     if len(text_l) > 0:
                         text_l.append('\n')
+                        origin_l.append(None)
                     module_path: Path = codefile_table[module_name]
+                    if module_name in cheat_conflicts:
+                        self.logger.warning(
+                            f'同名のチートシートが複数あります: {module_name} -> '
+                            f'{", ".join(cheat_conflicts[module_name])} ({module_path} を使用します)')
                     with module_path.open(encoding=ENCODING) as mf:
-                        ext_l = [text for text in mf.readlines() if len(text.strip()) > 0]
-                        text_l.extend(ext_l)
+                        for ext_no, text in enumerate(mf.readlines(), start=1):
+                            if len(text.strip()) > 0:
+                                text_l.append(text)
+                                origin_l.append((module_path, ext_no))
 
                     text_l.append('\n')
+                    origin_l.append(None)
                     break
             else:
                 # マージ対象のモジュールでない
                 text_l.append(line)
+                origin_l.append((base_py, base_no))
+
+        # 結合後の行番号と元ファイルの対応を記録する
+        self.merged_line_map = dict()
+        line_no = 1
+        for text, origin in zip(text_l, origin_l):
+            if origin is not None and line_no not in self.merged_line_map:
+                self.merged_line_map[line_no] = origin
+            line_no += text.count('\n')
 
         # 結合したコードを保存する
         merged_py = self.json_path.parent.joinpath(self.code + '_merged.py')
@@ -104,13 +205,121 @@ class Task:
 
         return merged_py
 
+    def merge_code(self) -> Path:
+        """コードを結合し、結合後のファイルを返す (merged_line_map も更新される)
+        """
+        return self.__merge_code_file()
+
+    def precheck_code(self, lang: str, merged_path: Optional[Path] = None) -> bool:
+        """結合したコードを対象のインタプリタでバイトコンパイルし、構文エラーを確認する
+
+        コンパイル結果は保存しない (ローカルの実行はスクリプトとして実行するため .pyc を使わない)
+        """
+        if merged_path is None:
+            merged_path = self.__merge_code_file()
+
+        if lang not in LANG_TABLE:
+            self.logger.warning(f'ローカルで実行できない言語のため、構文チェックを省略します: {lang}')
+            return True
+
+        try:
+            with tracer.span('precheck', 'subprocess', lang=lang):
+                res = subprocess.run(
+                    LANG_TABLE[lang].split() + ['-c', self.PRECHECK_SCRIPT, str(merged_path)],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+        except OSError:
+            self.logger.warning(f'インタプリタが見つからないため、構文チェックを省略します: {LANG_TABLE[lang]}')
+            return True
+
+        if res.returncode == 0:
+            return True
+
+        try:
+            err = json.loads(res.stdout.decode())
+        except ValueError:
+            # インタプリタ自体の起動に失敗した場合など
+            self.logger.warning(
+                f'構文チェックに失敗しました (in {LANG_TABLE[lang]}):\n{res.stderr.decode()}')
+            return True
+
+        location = merged_path.name
+        lineno = err.get('lineno')
+        if isinstance(lineno, int):
+            location += f', line {lineno}'
+            if lineno in self.merged_line_map:
+                src_path, src_no = self.merged_line_map[lineno]
+                location = f'{src_path}, line {src_no}'
+        text = (err.get('text') or '').rstrip()
+        self.logger.error(
+            f'CE: {self.code} (in {LANG_TABLE[lang]})\n'
+            f'{err.get("type")}: {err.get("msg")}\n'
+            f'  File "{location}"' + (f'\n    {text.strip()}' if text else '')
+        )
+        return False
+
+    def compile_code(self, lang: str, merged_path: Path) -> Path:
+        """ジャッジのコンパイル処理 (`<code> ONLINE_JUDGE` の実行) を再現する
+
+        コードを Main.py としてコピーしたフォルダでコンパイル処理を行い、
+        生成された成果物 (Numba の AOT コンパイルによるモジュールなど) と合わせてキャッシュする
+        実行時はコピーした Main.py を実行するので、成果物をインポートできる
+        Returns:
+            実行するファイル (コンパイル処理が不要な場合は merged_path)
+        """
+        code = merged_path.read_bytes()
+        if self.COMPILE_ARG.encode() not in code or lang not in LANG_TABLE:
+            return merged_path
+
+        build_dir = self.compile_cache_dir / f'{history.code_hash(merged_path)}_{lang}'
+        main_path = build_dir / 'Main.py'
+        done_path = build_dir / '.compiled'
+        if done_path.is_file():
+            self.logger.info(f'コンパイル済みのコードを使用します: {build_dir}')
+            return main_path
+
+        if build_dir.exists():
+            # 中断されたコンパイルの残り
+            shutil.rmtree(str(build_dir))
+        build_dir.mkdir(parents=True)
+        main_path.write_bytes(code)
+        self.logger.info(f'コンパイル中: {self.code} (in {LANG_TABLE[lang]})')
+        sta = time.perf_counter()
+        try:
+            with tracer.span('compile', 'subprocess', lang=lang):
+                res = subprocess.run(
+                    LANG_TABLE[lang].split() + [main_path.name, self.COMPILE_ARG],
+                    cwd=str(build_dir),
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    timeout=self.COMPILE_TIMEOUT,
+                )
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f'コンパイルが {self.COMPILE_TIMEOUT} 秒以内に終了しませんでした: {self.code}')
+        proc_t = int((time.perf_counter() - sta) * 1000)
+        if res.returncode != 0:
+            # ジャッジと同様に、コンパイル処理の失敗は実行時に判明する
+            self.logger.warning(
+                f'コンパイル処理に失敗しました (in {LANG_TABLE[lang]}):\n{res.stderr.decode()}')
+            return main_path
+
+        done_path.touch()
+        self.logger.info(f'コンパイルしました: {proc_t} msec')
+        return main_path
+
     def __execute_code(
-        self, lang: str, codefile_path: Path, test_in: str, test_out: str,
-        label: Optional[str] = None,
-    ) -> Tuple[bool, str]:
+        self, lang: str, in_path: Path, out_path: Path,
+        label: Optional[str] = None, repeat: int = 0,
+    ) -> CaseResult:
+        """コードを実行し、想定出力と比較する
+
+        repeat を指定した場合は計測を安定させて repeat 回実行し、実行時間の中央値を用いる
+        """
         res_text = []
-        res_flg = False
-        if lang not in LANG_TABLE:
+        verdict = 'NG'
+        if lang not in self.run_cmd:
             raise RuntimeError(f'定義されていない言語: {lang}')
 
         if isinstance(label, str):
@@ -118,141 +327,596 @@ class Task:
         else:
             disp_label = self.code
 
-        exec_lang = LANG_TABLE[lang]
+        exec_cmd = self.run_cmd[lang]
+        popen_kw = dict()
+        if repeat > 0:
+            popen_kw = dict(preexec_fn=stable_preexec(), env=stable_env())
+        stable_text = ''
+
+        def execute() -> ProcessResult:
+            with in_path.open(mode='rb') as test_in, \
+                    tracer.span('execute', 'subprocess', case=in_path.name, lang=lang):
+                return run_process(
+                    exec_cmd, test_in, self.time_limit + 2, shell=True, **popen_kw)
+
         try:
-            sta = time.time()
-            res = subprocess.run(
-                exec_lang + ' ' + str(codefile_path),
-                shell=True,
-                input=test_in.encode(),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=self.time_limit + 2,
-            )
-            proc_t = int((time.time() - sta) * 1000)
+            sta = time.perf_counter()
+            res = execute()
+            proc_t = int((time.perf_counter() - sta) * 1000)
+            if repeat > 1 and res.returncode == 0:
+                # 2回目以降は実行時間のみ計測する
+                sample_l = [(time.perf_counter() - sta) * 1000]
+                for _ in range(repeat - 1):
+                    sta = time.perf_counter()
+                    execute()
+                    sample_l.append((time.perf_counter() - sta) * 1000)
+                median, lo, hi = median_ci(sample_l)
+                proc_t = int(median)
+                stable_text = f' (median of {repeat}, 95% CI {lo:.0f}-{hi:.0f} msec)'
         except subprocess.TimeoutExpired:
-            proc_t = int((time.time() - sta) * 1000)
+            proc_t = int((time.perf_counter() - sta) * 1000)
+            verdict = 'TLE'
             res_text.append(f'{disp_label}: TLE[{proc_t} > {self.time_limit * 1000} msec]')
         else:
             stdout = res.stdout.decode()
             stderr = res.stderr.decode()
             if len(stderr) > 0:
                 # 標準エラー
+                verdict = 'RE'
                 res_text.append(f'{disp_label}: {proc_t} msec')
                 if len(stdout) > 0:
                     # 標準出力があれば併記
                     res_text.append('[output]')
-                    res_text += stdout.split('\n')
+                    res_text += truncate_lines(stdout.split('\n'))
                 # トレースバック
                 res_text.append('[traceback]')
                 res_text += stderr.split('\n')
-            elif test_out == stdout:
+            elif _match_output(out_path, res.stdout):
                 # 想定出力と一致
-                res_text.append(f'OK: {disp_label}: {proc_t} msec')
-                res_flg = True
+                res_text.append(f'OK: {disp_label}: {proc_t} msec{stable_text}')
+                verdict = 'OK'
             else:
                 # 想定出力と異なる
-                res_text.append(f'NG: {disp_label}: {proc_t} msec')
-                # 想定出力と実際出力を表示
-                res_text.append('[predict output]')
-                res_text += test_out.split('\n')
-                res_text.append('[exact output]')
-                res_text += stdout.split('\n')
+                res_text.append(f'NG: {disp_label}: {proc_t} msec{stable_text}')
+                # 想定出力と実際出力の差分を表示
+                res_text += format_diff(out_path.read_bytes().decode(), stdout)
+
+        res_text[0] += f' (in {runner_label(lang)})'
+        if verdict == 'TLE':
+            return CaseResult(verdict, proc_t, '\n'.join(res_text))
+        return CaseResult(verdict, proc_t, '\n'.join(res_text), res.cpu_t, res.memory)
+
+    def __execute_interactive(
+        self, lang: str, interactor_path: Path, in_path: Path, label: Optional[str] = None,
+    ) -> CaseResult:
+        """インタラクタと接続してコードを実行する
+        """
+        if lang not in self.run_cmd:
+            raise RuntimeError(f'定義されていない言語: {lang}')
+
+        disp_label = f'{self.code} ({label})' if isinstance(label, str) else self.code
+        with tracer.span('execute_interactive', 'subprocess', case=in_path.name, lang=lang):
+            res = run_interactive(
+                shlex.split(self.run_cmd[lang]),
+                [sys.executable, str(interactor_path), str(in_path)],
+                self.time_limit, self.memory_limit,
+            )
 
-        res_text[0] += f' (in {LANG_TABLE[lang]})'
-        return res_flg, '\n'.join(res_text)
+        latency_l = res['latency_l']
+        res_text = [
+            f'{res["verdict"]}: {disp_label}: {res["proc_t"]} msec, {_format_kb(res["memory"])}'
+            f' (in {runner_label(lang)})',
+            f'queries: {res["query_cnt"]}, interactor: {_format_kb(res["interactor_memory"])}',
+        ]
+        if latency_l:
+            res_text[-1] += (
+                f', latency: avg {sum(latency_l) / len(latency_l) * 1000:.3f} msec'
+                f' / max {max(latency_l) * 1000:.3f} msec')
+        if res['verdict'] == 'TLE':
+            res_text[0] = f'{disp_label}: TLE[{res["proc_t"]} > {self.time_limit * 1000} msec]' \
+                f' (in {runner_label(lang)})'
+        if res['interactor_stderr']:
+            res_text.append('[interactor]')
+            res_text += res['interactor_stderr'].split('\n')
+        if res['solution_stderr']:
+            res_text.append('[traceback]')
+            res_text += res['solution_stderr'].split('\n')
+
+        return CaseResult(
+            res['verdict'], res['proc_t'], '\n'.join(res_text), res['cpu_t'], res['memory'])
+
+    def __run_case(
+        self, lang: str, in_path: Path, out_path: Path,
+        label: str, interactor_path: Optional[Path], repeat: int = 0, use_cache: bool = True,
+    ) -> CaseResult:
+        if interactor_path is not None:
+            return self.__execute_interactive(lang, interactor_path, in_path, label)
+        if repeat > 0 or self.verdict_cache is None:
+            # 実行時間を計測し直すため、キャッシュは使わない
+            return self.__execute_code(lang, in_path, out_path, label, repeat)
+
+        key = VerdictCache.key(self.source_hash[lang], runner_label(lang), in_path, out_path)
+        record = self.verdict_cache.get(key) if use_cache else None
+        if record is not None:
+            # ケースの番号が変わっていることがあるので、ラベルを付け直す
+            text_l = record['text'].replace(record['label'], label, 1).split('\n')
+            text_l[0] += ' [cached]'
+            return CaseResult(
+                record['verdict'], record['proc_t'], '\n'.join(text_l),
+                record['cpu_t'], record['memory'], cached=True)
+
+        result = self.__execute_code(lang, in_path, out_path, label)
+        self.verdict_cache.put(key, {
+            'verdict': result.verdict, 'proc_t': result.proc_t, 'text': result.text,
+            'cpu_t': result.cpu_t, 'memory': result.memory, 'label': label,
+        })
+        return result
+
+    def interactor_path(self) -> Optional[Path]:
+        """問題フォルダにインタラクタがあればそのパスを返す
+        """
+        path = self.json_path.parent / self.INTERACTOR_NAME
+        return path if path.is_file() else None
 
-    def update_testcase(self):
+    def __store_testcases(self, testcase_l: List[Dict]) -> None:
+        """テストケースを in/NN.txt, out/NN.txt に保存し、マニフェストを更新する
+        """
+        task_dir = self.json_path.parent
+        task_dir.joinpath(self.TESTCASE_IN_DIR).mkdir(exist_ok=True)
+        task_dir.joinpath(self.TESTCASE_OUT_DIR).mkdir(exist_ok=True)
+        manifest_l = []
+        for i, case in enumerate(testcase_l):
+            name = f'{i + 1:02d}'
+            in_path, out_path = self.testcase_path(name)
+            in_path.write_bytes(case['input'].encode(ENCODING))
+            out_path.write_bytes(case.get('output', '').encode(ENCODING))
+            manifest_l.append({'name': name})
+
+        self.testcases = manifest_l
+
+    def testcase_path(self, name: str) -> Tuple[Path, Path]:
+        """テストケースの入力ファイルと出力ファイルのパス
+        """
+        task_dir = self.json_path.parent
+        return (
+            task_dir / self.TESTCASE_IN_DIR / f'{name}.txt',
+            task_dir / self.TESTCASE_OUT_DIR / f'{name}.txt',
+        )
+
+    def list_testcases(self, require_output: bool = True) -> List[Tuple[str, Path, Path]]:
+        """実行対象のテストケースを (名前, 入力, 出力) の形で列挙する
+
+        マニフェストにある公式のテストケースの後に、
+        ユーザーが in/, out/ に配置したケースを名前順に追加する
+        require_output が False の場合 (インタラクティブ問題) は、出力ファイルがなくてもよい
+        """
+        case_l = []
+        for case in self.testcases:
+            in_path, out_path = self.testcase_path(case['name'])
+            if in_path.is_file() and (out_path.is_file() or not require_output):
+                case_l.append((case['name'], in_path, out_path))
+
+        known = {case['name'] for case in self.testcases}
+        in_dir = self.json_path.parent / self.TESTCASE_IN_DIR
+        for in_path in sorted(in_dir.glob('*.txt')):
+            if in_path.stem in known:
+                continue
+            _, out_path = self.testcase_path(in_path.stem)
+            if out_path.is_file() or not require_output:
+                case_l.append((in_path.stem, in_path, out_path))
+
+        return case_l
+
+    def update_testcase(self, session: Optional[CookieSession] = None, mirror_only: bool = False):
         """テストケースの取得更新
+
+        ローカルミラーに問題があれば、通信せずにミラーから取得する
+        session が指定された場合はそのセッションを使う
+        mirror_only が True の場合は通信しない (ミラーのテストケースが空でもそのまま使う)
         """
-        with CookieSession() as session:
-            try:
-                soup = get_soup(session, URL.task(self.contest, self.code))
-            except RuntimeError:
-                raise RuntimeError(f'テストケースの取得に失敗しました: {self.contest} - {self.code}')
-
-        testcase_l: List[Dict] = []
-        for part in soup.select_one('#task-statement').select('.part'):
-            part_title = part.select_one('h3').text[:3]
-            if part_title == '入力例':
-                testcase_l.append(dict())
-                testcase_l[-1]['input'] = part.select_one('pre').text.replace('\r', '')
-            elif part_title == '出力例':
-                testcase_l[-1]['output'] = part.select_one('pre').text.replace('\r', '')
+        record = mirror.task_record(self.code)
+        if record is not None and (record['testcases'] or mirror_only):
+            self.__store_testcases(record['testcases'])
+            save_json(self.json_path, self.task_info)
+            self.logger.info(f'問題のテストケースをミラーから取得しました: {self.code}')
+            return
+        if mirror_only:
+            return
+
+        if session is None:
+            with CookieSession() as session:
+                return self.update_testcase(session)
 
+        testcase_l = fetch_testcases(session, self.contest, self.code)
         if len(testcase_l):
-            self.testcases = testcase_l
+            self.__store_testcases(testcase_l)
             save_json(self.json_path, self.task_info)
             self.logger.info(f'問題のテストケースを更新しました: {self.code}')
 
-    def run_testcase(self, lang: str, target: str = None) -> None:
-        """テストケースの実行
+    def __prepare_run(self, lang_l: List[str]) -> bool:
+        """テストケース実行の前処理 (コードの結合・構文チェック・コンパイル処理)
+
+        Python のコードは結合してから実行し、それ以外のランナーはソースをビルドして実行する
         """
+        runner_l = [get_runner(lang) for lang in lang_l]
         if not self.testcases:
-            self.update_testcase()
+            try:
+                self.update_testcase()
+            except OfflineError:
+                if not self.list_testcases(require_output=False):
+                    raise
+                # 手元にあるテストケースのみで実行する
+                self.logger.warning('オフラインのため、公式のテストケースを取得せずに実行します')
+
+        codefile_path = None
+        self.run_cmd, self.source_hash = dict(), dict()
+        for runner in runner_l:
+            src_path = runner.source_path(self.json_path.parent, self.code)
+            if src_path.suffix == '.py':
+                # Python のコードは結合したものを使う
+                if codefile_path is None:
+                    codefile_path = self.__merge_code_file()
+                src_path = codefile_path
+            elif not src_path.is_file():
+                self.logger.error(f'ソースファイルがありません: {src_path}')
+                return False
+
+            if runner.interpreter is not None:
+                if not self.precheck_code(runner.name, src_path):
+                    return False
+                self.run_cmd[runner.name] = runner.command(
+                    self.compile_code(runner.name, src_path))
+                self.source_hash[runner.name] = history.code_hash(src_path)
+                continue
+            try:
+                self.run_cmd[runner.name] = build(self.logger, runner, src_path)
+            except RuntimeError as e:
+                self.logger.error(str(e))
+                return False
+            self.source_hash[runner.name] = build_digest(runner, src_path)[:12]
 
-        if target is None:
-            target = list(range(len(self.testcases)))
-        else:
+        self.verdict_cache = VerdictCache(self.contest, self.code)
+        os.chdir(str(self.json_path.parent))
+        return True
+
+    def __record_history(
+        self, lang: str, result_l: List[Tuple[str, CaseResult]],
+    ) -> None:
+        """実行結果を履歴に記録し、過去の最良の結果より遅くなったケースを警告する
+
+        キャッシュした判定結果は実行していないので記録しない
+        """
+        hash_ = self.source_hash[lang]
+        history.record_runs(self.contest, self.code, [
+            {
+                'hash': hash_, 'lang': lang, 'case': name, 'verdict': result.verdict,
+                'proc_t': result.proc_t, 'cpu_t': result.cpu_t, 'memory': result.memory,
+            }
+            for name, result in result_l if not result.cached
+        ])
+        slow_l = history.find_slowdowns(history.load_history(self.contest, self.code), hash_, lang)
+        if slow_l:
+            self.logger.warning(
+                f'過去の最良の結果より {history.DEFAULT_THRESHOLD}% 以上遅いケースがあります'
+                f' (in {runner_label(lang)}):\n' + history.format_slowdowns(slow_l))
+
+    def __case_label(self, index: int, name: str) -> str:
+        if any(case['name'] == name for case in self.testcases):
+            return f'Case {index + 1}'
+        return f'Case {index + 1}: {name}'
+
+    def __case_record(self, lang: str, index: int, name: str, result: CaseResult) -> Dict:
+        """ndjson 形式で出力する1ケースの結果
+        """
+        return {
+            'type': 'case', 'task': self.key, 'lang': lang, 'case': name, 'index': index + 1,
+            'verdict': result.verdict, 'time': result.proc_t, 'cpu_time': result.cpu_t,
+            'memory': result.memory, 'cached': result.cached, 'text': result.text,
+        }
+
+    def run_testcase(
+        self, lang: str, target: str = None, interactor_path: Optional[Path] = None,
+        repeat: int = 0, use_cache: bool = True, fmt: str = 'text',
+    ) -> bool:
+        """テストケースの実行
+
+        インタラクタが指定されるか問題フォルダにある場合は、インタラクティブ問題として実行する
+        repeat を指定した場合は、各ケースを repeat 回実行して実行時間の中央値を表示する
+        コードと入出力が前回と同じケースは、use_cache が False でなければ前回の判定結果を使う
+        fmt が ndjson の場合は、各ケースの結果を終わり次第1行のjsonで出力する
+        すべてのケースが OK であれば True を返す
+        """
+        if target is not None:
             try:
-                target = [int(target)]
+                target = int(target)
             except ValueError:
                 self.logger.error('テストケースの番号は整数で指定してください')
-                return
+                return False
 
-        codefile_path = self.__merge_code_file()
-        os.chdir(str(self.json_path.parent))
+        if not self.__prepare_run([lang]):
+            return False
+
+        if interactor_path is None:
+            interactor_path = self.interactor_path()
+        if interactor_path is not None and repeat > 0:
+            self.logger.warning('インタラクティブ問題では --stable は無視されます')
+        case_l = self.list_testcases(require_output=interactor_path is None)
 
         counter = {True: 0, False: 0}
-        for i, case in enumerate(self.testcases):
-            if i not in target:
+        result_l: List[Tuple[str, CaseResult]] = []
+        for i, (name, in_path, out_path) in enumerate(case_l):
+            if target is not None and i != target:
+                continue
+            result = self.__run_case(
+                lang, in_path, out_path, self.__case_label(i, name),
+                interactor_path, repeat, use_cache)
+            counter[result.ok] += 1
+            result_l.append((name, result))
+            if fmt == 'ndjson':
+                print_ndjson(self.__case_record(lang, i, name, result))
                 continue
-            res_flg, res_text = \
-                self.__execute_code(
-                    lang, codefile_path, case['input'], case['output'], f'Case {i + 1}')
-            counter[res_flg] += 1
-            if res_flg:
-                self.logger.info(res_text)
+            if result.ok:
+                self.logger.info(result.text)
             else:
-                self.logger.error(res_text)
+                self.logger.error(result.text)
 
             print_bar()
 
-        self.logger.info(f'テストの実行結果:\n{counter[True]} OK, {counter[False]} NG')
-
-    def submit_code(self, lang: str) -> None:
-        """提出
+        self.verdict_cache.save()
+        self.__record_history(lang, result_l)
+        summary = f'{counter[True]} OK, {counter[False]} NG'
+        cached_cnt = sum(result.cached for _, result in result_l)
+        if fmt == 'ndjson':
+            print_ndjson({
+                'type': 'summary', 'task': self.key, 'lang': lang,
+                'ok': counter[True], 'ng': counter[False], 'cached': cached_cnt,
+            })
+            return counter[False] == 0
+        if cached_cnt:
+            summary += f' (キャッシュ: {cached_cnt} 件, --no-cache で再実行します)'
+        self.logger.info(f'テストの実行結果:\n{summary}')
+        return counter[False] == 0
+
+    def run_testcase_matrix(
+        self, lang_l: List[str], interactor_path: Optional[Path] = None, repeat: int = 0,
+        use_cache: bool = True, fmt: str = 'text',
+    ) -> bool:
+        """すべてのテストケースを複数の言語で並列に実行し、表にまとめる
+
+        repeat を指定した場合は、計測が干渉しないように1件ずつ順に実行する
+        fmt が ndjson の場合は、表の代わりに各ケースの結果を終わった順に1行のjsonで出力する
+        すべてのケースが OK になった言語があれば True を返す
         """
+        if not self.__prepare_run(lang_l):
+            return False
+
+        if interactor_path is None:
+            interactor_path = self.interactor_path()
+        if interactor_path is not None and repeat > 0:
+            self.logger.warning('インタラクティブ問題では --stable は無視されます')
+        case_l = self.list_testcases(require_output=interactor_path is None)
+        with ThreadPoolExecutor(max_workers=1 if repeat > 0 else os.cpu_count()) as executor:
+            future_d = {
+                (i, lang): executor.submit(
+                    self.__run_case, lang, in_path, out_path,
+                    self.__case_label(i, name), interactor_path, repeat, use_cache)
+                for i, (name, in_path, out_path) in enumerate(case_l)
+                for lang in lang_l
+            }
+            key_d = {future: key for key, future in future_d.items()}
+            result_d: Dict[Tuple[int, str], CaseResult] = dict()
+            for future in as_completed(key_d):
+                i, lang = key_d[future]
+                result_d[(i, lang)] = future.result()
+                if fmt == 'ndjson':
+                    print_ndjson(self.__case_record(lang, i, case_l[i][0], result_d[(i, lang)]))
+        self.verdict_cache.save()
+
+        # 失敗したケースの詳細
+        for (i, lang), result in sorted(result_d.items()):
+            if not result.ok and fmt == 'text':
+                self.logger.error(result.text)
+                print_bar()
+
+        # 言語ごとの合計時間 (すべて OK の言語のみ)
+        total_d = {
+            lang: sum(result_d[(i, lang)].proc_t for i in range(len(case_l)))
+            for lang in lang_l
+            if all(result_d[(i, lang)].ok for i in range(len(case_l)))
+        }
+        fastest = min(total_d, key=total_d.get) if total_d else None
+
+        if fmt == 'text':
+            self.__print_matrix(case_l, lang_l, result_d, total_d)
+
+        for lang in dict.fromkeys(lang_l):
+            self.__record_history(
+                lang, [(name, result_d[(i, lang)]) for i, (name, _, _) in enumerate(case_l)])
+
+        if fmt == 'ndjson':
+            for lang in dict.fromkeys(lang_l):
+                lang_result_l = [result_d[(i, lang)] for i in range(len(case_l))]
+                print_ndjson({
+                    'type': 'summary', 'task': self.key, 'lang': lang,
+                    'ok': sum(result.ok for result in lang_result_l),
+                    'ng': sum(not result.ok for result in lang_result_l),
+                    'cached': sum(result.cached for result in lang_result_l),
+                    'total_time': total_d.get(lang), 'fastest': lang == fastest,
+                })
+            return fastest is not None
+
+        if fastest is None:
+            self.logger.error('すべてのケースが OK になった言語はありません')
+            return False
+        self.logger.info(f'最速の言語: {fastest} ({runner_label(fastest)}, 合計 {total_d[fastest]} ms)')
+        return True
+
+    def __print_matrix(
+        self, case_l: List[Tuple[str, Path, Path]], lang_l: List[str],
+        result_d: Dict[Tuple[int, str], CaseResult], total_d: Dict[str, int],
+    ) -> None:
+        """ケースごと・言語ごとの結果を表にして出力する (各ケースの最速の言語を強調する)
+        """
+        def cell(result: CaseResult, highlight: bool) -> str:
+            text = f'{result.verdict} {result.proc_t} ms'
+            if result.cached:
+                text += ' (cached)'
+            if highlight:
+                return f'\033[32m{text}\033[0m'
+            elif not result.ok:
+                return f'\033[33m{text}\033[0m'
+            return text
+
+        out_l = []
+        for i, (name, _, _) in enumerate(case_l):
+            row_d = {lang: result_d[(i, lang)] for lang in lang_l}
+            ok_l = [lang for lang in lang_l if row_d[lang].ok]
+            row_fastest = min(ok_l, key=lambda lang: row_d[lang].proc_t) if ok_l else None
+            out_l.append(
+                [self.__case_label(i, name)] +
+                [cell(row_d[lang], lang == row_fastest) for lang in lang_l])
+        out_l.append(
+            ['合計'] + [f'{total_d[lang]} ms' if lang in total_d else '-' for lang in lang_l])
+        print(tabulate(out_l, ['ケース'] + [runner_label(lang) for lang in lang_l], 'github'))
+
+    def prepare_submission(
+        self, precheck_lang: Optional[str] = None, lang: Optional[str] = None,
+    ) -> str:
+        """提出するコードを用意する
+
+        precheck_lang が指定された場合、そのインタプリタで構文チェックを行う
+        lang が Python 以外のソースを使うランナーの場合は、そのソースをそのまま提出する
+        """
+        runner = load_runners().get(lang) if lang is not None else None
+        if runner is not None:
+            src_path = runner.source_path(self.json_path.parent, self.code)
+            if src_path.suffix != '.py':
+                if not src_path.is_file():
+                    raise RuntimeError(f'ソースファイルがありません: {src_path}')
+                return src_path.read_text(encoding=ENCODING)
+
         # 実行ファイルを1つにまとめる
         merged_path = self.__merge_code_file()
+        if precheck_lang is not None and not self.precheck_code(precheck_lang, merged_path):
+            raise RuntimeError(f'構文エラーのため提出を中止しました: {self.key}')
 
         with merged_path.open(encoding=ENCODING) as f:
             code_text = f.read()
 
-        with CookieSession() as session:
-            try:
-                soup = get_soup(session, URL.submit(self.contest, self.code))
-            except RuntimeError:
-                raise RuntimeError(f'ページの取得に失敗しました: {self.contest}')
-
-            # post に必要なデータを整理する
-            lang_sel = soup.select_one(f'#select-lang-{self.code}').select_one('select')
-            lang_soup = lang_sel.select('option')
-            lang_dict = {x.text: x['value'] for x in lang_soup if len(x.text)}
-            data = {
-                'data.TaskScreenName': self.code,
-                'data.LanguageId': lang_dict[lang],
-                'sourceCode': code_text,
-                'csrf_token': soup.find('input', attrs={'name': 'csrf_token'})['value'],
-            }
-            res = session.post(URL.submit(self.contest, self.code), data=data)
+        return code_text
 
-        if res.status_code == 200:
-            # 成功
-            self.logger.info(f'コードを提出しました: {self.key} (lang: {lang})')
-        else:
-            # 失敗
+    def post_submission(
+        self, session: CookieSession, form: Dict, lang: str, code_text: str,
+    ) -> None:
+        """取得済みのフォーム情報 (fetch_submit_form) を使って提出する
+        """
+        if lang not in form['languages']:
+            raise RuntimeError(f'提出できない言語です: {lang}')
+        data = {
+            'data.TaskScreenName': self.code,
+            'data.LanguageId': form['languages'][lang],
+            'sourceCode': code_text,
+            'csrf_token': form['csrf_token'],
+        }
+        res = session.post(URL.submit(self.contest, self.code), data=data)
+        if res.status_code != 200:
             raise RuntimeError(
                 f'コードの提出に失敗しました: {self.key} (lang: {lang})\n'
                 f'Response Code: {res.status_code}'
             )
+
+    def submit_code(
+        self, lang: str, precheck_lang: Optional[str] = None, source_lang: Optional[str] = None,
+    ) -> None:
+        """提出
+
+        precheck_lang が指定された場合、提出前にそのインタプリタで構文チェックを行う
+        source_lang が指定された場合、そのランナーのソースを提出する (prepare_submission)
+        """
+        code_text = self.prepare_submission(precheck_lang, source_lang)
+        with CookieSession() as session:
+            form = fetch_submit_form(session, self.contest, self.code, lang)
+            self.post_submission(session, form, lang, code_text)
+
+        self.logger.info(f'コードを提出しました: {self.key} (lang: {lang})')
+
+
+def fetch_testcases(session: CookieSession, contest: str, task_code: str) -> List[Dict]:
+    """問題文から入力例と出力例を取得する
+    """
+    try:
+        soup = get_soup(session, URL.task(contest, task_code))
+    except RuntimeError:
+        raise RuntimeError(f'テストケースの取得に失敗しました: {contest} - {task_code}')
+
+    testcase_l: List[Dict] = []
+    for part in soup.select_one('#task-statement').select('.part'):
+        part_title = part.select_one('h3').text[:3]
+        if part_title == '入力例':
+            testcase_l.append(dict())
+            testcase_l[-1]['input'] = part.select_one('pre').text.replace('\r', '')
+        elif part_title == '出力例':
+            testcase_l[-1]['output'] = part.select_one('pre').text.replace('\r', '')
+
+    return testcase_l
+
+
+def fetch_submit_form(
+    session: CookieSession, contest: str, task_code: Optional[str] = None,
+    lang: Optional[str] = None,
+) -> Dict:
+    """提出ページから csrf_token と言語IDの対応を取得する
+
+    言語IDの対応はコンテストごとにキャッシュし、キャッシュに lang があればページの解析を省略する
+    """
+    cache_path = user_cache_dir / 'languages' / f'{contest}.json'
+    res = session.get(URL.submit(contest, task_code))
+    if res.status_code != 200:
+        raise RuntimeError(f'ページの取得に失敗しました: {contest}')
+
+    if cache_path.is_file():
+        lang_dict = load_json(cache_path)
+        reg_res = REG_CSRF_TOKEN.search(res.text)
+        if reg_res is not None and (lang is None or lang in lang_dict):
+            return {
+                'csrf_token': html.unescape(reg_res.group(1)),
+                'languages': lang_dict,
+            }
+
+    soup = parse_html(res.text)
+    lang_sel = None
+    if task_code is not None:
+        lang_div = soup.select_one(f'#select-lang-{task_code}')
+        lang_sel = lang_div.select_one('select') if lang_div is not None else None
+    if lang_sel is None:
+        lang_sel = soup.select_one('select[name="data.LanguageId"]')
+    if lang_sel is None:
+        raise RuntimeError(f'提出フォームが見つかりません: {contest}')
+
+    lang_dict = {x.text: x['value'] for x in lang_sel.select('option') if len(x.text)}
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    save_json(cache_path, lang_dict)
+    return {
+        'csrf_token': soup.find('input', attrs={'name': 'csrf_token'})['value'],
+        'languages': lang_dict,
+    }
+
+
+def _match_output(out_path: Path, stdout: bytes) -> bool:
+    """想定出力のファイルをメモリマップして実際の出力と比較する
+    """
+    with out_path.open(mode='rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size != len(stdout):
+            return False
+        if size == 0:
+            return True
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as expected:
+                return expected == stdout
+
+
+def _format_kb(memory: Optional[int]) -> str:
+    """最大メモリの表示 (取得できない・区別できない場合は -)
+    """
+    return '- KB' if memory is None else f'{memory} KB'
@@ -0,0 +1,104 @@
+"""想定出力と実際の出力の差分表示
+
+行番号ごとに対応づけて比較する (LCS は使わず、出力の長さに対して線形時間で処理する)
+長い行はトークン単位で比較し、異なる部分の周辺だけを表示する
+"""
+import re
+from typing import List, Sequence
+
+
+MAX_DIFF_LINES = 40
+MAX_LINE_WIDTH = 160
+CONTEXT_LINES = 1
+CONTEXT_TOKENS = 4
+REG_TOKEN = re.compile(r'(\s+)')
+
+
+def _color(text: str) -> str:
+    return f'\033[33m{text}\033[0m'
+
+
+def _format_pair(expected: str, actual: str) -> List[str]:
+    """異なる1行について、異なるトークンを強調して表示する
+    """
+    exp_tok = REG_TOKEN.split(expected)
+    act_tok = REG_TOKEN.split(actual)
+    # 区切り文字を除いたトークンの位置で比較する
+    diff_idx = [
+        i for i in range(0, max(len(exp_tok), len(act_tok)), 2)
+        if i >= len(exp_tok) or i >= len(act_tok) or exp_tok[i] != act_tok[i]
+    ]
+    res_l = []
+    for mark, tok_l in (('-', exp_tok), ('+', act_tok)):
+        diff_set = set(i for i in diff_idx if i < len(tok_l))
+        lo, hi = 0, len(tok_l)
+        if len(expected) > MAX_LINE_WIDTH or len(actual) > MAX_LINE_WIDTH:
+            # 最初の差分の周辺のみ表示する
+            first = diff_idx[0] if diff_idx else 0
+            lo = max(first - CONTEXT_TOKENS * 2, 0)
+            hi = min(first + CONTEXT_TOKENS * 2 + 1, len(tok_l))
+        text = ''.join(
+            _color(tok) if i in diff_set else tok for i, tok in enumerate(tok_l[lo:hi], start=lo))
+        if lo > 0:
+            text = '... ' + text
+        if hi < len(tok_l):
+            text += f' ... ({len(tok_l[hi:]) // 2 + 1} tokens)'
+        res_l.append(f'{mark} {text}')
+    return res_l
+
+
+def truncate_lines(line_l: Sequence[str], max_lines: int = MAX_DIFF_LINES) -> List[str]:
+    """行数・行の長さを制限する
+    """
+    res_l = [
+        line if len(line) <= MAX_LINE_WIDTH else line[:MAX_LINE_WIDTH] + ' ...'
+        for line in line_l[:max_lines]
+    ]
+    if len(line_l) > max_lines:
+        res_l.append(f'... ({len(line_l) - max_lines} lines)')
+    return res_l
+
+
+def format_diff(expected: str, actual: str, max_lines: int = MAX_DIFF_LINES) -> List[str]:
+    """想定出力 (-) と実際の出力 (+) の差分を表示用の行に変換する
+    """
+    exp_l = expected.split('\n')
+    act_l = actual.split('\n')
+    line_cnt = max(len(exp_l), len(act_l))
+    res_l = [f'[diff] - predict ({len(exp_l)} lines) / + exact ({len(act_l)} lines)']
+    diff_cnt = 0
+    shown_until = -1
+    for i in range(line_cnt):
+        exp = exp_l[i] if i < len(exp_l) else None
+        act = act_l[i] if i < len(act_l) else None
+        if exp == act:
+            continue
+        diff_cnt += 1
+        if len(res_l) >= max_lines:
+            # 件数のみ数える
+            continue
+
+        # 前後の一致した行も表示する
+        if i - CONTEXT_LINES > shown_until + 1:
+            res_l.append(f'@@ line {i + 1 - CONTEXT_LINES} @@')
+        for j in range(max(i - CONTEXT_LINES, shown_until + 1), i):
+            res_l.append(f'  {exp_l[j]}'[:MAX_LINE_WIDTH])
+        if exp is None:
+            res_l.append(_color(f'+ {act}'[:MAX_LINE_WIDTH]))
+        elif act is None:
+            res_l.append(_color(f'- {exp}'[:MAX_LINE_WIDTH]))
+        else:
+            res_l += _format_pair(exp, act)
+        shown_until = i
+        # 後ろの一致した行
+        for j in range(i + 1, min(i + 1 + CONTEXT_LINES, line_cnt)):
+            if j < len(exp_l) and j < len(act_l) and exp_l[j] == act_l[j]:
+                res_l.append(f'  {exp_l[j]}'[:MAX_LINE_WIDTH])
+                shown_until = j
+            else:
+                break
+
+    if len(res_l) >= max_lines:
+        res_l = res_l[:max_lines]
+        res_l.append(f'... ({diff_cnt} lines differ in total)')
+    return res_l
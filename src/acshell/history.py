@@ -0,0 +1,168 @@
+"""テストケースの実行履歴
+
+問題ごとに user_data_dir/history/<contest>/<task>.jsonl へ実行結果を追記し、
+コードの変更による性能低下を検出する
+"""
+from datetime import datetime
+import hashlib
+import json
+from logging import Logger
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+from tabulate import tabulate
+
+from .consts import ENCODING
+from .runner import runner_label
+from .utils import (
+    file_lock, load_json, pop_regression_options, search_task_json, user_data_dir,
+    DEFAULT_THRESHOLD,
+)
+
+
+history_dir = user_data_dir / 'history'
+# これより小さい差 (msec) は計測誤差とみなす
+MIN_DIFF_MSEC = 10
+
+
+def history_path(contest: str, task_code: str) -> Path:
+    return history_dir / contest / f'{task_code}.jsonl'
+
+
+def code_hash(codefile_path: Path) -> str:
+    """結合後のコードのハッシュ (先頭12桁)
+    """
+    return hashlib.sha256(codefile_path.read_bytes()).hexdigest()[:12]
+
+
+def record_runs(contest: str, task_code: str, record_l: List[Dict]) -> None:
+    """実行結果を履歴に追記する
+    """
+    if not record_l:
+        return
+    path = history_path(contest, task_code)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    now = datetime.now().isoformat(timespec='seconds')
+    with file_lock(path):
+        with path.open(mode='a', encoding=ENCODING) as f:
+            f.writelines(json.dumps({'time': now, **record}) + '\n' for record in record_l)
+
+
+def load_history(contest: str, task_code: str) -> List[Dict]:
+    path = history_path(contest, task_code)
+    record_l: List[Dict] = []
+    if not path.is_file():
+        return record_l
+    with path.open(encoding=ENCODING) as f:
+        for line in f:
+            try:
+                record_l.append(json.loads(line))
+            except ValueError:
+                continue
+
+    return record_l
+
+
+def _run_time(record: Dict) -> int:
+    """比較に用いる時間 (CPU 時間が取得できなければ実行時間)
+    """
+    return record['cpu_t'] if record.get('cpu_t') is not None else record['proc_t']
+
+
+def find_slowdowns(
+    record_l: List[Dict], hash_: str, lang: str, threshold: float = DEFAULT_THRESHOLD,
+) -> List[Tuple[str, int, Dict, float]]:
+    """指定のコードの最新の実行結果を、過去の最良の結果と比較する
+
+    Returns:
+        threshold% 以上遅くなったケースの (ケース, 時間, 最良の記録, 割合) のリスト
+    """
+    latest_d: Dict[str, Dict] = dict()
+    best_d: Dict[str, Dict] = dict()
+    for record in record_l:
+        if record['lang'] != lang or record['verdict'] != 'OK':
+            continue
+        case = record['case']
+        if record['hash'] == hash_:
+            latest_d[case] = record
+        if case not in best_d or _run_time(record) < _run_time(best_d[case]):
+            best_d[case] = record
+
+    slow_l = []
+    for case, record in latest_d.items():
+        best = best_d[case]
+        run_t, best_t = _run_time(record), _run_time(best)
+        if best_t <= 0 or run_t - best_t < MIN_DIFF_MSEC:
+            continue
+        ratio = (run_t / best_t - 1) * 100
+        if ratio > threshold:
+            slow_l.append((case, run_t, best, ratio))
+
+    return slow_l
+
+
+def format_slowdowns(slow_l: List[Tuple[str, int, Dict, float]]) -> str:
+    return '\n'.join(
+        f'{case}: {run_t} msec (最良 {_run_time(best)} msec @ {best["hash"]}, {ratio:+.1f}%)'
+        for case, run_t, best, ratio in slow_l
+    )
+
+
+def history(logger: Logger, argv: Sequence[str]) -> int:
+    """問題の実行履歴をコードの版ごとに表示し、最新の版の性能低下を検出する
+
+    --lang=<lang>: 表示する言語 (カンマ区切り, 既定はすべて)
+    --threshold=<percent>: 性能低下とみなす割合 (既定は10%)
+    """
+    argv, lang_l, threshold = pop_regression_options(argv)
+    args = [arg for arg in argv if not arg.startswith('--')]
+    if not args:
+        raise RuntimeError('オプションが不足しています')
+
+    task_info = load_json(search_task_json(args[0]))
+    record_l = load_history(task_info['contest'], task_info['code'])
+    if lang_l is not None:
+        record_l = [record for record in record_l if record['lang'] in lang_l]
+    if not record_l:
+        logger.info(f'実行履歴がありません: {task_info["code"]}')
+        return 0
+
+    # コードの版・言語ごとに、各ケースの最新の結果をまとめる
+    version_d: Dict[Tuple[str, str], Dict] = dict()
+    for record in record_l:
+        key = (record['hash'], record['lang'])
+        if key not in version_d:
+            version_d[key] = {'first': record['time'], 'runs': 0, 'case': dict()}
+        version = version_d[key]
+        version['last'] = record['time']
+        version['runs'] += 1
+        version['case'][record['case']] = record
+
+    out_l = []
+    for (hash_, lang), version in version_d.items():
+        case_l = list(version['case'].values())
+        ok_cnt = sum(record['verdict'] == 'OK' for record in case_l)
+        memory_l = [record['memory'] for record in case_l if record.get('memory') is not None]
+        out_l.append([
+            hash_, version['first'], version['last'], runner_label(lang), version['runs'],
+            f'{ok_cnt} / {len(case_l)}',
+            sum(_run_time(record) for record in case_l),
+            max(memory_l) if memory_l else '-',
+        ])
+    print(tabulate(
+        out_l,
+        ['コード', '初回', '最終', '言語', '実行回数', 'OK', 'CPU時間合計 (ms)', '最大メモリ (KB)'],
+        'github'))
+
+    # 最後に実行したコードを、過去の最良の結果と比較する
+    latest_hash = record_l[-1]['hash']
+    regression = False
+    for lang in dict.fromkeys(record['lang'] for record in record_l):
+        slow_l = find_slowdowns(record_l, latest_hash, lang, threshold)
+        if slow_l:
+            regression = True
+            logger.warning(
+                f'{threshold}% 以上の性能低下 ({latest_hash}, in {runner_label(lang)}):\n' +
+                format_slowdowns(slow_l))
+
+    return 1 if regression else 0
@@ -0,0 +1,188 @@
+"""インタラクティブ問題の実行
+
+解答プログラムとジャッジ (インタラクタ) をパイプで接続し、やり取りを中継する
+インタラクタはテストケースの入力ファイルのパスを引数に受け取り、
+解答が正しければ終了コード 0 で終了する
+"""
+import os
+import threading
+import time
+import subprocess
+from typing import Dict, List, Optional, Sequence
+
+from .process import child_maxrss_kb, cpu_msec, exit_code, spawner_maxrss_kb
+
+
+class _Relay:
+    """2つのプロセス間のやり取りを中継し、クエリ数と応答時間を記録する
+    """
+
+    def __init__(self) -> None:
+        self.query_cnt = 0
+        self.latency_l: List[float] = []
+        self._reply_t: Optional[float] = None
+
+    def _pump(self, src: int, dst: int, from_solution: bool) -> None:
+        try:
+            while True:
+                data = os.read(src, 1 << 16)
+                if not data:
+                    break
+                now = time.perf_counter()
+                if from_solution:
+                    self.query_cnt += data.count(b'\n')
+                    if self._reply_t is not None:
+                        self.latency_l.append(now - self._reply_t)
+                        self._reply_t = None
+                view = memoryview(data)
+                while view:
+                    written = os.write(dst, view)
+                    view = view[written:]
+                if not from_solution:
+                    self._reply_t = time.perf_counter()
+        except OSError:
+            # 相手のプロセスが終了した
+            pass
+        finally:
+            for fd in (src, dst):
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+    def start(self, sol_out: int, sol_in: int, inter_out: int, inter_in: int) -> List[threading.Thread]:
+        """中継を開始する (渡した fd は中継スレッドが閉じる)
+        """
+        thread_l = [
+            threading.Thread(target=self._pump, args=(sol_out, inter_in, True), daemon=True),
+            threading.Thread(target=self._pump, args=(inter_out, sol_in, False), daemon=True),
+        ]
+        for thread in thread_l:
+            thread.start()
+        return thread_l
+
+
+def run_interactive(
+    solution_cmd: Sequence[str], interactor_cmd: Sequence[str],
+    time_limit: float, memory_limit: int,
+) -> Dict:
+    """解答とインタラクタを接続して実行する
+
+    Returns:
+        verdict (OK / NG / RE / TLE / MLE), 実行時間 (msec), CPU 時間 (msec), 最大メモリ (KB),
+        インタラクタの最大メモリ (KB), クエリ数, 応答時間, インタラクタ・解答の標準エラー
+        最大メモリは解答・インタラクタを起動した側の最大メモリ以下の場合は区別できず None
+    """
+    if not hasattr(os, 'wait4'):
+        raise RuntimeError('インタラクティブ問題の実行はこの環境に対応していません')
+
+    # 解答・インタラクタそれぞれの標準入出力のパイプ
+    sol_in_r, sol_in_w = os.pipe()
+    sol_out_r, sol_out_w = os.pipe()
+    inter_in_r, inter_in_w = os.pipe()
+    inter_out_r, inter_out_w = os.pipe()
+    # メモリは制限せず、wait4 で取得した解答の最大メモリで MLE を判定する
+    # (RLIMIT_AS では確保の失敗が RE になってしまう)
+    # インタラクタはジャッジ側のプログラムなので判定には使わず、最大メモリを報告するだけにする
+    popen_kw = dict(stderr=subprocess.PIPE)
+    sta = time.perf_counter()
+    try:
+        solution = subprocess.Popen(
+            list(solution_cmd), stdin=sol_in_r, stdout=sol_out_w, **popen_kw)
+        try:
+            interactor = subprocess.Popen(
+                list(interactor_cmd), stdin=inter_in_r, stdout=inter_out_w, **popen_kw)
+        except OSError:
+            solution.kill()
+            solution.wait()
+            raise
+        spawner_kb = spawner_maxrss_kb()
+    except OSError:
+        for fd in (sol_in_w, sol_out_r, inter_in_w, inter_out_r):
+            os.close(fd)
+        raise
+    finally:
+        # 子プロセス側の端は親では使わない
+        for fd in (sol_in_r, sol_out_w, inter_in_r, inter_out_w):
+            os.close(fd)
+
+    relay = _Relay()
+    relay_l = relay.start(sol_out_r, sol_in_w, inter_out_r, inter_in_w)
+
+    # 各プロセスの終了を待ち、リソース使用量を取得する
+    status_d: Dict[str, Dict] = dict()
+
+    def wait(name: str, proc: subprocess.Popen) -> None:
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = exit_code(status)
+        status_d[name] = {
+            'code': proc.returncode,
+            'time': time.perf_counter() - sta,
+            'cpu_t': cpu_msec(rusage),
+            'memory': child_maxrss_kb(rusage, spawner_kb),
+        }
+
+    wait_l = [
+        threading.Thread(target=wait, args=('solution', solution), daemon=True),
+        threading.Thread(target=wait, args=('interactor', interactor), daemon=True),
+    ]
+    for thread in wait_l:
+        thread.start()
+
+    # stderr は別スレッドで読み切る (パイプが詰まらないようにする)
+    stderr_d: Dict[str, bytes] = dict()
+
+    def read_stderr(name: str, proc: subprocess.Popen) -> None:
+        stderr_d[name] = proc.stderr.read()
+
+    err_l = [
+        threading.Thread(target=read_stderr, args=('solution', solution), daemon=True),
+        threading.Thread(target=read_stderr, args=('interactor', interactor), daemon=True),
+    ]
+    for thread in err_l:
+        thread.start()
+
+    timeout = time_limit + 2
+    timed_out = False
+    for thread in wait_l:
+        thread.join(max(timeout - (time.perf_counter() - sta), 0))
+        if thread.is_alive():
+            timed_out = True
+            for proc in (solution, interactor):
+                try:
+                    proc.kill()
+                except OSError:
+                    pass
+            thread.join()
+    for thread in wait_l + err_l + relay_l:
+        thread.join(1)
+
+    for proc in (solution, interactor):
+        proc.stderr.close()
+
+    killed = {'code': -9, 'time': timeout, 'cpu_t': None, 'memory': None}
+    sol = status_d.get('solution', killed)
+    inter = status_d.get('interactor', killed)
+    proc_t = int(sol['time'] * 1000)
+    if timed_out:
+        verdict = 'TLE'
+    elif sol['memory'] is not None and sol['memory'] > memory_limit * 1024:
+        verdict = 'MLE'
+    elif sol['code'] != 0:
+        verdict = 'RE'
+    elif inter['code'] != 0:
+        verdict = 'NG'
+    else:
+        verdict = 'OK'
+
+    return {
+        'verdict': verdict,
+        'proc_t': proc_t,
+        'cpu_t': sol['cpu_t'],
+        'memory': sol['memory'],
+        'interactor_memory': inter['memory'],
+        'query_cnt': relay.query_cnt,
+        'latency_l': relay.latency_l,
+        'solution_stderr': stderr_d.get('solution', b'').decode(errors='replace'),
+        'interactor_stderr': stderr_d.get('interactor', b'').decode(errors='replace'),
+    }
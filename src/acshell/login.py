@@ -2,9 +2,7 @@ from getpass import getpass
 import logging
 from typing import Sequence
 
-from bs4 import BeautifulSoup
-
-from .utils import CookieSession, URL
+from .utils import CookieSession, URL, parse_html
 
 
 def login(logger: logging.Logger, argv: Sequence[str]) -> bool:
@@ -18,7 +16,7 @@ def login(logger: logging.Logger, argv: Sequence[str]) -> bool:
             # 強制ログアウト: ログアウトのURLがないので、Cookieを破棄する
             session.cookies.clear()
         get_res = session.get(URL.LOGIN)
-        soup = BeautifulSoup(get_res.text, 'lxml')
+        soup = parse_html(get_res.text)
         _container = soup.select_one('#main-container')
         csrf_token = _container.find('input', attrs={'name': 'csrf_token'})['value']
         data = {
@@ -32,7 +30,7 @@ def login(logger: logging.Logger, argv: Sequence[str]) -> bool:
             logger.info('ログインに成功しました')
             return 0
 
-        soup = BeautifulSoup(post_res.text, 'lxml')
+        soup = parse_html(post_res.text)
         _container = soup.select_one('#main-container')
         error_text = _container.select_one('.alert').text.strip().replace('×\n ', '')
         raise RuntimeError(f'ログインに失敗しました: {error_text}')
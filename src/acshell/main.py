@@ -1,7 +1,27 @@
+import os
 import sys
-from typing import Optional, Sequence
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from . import acshell
+
+def _split_global_options(argv: Sequence[str]) -> Tuple[List[str], Dict]:
+    """全コマンド共通のオプションを取り出す
+
+    --trace[=<path>]: 処理ごとの実行時間を記録する
+    --offline: 通信を行わず、ローカルのデータのみを使う
+    """
+    options: Dict = dict()
+    args: List[str] = []
+    for arg in argv:
+        if arg == '--trace':
+            options['trace'] = ''
+        elif arg.startswith('--trace='):
+            options['trace'] = os.path.abspath(arg[len('--trace='):])
+        elif arg == '--offline':
+            options['offline'] = True
+        else:
+            args.append(arg)
+
+    return args, options
 
 
 def main(argv: Optional[Sequence[str]] = None) -> int:
@@ -13,11 +33,19 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
     if argv is None:
         argv = sys.argv[1:]
 
+    if len(argv) > 0 and argv[0] == '__complete':
+        # 補完はキー入力のたびに呼ばれるので、通信などのモジュールを読み込まずに処理する
+        from .complete import complete
+        return complete(argv[1:])
+
+    # requests などの読み込みに時間がかかるため、補完以外のコマンドでのみ読み込む
+    from . import acshell
+    argv, options = _split_global_options(argv)
     if len(argv) == 0:
         print('実行コマンドが指定されていません')
         return 1
     instance = acshell.ACShell()
-    instance.run(argv)
+    instance.run(argv, **options)
     return instance.exit_code()
 
 
@@ -0,0 +1,302 @@
+"""メモリ使用量のプロファイル
+
+結合後のコードを tracemalloc を有効にして実行し、メモリを確保している行を元のファイルの行に戻して表示する
+問題フォルダに gen.py (引数のサイズの入力を出力するスクリプト) があれば、
+サイズを変えた入力での使用量から、最大サイズでのピークを推定してメモリ制限と比較する
+"""
+import json
+from logging import Logger
+import math
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from tabulate import tabulate
+
+from .consts import ENCODING, LANG_TABLE
+from .contest.task import Task
+from .utils import search_task_json
+
+
+# 入力の生成スクリプト (問題フォルダに置く)
+GENERATOR_NAME = 'gen.py'
+DEFAULT_TOP = 10
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_TARGET = 200000
+# tracemalloc で遅くなる分、実行時間制限を緩める倍率
+TIME_LIMIT_FACTOR = 20
+# メモリ制限に対してこの割合を超える推定は警告する
+WARN_RATIO = 0.8
+# 結合後のコードを tracemalloc を有効にして実行し、ピーク時に確保されていた行をjsonで保存するスクリプト
+MEMPROF_SCRIPT = '''\
+import json, resource, runpy, signal, sys, tracemalloc
+from itertools import groupby
+from operator import itemgetter
+path, out_path, top = sys.argv[1], sys.argv[2], int(sys.argv[3])
+# 標準ライブラリの Python のコードの中での確保も、呼び出した解答の行に含められるだけのフレーム数
+NFRAME = 16
+state = {"peak": 0, "sites": [], "site_mem": 0, "growth": 1.1, "busy": False}
+def site_of(frames):
+    # 解答のファイル内で最も内側のフレームの行 (frames は内側から順)
+    return next((lineno for filename, lineno in frames if filename == path), None)
+def raw_site_d():
+    # take_snapshot().statistics() は確保ごとにオブジェクトを作って遅いので、
+    # 生のトレース (domain, size, フレーム, ...) を C の関数だけでトレースバックごとにまとめる
+    # (非公開の関数なので、無いか形式が違う場合は None を返して公開の API で集計する)
+    get_traces = getattr(tracemalloc, "_get_traces", None)
+    if get_traces is None:
+        return None
+    site_d = {}
+    try:
+        trace_l = sorted(get_traces(), key=itemgetter(2))
+        for frames, group in groupby(trace_l, key=itemgetter(2)):
+            lineno = site_of(frames)
+            if lineno is not None:
+                size_l = [trace[1] for trace in group]
+                site = site_d.setdefault(lineno, [0, 0])
+                site[0] += sum(size_l)
+                site[1] += len(size_l)
+    except (TypeError, ValueError, IndexError):
+        return None
+    return site_d
+def snapshot_site_d():
+    # 公開の API ではトレースバックごとにまとめてから行に振り分ける
+    site_d = {}
+    for stat in tracemalloc.take_snapshot().statistics("traceback"):
+        lineno = site_of((frame.filename, frame.lineno) for frame in reversed(stat.traceback))
+        if lineno is not None:
+            site = site_d.setdefault(lineno, [0, 0])
+            site[0] += stat.size
+            site[1] += stat.count
+    return site_d
+def sites():
+    site_d = raw_site_d()
+    if site_d is None:
+        # 公開の API での集計は遅いので、記録し直すのは使用量が倍になったときだけにする
+        state["growth"] = 2
+        site_d = snapshot_site_d()
+    site_l = [[lineno, size, count] for lineno, (size, count) in site_d.items()]
+    return sorted(site_l, key=itemgetter(1), reverse=True)[:top]
+def check(*_):
+    # シグナルのハンドラはメインスレッドで実行されるので、この間は解答が止まっている
+    # (reset_peak までに解答がピークを更新することはない)
+    if state["busy"]:
+        return
+    state["busy"] = True
+    try:
+        cur, peak = tracemalloc.get_traced_memory()
+        state["peak"] = max(state["peak"], peak)
+        if cur > state["site_mem"] * state["growth"]:
+            # 使用量が前回の記録から増えていれば、確保している行を記録し直す
+            state["sites"], state["site_mem"] = sites(), cur
+            if hasattr(tracemalloc, "reset_peak"):
+                # スナップショット自体の確保をピークに含めない
+                tracemalloc.reset_peak()
+    finally:
+        state["busy"] = False
+sys.argv = [path]
+signal.signal(signal.SIGPROF, check)
+tracemalloc.start(NFRAME)
+signal.setitimer(signal.ITIMER_PROF, 0.005, 0.005)
+try:
+    runpy.run_path(path, run_name="__main__")
+except SystemExit:
+    pass
+finally:
+    signal.setitimer(signal.ITIMER_PROF, 0)
+    check()
+    hwm = None
+    try:
+        with open("/proc/self/status") as f:
+            hwm = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        hwm = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.stop()
+    with open(out_path, "w") as f:
+        json.dump({"peak": state["peak"], "sites": state["sites"], "rss": hwm}, f)
+'''
+
+
+def _profile(
+    lang: str, merged_path: Path, in_path: Path, top: int, timeout: float,
+) -> Dict:
+    """1つの入力でコードを実行し、tracemalloc の計測結果を返す
+
+    Returns:
+        peak: tracemalloc で計測したピーク (bytes), rss: プロセスのピーク (KB),
+        sites: ピーク付近で確保されていた [結合後の行番号, bytes, 個数] のリスト
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_path = Path(tmp_dir) / 'memprof.json'
+        try:
+            with in_path.open(mode='rb') as test_in:
+                res = subprocess.run(
+                    LANG_TABLE[lang].split() +
+                    ['-c', MEMPROF_SCRIPT, str(merged_path), str(out_path), str(top)],
+                    stdin=test_in,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                    timeout=timeout,
+                )
+        except OSError:
+            raise RuntimeError(f'インタプリタが見つかりません: {LANG_TABLE[lang]}')
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f'{timeout:.0f} 秒以内に終了しませんでした: {in_path.name}')
+
+        if not out_path.is_file():
+            raise RuntimeError(
+                f'プロファイルに失敗しました: {in_path.name} (in {LANG_TABLE[lang]})\n'
+                f'{res.stderr.decode()}')
+        with out_path.open(encoding=ENCODING) as f:
+            return json.load(f)
+
+
+def _site_rows(task: Task, merged_path: Path, site_l: List[List[int]]) -> List[List]:
+    """確保している行を元のファイルの行に戻して表の行にする
+    """
+    merged_l = merged_path.read_text(encoding=ENCODING).split('\n')
+    row_l = []
+    for lineno, size, count in site_l:
+        location = f'{merged_path.name}:{lineno}'
+        if lineno in task.merged_line_map:
+            src_path, src_no = task.merged_line_map[lineno]
+            location = f'{src_path.name}:{src_no}'
+        text = merged_l[lineno - 1].strip() if 0 < lineno <= len(merged_l) else ''
+        row_l.append([location, size // 1024, count, text[:60]])
+    return row_l
+
+
+def _fit_power(size_l: List[int], value_l: List[float]) -> Tuple[float, float]:
+    """value = a * size^b を両対数の最小二乗法で当てはめる
+
+    Returns:
+        (a, b)
+    """
+    x_l = [math.log(size) for size in size_l]
+    y_l = [math.log(max(value, 1)) for value in value_l]
+    x_avg, y_avg = sum(x_l) / len(x_l), sum(y_l) / len(y_l)
+    var = sum((x - x_avg) ** 2 for x in x_l)
+    b = sum((x - x_avg) * (y - y_avg) for x, y in zip(x_l, y_l)) / var if var > 0 else 0.0
+    return math.exp(y_avg - b * x_avg), b
+
+
+def _parse_int_list(arg: str) -> List[int]:
+    """`--<name>=<n>[,<n>...]` の値を正の整数のリストにする"""
+    text = arg[arg.index('=') + 1:]
+    try:
+        value_l = [int(value) for value in text.split(',') if value]
+    except ValueError:
+        raise RuntimeError(f'不正な値: {arg}')
+    if not value_l or min(value_l) < 1:
+        raise RuntimeError(f'不正な値: {arg}')
+    return value_l
+
+
+def _predict(
+    logger: Logger, task: Task, lang: str, merged_path: Path, gen_path: Path,
+    size_l: List[int], target: int, top: int, timeout: float,
+) -> int:
+    """生成した入力のサイズごとに計測し、target でのピークを推定する
+    """
+    measure_l = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in size_l:
+            in_path = Path(tmp_dir) / f'{size}.txt'
+            with in_path.open(mode='wb') as f:
+                res = subprocess.run(
+                    [sys.executable, str(gen_path), str(size)], stdout=f, stderr=subprocess.PIPE)
+            if res.returncode != 0:
+                raise RuntimeError(f'入力の生成に失敗しました: {gen_path.name} {size}\n{res.stderr.decode()}')
+            logger.info(f'計測中: サイズ {size}')
+            measure_l.append((size, _profile(lang, merged_path, in_path, top, timeout)))
+
+    print(tabulate(
+        [[size, prof['peak'] // 1024, prof['rss']] for size, prof in measure_l],
+        ['サイズ', 'ピーク (KB)', 'プロセスのピーク (KB)'], 'github'))
+
+    a, b = _fit_power([size for size, _ in measure_l], [prof['peak'] for _, prof in measure_l])
+    # インタプリタなど入力に依らない分は、最小のサイズでのプロセスのピークとの差から見積もる
+    # (大きいサイズでは tracemalloc 自体の使用量が増えるため)
+    prof = measure_l[0][1]
+    base_kb = max(prof['rss'] - prof['peak'] // 1024, 0) if prof['rss'] else 0
+    predict_kb = int(a * target ** b) // 1024 + base_kb
+    limit_kb = task.memory_limit * 1024
+    text = (f'サイズ {target} での推定ピーク: {predict_kb // 1024} MB'
+            f' (増加の次数 {b:.2f}, メモリ制限 {task.memory_limit} MB)')
+    if predict_kb > limit_kb:
+        logger.error(f'MLE の可能性があります: {text}')
+        return 1
+    if predict_kb > limit_kb * WARN_RATIO:
+        logger.warning(f'メモリ制限に近づいています: {text}')
+    else:
+        logger.info(text)
+    return 0
+
+
+def memprof(logger: Logger, argv: Sequence[str]) -> int:
+    """テストケースでのメモリ使用量を、確保している行ごとに表示する
+
+    [case]: テストケースの番号 (test と同じ) または名前 (既定はすべて)
+    --lang=<lang>: 実行する言語 (tracemalloc のある CPython のみ, 既定は python)
+    --top=<n>: 表示する行の数
+    --gen=<path>: 入力の生成スクリプト (既定は問題フォルダの gen.py)
+    --sizes=<n,...>: 生成する入力のサイズ
+    --target=<n>: ピークを推定するサイズ (問題の最大サイズ)
+    """
+    args = [arg for arg in argv if not arg.startswith('--')]
+    if not args:
+        raise RuntimeError('オプションが不足しています')
+    lang = list(LANG_TABLE.keys())[0]
+    top = DEFAULT_TOP
+    gen: Optional[str] = None
+    size_l = list(DEFAULT_SIZES)
+    target = DEFAULT_TARGET
+    for arg in argv:
+        if arg.startswith('--lang='):
+            lang = arg[len('--lang='):]
+        elif arg.startswith('--top='):
+            top = _parse_int_list(arg)[0]
+        elif arg.startswith('--gen='):
+            gen = arg[len('--gen='):]
+        elif arg.startswith('--sizes='):
+            size_l = sorted(_parse_int_list(arg))
+        elif arg.startswith('--target='):
+            target = _parse_int_list(arg)[0]
+    if lang not in LANG_TABLE:
+        raise RuntimeError(f'定義されていない言語: {lang}')
+
+    task = Task(logger, search_task_json(args[0]))
+    merged_path = task.merge_code()
+    timeout = task.time_limit * TIME_LIMIT_FACTOR
+    case_l = task.list_testcases(require_output=False)
+    if len(args) >= 2:
+        case_l = [
+            case for i, case in enumerate(case_l) if args[1] in (str(i), case[0])
+        ]
+        if not case_l:
+            raise RuntimeError(f'テストケースが見つかりません: {args[1]}')
+
+    # ケースごとのピーク
+    result_l = []
+    for name, in_path, _ in case_l:
+        logger.info(f'計測中: {task.code} ({name}, in {LANG_TABLE[lang]})')
+        result_l.append((name, _profile(lang, merged_path, in_path, top, timeout)))
+    if result_l:
+        print(tabulate(
+            [[name, prof['peak'] // 1024, prof['rss']] for name, prof in result_l],
+            ['ケース', 'ピーク (KB)', 'プロセスのピーク (KB)'], 'github'))
+        # 最もメモリを使ったケースで確保している行
+        name, prof = max(result_l, key=lambda result: result[1]['peak'])
+        logger.info(f'メモリを確保している行 ({name}):')
+        print(tabulate(
+            _site_rows(task, merged_path, prof['sites']),
+            ['場所', 'サイズ (KB)', '個数', 'コード'], 'github'))
+
+    gen_path = Path(gen).resolve() if gen else task.json_path.parent / GENERATOR_NAME
+    if not gen_path.is_file():
+        if gen:
+            raise RuntimeError(f'生成スクリプトが見つかりません: {gen}')
+        return 0
+    return _predict(logger, task, lang, merged_path, gen_path, size_l, target, top, timeout)
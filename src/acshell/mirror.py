@@ -0,0 +1,107 @@
+"""過去のコンテストのローカルミラー
+
+コンテストごとに、問題の情報 (実行時間制限・メモリ制限・配点) とサンプルを
+user_data_dir/mirror/<contest>.json.xz に lzma で圧縮して保存する
+index.json に問題コード -> コンテストの対応を持ち、問題コードから直接引けるようにする
+"""
+from datetime import datetime, timezone
+from functools import lru_cache
+import json
+import lzma
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .consts import ENCODING
+from .utils import file_lock, user_data_dir, write_atomic
+
+
+mirror_dir = user_data_dir / 'mirror'
+index_path = mirror_dir / 'index.json'
+MIRROR_VERSION = 1
+
+
+def record_path(contest_code: str) -> Path:
+    return mirror_dir / f'{contest_code}.json.xz'
+
+
+@lru_cache(maxsize=None)
+def load_index() -> Dict:
+    """ミラーの索引
+
+    contests: コンテスト -> 終了日時・保存日時・問題コードのリスト
+    tasks: 問題コード -> コンテスト
+    """
+    try:
+        with index_path.open(encoding=ENCODING) as f:
+            index = json.load(f)
+        if index.get('version') == MIRROR_VERSION:
+            return index
+    except (OSError, ValueError):
+        pass
+    return {'version': MIRROR_VERSION, 'contests': dict(), 'tasks': dict()}
+
+
+@lru_cache(maxsize=64)
+def contest_record(contest_code: str) -> Optional[Dict]:
+    """ミラーにあるコンテストの記録 (なければ None)
+    """
+    if contest_code not in load_index()['contests']:
+        return None
+    try:
+        return json.loads(lzma.decompress(record_path(contest_code).read_bytes()).decode(ENCODING))
+    except (OSError, lzma.LZMAError, ValueError):
+        return None
+
+
+def task_record(task_code: str) -> Optional[Dict]:
+    """ミラーにある問題の記録 (なければ None)
+    """
+    contest_code = load_index()['tasks'].get(task_code)
+    if contest_code is None:
+        return None
+    record = contest_record(contest_code)
+    if record is None:
+        return None
+    for task in record['tasks'].values():
+        if task['code'] == task_code:
+            return task
+    return None
+
+
+def is_synced(contest_code: str) -> bool:
+    """終了後に保存したコンテストかどうか (終了したコンテストの問題は変わらない)
+    """
+    entry = load_index()['contests'].get(contest_code)
+    if entry is None or not entry.get('end_dt'):
+        return False
+    end_dt = datetime.strptime(entry['end_dt'], '%Y-%m-%d %H:%M:%S%z')
+    return datetime.fromisoformat(entry['synced_at']) > end_dt
+
+
+def save_records(record_l: List[Dict]) -> None:
+    """コンテストの記録を保存し、索引を更新する
+    """
+    if not record_l:
+        return
+    mirror_dir.mkdir(parents=True, exist_ok=True)
+    now = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    for record in record_l:
+        write_atomic(
+            record_path(record['code']),
+            lzma.compress(json.dumps(record, ensure_ascii=False).encode(ENCODING)))
+
+    with file_lock(index_path):
+        # 他のプロセスの更新を取り込んでから書き込む
+        load_index.cache_clear()
+        index = load_index()
+        for record in record_l:
+            task_code_l = [task['code'] for task in record['tasks'].values()]
+            index['contests'][record['code']] = {
+                'title': record.get('title', ''), 'end_dt': record.get('end_dt', ''),
+                'synced_at': now, 'tasks': task_code_l,
+            }
+            for task_code in task_code_l:
+                index['tasks'][task_code] = record['code']
+        write_atomic(index_path, json.dumps(index, ensure_ascii=False).encode(ENCODING))
+    load_index.cache_clear()
+    contest_record.cache_clear()
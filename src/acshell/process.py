@@ -0,0 +1,149 @@
+"""子プロセスの実行とリソース使用量の取得
+"""
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Sequence, Union
+
+try:
+    import resource
+except ImportError:
+    # Windows: リソース使用量は取得しない
+    resource = None
+
+
+# 子プロセスの終了後、出力のパイプが閉じるまで待つ時間 (sec)
+PIPE_TIMEOUT = 1.0
+
+
+class ProcessResult(NamedTuple):
+    """子プロセスの実行結果
+    """
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    cpu_t: Optional[int]  # msec (user + sys), 取得できない環境では None
+    memory: Optional[int]  # KB (最大常駐メモリ), 取得できない・区別できない場合は None
+
+
+def exit_code(status: int) -> int:
+    """os.wait4 の終了ステータスを終了コードに変換する
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def maxrss_kb(rusage) -> int:
+    """ru_maxrss を KB に変換する (Linux は KB, macOS は byte)
+    """
+    if os.uname().sysname == 'Darwin':
+        return rusage.ru_maxrss // 1024
+    return rusage.ru_maxrss
+
+
+def spawner_maxrss_kb() -> int:
+    """子プロセスを起動した直後に呼び、起動した側 (このプロセス) の最大常駐メモリ (KB) を返す
+    """
+    return maxrss_kb(resource.getrusage(resource.RUSAGE_SELF))
+
+
+def child_maxrss_kb(rusage, spawner_kb: int) -> Optional[int]:
+    """子プロセスの最大常駐メモリ (KB)
+
+    Linux では exec する前のアドレス空間 (起動した側のもの) の最大常駐メモリも ru_maxrss に含まれ、
+    ru_maxrss は「起動した側の最大メモリ」と「子自身の最大メモリ」の大きい方になる
+    起動した側の値以下の場合は子自身の値が分からないため None を返す
+    """
+    memory = maxrss_kb(rusage)
+    return memory if memory > spawner_kb else None
+
+
+def cpu_msec(rusage) -> int:
+    return int((rusage.ru_utime + rusage.ru_stime) * 1000)
+
+
+def kill_group(proc: subprocess.Popen) -> None:
+    """子プロセスと、その子孫 (shell=True の場合の sh から起動したものなど) をまとめて終了させる
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # すでにすべて終了している
+        pass
+
+
+def join_all(thread_l: Sequence[threading.Thread], timeout: float) -> bool:
+    """すべてのスレッドの終了を合わせて timeout 秒まで待ち、すべて終了したかどうかを返す
+    """
+    deadline = time.perf_counter() + timeout
+    for thread in thread_l:
+        thread.join(max(deadline - time.perf_counter(), 0))
+    return not any(thread.is_alive() for thread in thread_l)
+
+
+def run_process(
+    cmd: Union[str, Sequence[str]], stdin, timeout: float, **popen_kw,
+) -> ProcessResult:
+    """コマンドを実行し、出力と CPU 時間・最大メモリを取得する
+
+    subprocess.run と同様に、タイムアウトした場合は subprocess.TimeoutExpired を送出する
+    子プロセスは新しいプロセスグループで起動し、タイムアウトした場合は子孫ごと終了させる
+    """
+    if not hasattr(os, 'wait4'):
+        # Windows: リソース使用量は取得しない
+        res = subprocess.run(
+            cmd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            timeout=timeout, **popen_kw)
+        return ProcessResult(res.returncode, res.stdout, res.stderr, None, None)
+
+    proc = subprocess.Popen(
+        cmd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        start_new_session=True, **popen_kw)
+    spawner_kb = spawner_maxrss_kb()
+
+    # 出力は別スレッドで読み切る (パイプが詰まらないようにする)
+    output_d: Dict[str, bytes] = dict()
+
+    def read(name: str, stream) -> None:
+        output_d[name] = stream.read()
+
+    reader_l = [
+        threading.Thread(target=read, args=('stdout', proc.stdout), daemon=True),
+        threading.Thread(target=read, args=('stderr', proc.stderr), daemon=True),
+    ]
+    for thread in reader_l:
+        thread.start()
+
+    # Popen.wait ではリソース使用量が取得できないため、wait4 で終了を待つ
+    status_d: Dict = dict()
+
+    def wait() -> None:
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = exit_code(status)
+        status_d['rusage'] = rusage
+
+    waiter = threading.Thread(target=wait, daemon=True)
+    sta = time.perf_counter()
+    waiter.start()
+    waiter.join(timeout)
+    timed_out = waiter.is_alive()
+    if timed_out:
+        kill_group(proc)
+        waiter.join()
+    if not join_all(reader_l, PIPE_TIMEOUT):
+        # 終了した子プロセスの子孫がパイプを開いたままにしている
+        kill_group(proc)
+    if join_all(reader_l, PIPE_TIMEOUT):
+        proc.stdout.close()
+        proc.stderr.close()
+    if timed_out:
+        raise subprocess.TimeoutExpired(cmd, time.perf_counter() - sta)
+
+    rusage = status_d['rusage']
+    return ProcessResult(
+        proc.returncode, output_d.get('stdout', b''), output_d.get('stderr', b''),
+        cpu_msec(rusage), child_maxrss_kb(rusage, spawner_kb),
+    )
@@ -1,12 +1,42 @@
 from logging import Logger
 import re
-from typing import Dict, List, Sequence
+from typing import Dict, Iterator, NamedTuple, Optional, Sequence
 
-from bs4.element import Tag
 from tabulate import tabulate
 
 from .contest.contest import Contest
-from .utils import get_soup, search_contest_json, CookieSession, URL
+from .utils import (
+    get_soup, pop_format_option, print_ndjson, search_contest_json, CookieSession, URL,
+)
+
+
+REG_TITLE = re.compile('(.+) - .*')
+REG_NUMBER = re.compile(r'\d+')
+
+
+class Submission(NamedTuple):
+    """提出結果の1行"""
+    key: str
+    submit_time: str
+    lang: str
+    score: str
+    judge: str
+    time: str
+    memory: str
+
+    def record(self) -> Dict:
+        """ndjson 形式で出力する内容 (時間は msec, メモリは KB の整数)"""
+        return {
+            'type': 'submission', 'key': self.key, 'submit_time': self.submit_time,
+            'lang': self.lang, 'score': _to_int(self.score), 'judge': self.judge,
+            'time': _to_int(self.time), 'memory': _to_int(self.memory),
+        }
+
+
+def _to_int(text: str) -> Optional[int]:
+    """`123 ms` などの先頭の数値 (なければ None)"""
+    match = REG_NUMBER.match(text)
+    return int(match.group()) if match is not None else None
 
 
 def _add_judge_color(judge: str) -> str:
@@ -17,11 +47,19 @@ def _add_judge_color(judge: str) -> str:
     elif judge in ('WA', 'TLE', 'MLE', 'CE', 'OLE', 'IE', 'RE'):
         # 黄色
         return f'\033[33m{judge}\033[0m'
+    # ジャッジ中 (WJ, 3/10 など)
+    return judge
+
 
+def _get_submission(
+    logger: Logger, contest: Contest, page_limit: int = 50,
+) -> Iterator[Submission]:
+    """提出結果を新しい順に取得する
 
-def _get_submission(logger: Logger, contest: Contest, page_limit: int = 50):
-    """提出結果を取得する"""
-    tr_l: List[Tag] = []
+    ページごとに取得して行を返し、読み終えたページは破棄する
+    必要な分だけ読めばよいので、以降のページは取得しない
+    """
+    row_cnt = 0
     with CookieSession() as session:
         for page in range(1, page_limit + 1):
             try:
@@ -33,39 +71,46 @@ def _get_submission(logger: Logger, contest: Contest, page_limit: int = 50):
             if table is None:
                 # ページにコンテンツなし
                 break
-            tbody = table.select_one('tbody')
-            tr_l.extend(tbody.select('tr'))
+            tr_l = table.select_one('tbody').find_all('tr', recursive=False)
+            row_l = [_parse_row(tr) for tr in tr_l]
+            # 行を読み取ったらページの木は破棄する
+            del tr_l, table
+            soup.decompose()
+            row_cnt += len(row_l)
+            yield from row_l
         else:
-            if len(tr_l) == 1000:
+            if row_cnt == 1000:
                 logger.warning('1000件以上の提出が見つかったため、取得を打ち切りました')
 
-    # regex
-    REG_TITLE = re.compile('(.+) - .*')
-    result_l: List[Dict] = []
-    for tr in tr_l:
-        result_l.append({
-            'key': REG_TITLE.match(tr.select('td')[1].a.text).groups()[0],
-            'submit_time': tr.select('td')[0].find('time').text[:-5],
-            'lang': tr.select('td')[3].a.text,
-            'score': tr.select('td')[4].text,
-            'judge': _add_judge_color(tr.select('td')[6].find('span').text),
-            'time': '',
-            'memory': '',
-        })
-        if 'WJ' not in result_l[-1]['judge'] and '/' not in result_l[-1]['judge']:
-            # 判定結果が出ている場合は時間とメモリの情報も追加する
-            result_l[-1]['time'] = tr.select('td')[7].text
-            result_l[-1]['memory'] = tr.select('td')[8].text
 
-    return result_l
+def _parse_row(tr) -> Submission:
+    """提出一覧の1行を読み取る"""
+    td_l = tr.find_all('td', recursive=False)
+    judge = td_l[6].find('span').text
+    time = memory = ''
+    if 'WJ' not in judge and '/' not in judge:
+        # 判定結果が出ている場合は時間とメモリの情報も追加する
+        time = td_l[7].text
+        memory = td_l[8].text
+    return Submission(
+        key=REG_TITLE.match(td_l[1].a.text).group(1),
+        submit_time=td_l[0].find('time').text[:-5],
+        lang=td_l[3].a.text,
+        score=td_l[4].text,
+        judge=judge,
+        time=time,
+        memory=memory,
+    )
 
 
 def recent_result(logger: Logger, argv: Sequence[str]) -> int:
     """直近の提出結果を取得する
+
+    --format=ndjson: 提出ごとに1行のjsonで出力する
     """
+    argv, fmt = pop_format_option(argv)
     contest_json = search_contest_json()
     contest = Contest(logger, contest_json)
-    result_l = _get_submission(logger, contest, page_limit=1)
     HEADER_INFO = {
         'key': '問題',
         'submit_time': '提出時刻',
@@ -74,13 +119,26 @@ def recent_result(logger: Logger, argv: Sequence[str]) -> int:
         'time': '実行時間',
         'memory': 'メモリ',
     }
-    data_l = [[res[k] for k in HEADER_INFO.keys()] for res in result_l]
+    if fmt == 'ndjson':
+        for res in _get_submission(logger, contest, page_limit=1):
+            print_ndjson(res.record())
+        return 0
+
+    data_l = []
+    for res in _get_submission(logger, contest, page_limit=1):
+        res = res._replace(judge=_add_judge_color(res.judge))
+        data_l.append([getattr(res, k) for k in HEADER_INFO.keys()])
     print(tabulate(data_l, HEADER_INFO.values(), 'github'))
     return 0
 
 
 def status(logger: Logger, argv: Sequence[str]) -> int:
-    """コンテストの得点状況を取得する"""
+    """コンテストの得点状況を取得する
+
+    --format=ndjson: 問題ごとに1行のjsonで出力する
+    (最古の AC を求めるためにすべての提出を読んでから出力する)
+    """
+    argv, fmt = pop_format_option(argv)
     contest_json = search_contest_json()
     contest = Contest(logger, contest_json)
     # REG_WA: これに引っかからない判定結果をペナルティ扱いする
@@ -98,16 +156,16 @@ def status(logger: Logger, argv: Sequence[str]) -> int:
         } for key in contest.tasks.keys()
     }
     # 結果を取得し、新しい順に処理する
-    result_l = _get_submission(logger, contest)
-    for result in result_l:
-        _key = result['key']
+    # (最古のACとそれ以前のペナルティで決まるため、最後のページまで読む必要がある)
+    for result in _get_submission(logger, contest):
+        _key = result.key
         if _key not in data_d:
             continue
-        if data_d[_key]['submit_time'] is None or 'AC' in result['judge']:
+        if data_d[_key]['submit_time'] is None or 'AC' in result.judge:
             # 最新の提出結果 or より古いACの結果 -> 上書きする
-            data_d[_key] = result
+            data_d[_key] = result._asdict()
             wa_cnt[_key] = 0
-        if data_d[_key]['submit_time'] is not None and REG_WA.match(result['judge']) is None:
+        if data_d[_key]['submit_time'] is not None and REG_WA.match(result.judge) is None:
             # すでに提出記録があり、ペナルティ対象の場合
             wa_cnt[_key] += 1
 
@@ -117,9 +175,19 @@ def status(logger: Logger, argv: Sequence[str]) -> int:
     tot_score = 0
     for key in data_d.keys():
         data_d[key]['penalty'] = wa_cnt[key]
-        data_d[key]['name'] = contest.tasks[key]
+        data_d[key]['name'] = contest.tasks[key]['name']
         tot_score += int(data_d[key]['score'])
 
+    if fmt == 'ndjson':
+        for res in data_d.values():
+            print_ndjson({
+                'type': 'task', 'key': res['key'], 'name': res['name'],
+                'submit_time': res['submit_time'], 'lang': res['lang'], 'judge': res['judge'],
+                'score': int(res['score']), 'penalty': res['penalty'],
+            })
+        print_ndjson({'type': 'summary', 'score': tot_score, 'penalty': tot_wa})
+        return 0
+
     HEADER_INFO = {
         'key': '問題',
         'submit_time': '提出時刻',
@@ -128,7 +196,10 @@ def status(logger: Logger, argv: Sequence[str]) -> int:
         'score': '得点',
         'penalty': 'ペナ数',
     }
-    out_l = [[res[k] for k in HEADER_INFO.keys()] for res in data_d.values()]
+    out_l = [
+        [_add_judge_color(res[k]) if k == 'judge' else res[k] for k in HEADER_INFO.keys()]
+        for res in data_d.values()
+    ]
     print(tabulate(out_l, HEADER_INFO.values(), 'github'))
     print(f'合計得点: {tot_score} (合計ペナルティ: {tot_wa})')
     return 0
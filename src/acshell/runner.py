@@ -0,0 +1,184 @@
+"""言語ごとの実行方法 (ランナー)
+
+LANG_TABLE の Python インタプリタに加えて、チートシートのフォルダに置いた runners.json で
+コンパイルが必要な言語などを追加できる
+
+    {
+        "cpp": {
+            "source": "{code}.cpp",
+            "compile": "g++ -O2 -std=gnu++20 -o {out} {src}",
+            "run": "{out}",
+            "submit": "C++ 20 (gcc 12.2)"
+        }
+    }
+
+source: 問題フォルダ内のソースファイル ({code} は問題コード, 既定は {code}.py)
+compile: コンパイルのコマンド (省略した場合はコンパイルしない)
+run: 実行のコマンド ({src}: ソースファイル, {out}: コンパイルの成果物, {dir}: ビルドフォルダ)
+submit: 提出時の言語 (SUB_LANG_TABLE のキー、または提出ページの言語名)
+
+コンパイルの成果物は、コマンドとソースのハッシュごとにビルドキャッシュへ保存して再利用する
+"""
+from functools import lru_cache
+import hashlib
+import json
+from logging import Logger
+from pathlib import Path
+import shlex
+import shutil
+import subprocess
+from typing import Dict, NamedTuple, Optional
+
+from .consts import ENCODING, LANG_TABLE, RUNNER_FILE_NAME, SUB_LANG_TABLE
+from .utils import get_cheat_dir, user_cache_dir
+
+
+build_cache_dir = user_cache_dir / 'builds'
+COMPILE_TIMEOUT = 60
+
+
+class Runner(NamedTuple):
+    """言語の実行方法"""
+    name: str
+    run: str
+    compile: Optional[str] = None
+    source: str = '{code}.py'
+    submit: Optional[str] = None
+    # LANG_TABLE の Python インタプリタ (構文チェックなどに使う)
+    interpreter: Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        """表示用の名前"""
+        return self.interpreter or self.name
+
+    @property
+    def submit_language(self) -> Optional[str]:
+        """提出ページの言語名"""
+        if self.submit is None:
+            return None
+        return SUB_LANG_TABLE.get(self.submit, self.submit)
+
+    def source_path(self, task_dir: Path, code: str) -> Path:
+        return task_dir / self.source.format(code=code)
+
+    def command(self, src_path: Path, out_path: Optional[Path] = None) -> str:
+        """実行のコマンド
+        """
+        out_path = out_path or src_path
+        return self.run.format(
+            src=shlex.quote(str(src_path)), out=shlex.quote(str(out_path)),
+            dir=shlex.quote(str(out_path.parent)),
+        )
+
+
+@lru_cache(maxsize=None)
+def load_runners() -> Dict[str, Runner]:
+    """使用可能なランナーを読み込む (LANG_TABLE + runners.json)
+    """
+    runner_d = {
+        lang: Runner(
+            lang, f'{cmd} {{src}}', interpreter=cmd,
+            submit=lang if lang in SUB_LANG_TABLE else None,
+        )
+        for lang, cmd in LANG_TABLE.items()
+    }
+    try:
+        runner_path = get_cheat_dir() / RUNNER_FILE_NAME
+    except RuntimeError:
+        return runner_d
+    if not runner_path.is_file():
+        return runner_d
+
+    try:
+        with runner_path.open(encoding=ENCODING) as f:
+            conf_d = json.load(f)
+        for name, conf in conf_d.items():
+            runner_d[name] = Runner(
+                name, conf['run'], conf.get('compile'), conf.get('source', '{code}.py'),
+                conf.get('submit'),
+            )
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise RuntimeError(f'ランナーの設定が不正です: {runner_path}')
+
+    return runner_d
+
+
+def get_runner(lang: str) -> Runner:
+    runner_d = load_runners()
+    if lang not in runner_d:
+        raise RuntimeError(f'定義されていない言語: {lang}')
+    return runner_d[lang]
+
+
+def runner_label(lang: str) -> str:
+    """表示用の名前 (定義されていない言語はそのまま)
+    """
+    try:
+        return get_runner(lang).label
+    except RuntimeError:
+        return lang
+
+
+def submit_language(lang: str) -> str:
+    """言語の指定から提出ページの言語名を求める
+    """
+    if lang in SUB_LANG_TABLE:
+        return SUB_LANG_TABLE[lang]
+    runner = load_runners().get(lang)
+    if runner is None or runner.submit_language is None:
+        raise RuntimeError(f'提出できない言語: {lang}')
+    return runner.submit_language
+
+
+def build_digest(runner: Runner, src_path: Path) -> str:
+    """コンパイルのコマンドとソースから、成果物のハッシュを求める
+    """
+    digest = hashlib.sha256((runner.compile or '').encode(ENCODING) + b'\0')
+    digest.update(src_path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def build(logger: Logger, runner: Runner, src_path: Path) -> str:
+    """必要ならコンパイルし、実行のコマンドを返す
+
+    同じコマンド・同じソースの成果物がビルドキャッシュにあれば再利用する
+    """
+    if runner.compile is None:
+        return runner.command(src_path)
+
+    build_dir = build_cache_dir / build_digest(runner, src_path)
+    build_src = build_dir / src_path.name
+    out_path = build_dir / 'out'
+    done_path = build_dir / '.built'
+    if done_path.is_file():
+        logger.debug(f'ビルド済みの成果物を使用します: {build_dir}')
+        return runner.command(build_src, out_path)
+
+    if build_dir.exists():
+        # 中断されたビルドの残り
+        shutil.rmtree(str(build_dir))
+    build_dir.mkdir(parents=True)
+    shutil.copyfile(str(src_path), str(build_src))
+    compile_cmd = runner.compile.format(
+        src=shlex.quote(str(build_src)), out=shlex.quote(str(out_path)),
+        dir=shlex.quote(str(build_dir)),
+    )
+    logger.info(f'コンパイル中: {src_path.name} (in {runner.label})')
+    try:
+        res = subprocess.run(
+            compile_cmd, shell=True, cwd=str(build_dir),
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            timeout=COMPILE_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        shutil.rmtree(str(build_dir))
+        raise RuntimeError(f'コンパイルが {COMPILE_TIMEOUT} 秒以内に終了しませんでした: {src_path.name}')
+    if res.returncode != 0:
+        shutil.rmtree(str(build_dir))
+        raise RuntimeError(
+            f'CE: {src_path.name} (in {runner.label})\n'
+            f'{res.stderr.decode(errors="replace")}{res.stdout.decode(errors="replace")}')
+
+    done_path.touch()
+    return runner.command(build_src, out_path)
@@ -0,0 +1,93 @@
+"""実行時間の計測を安定させる (--stable)
+
+子プロセスを1つのコアに固定し、可能であれば優先度を上げ、ハッシュのランダム化を無効にする
+複数回実行した結果の中央値と信頼区間を求める
+"""
+import os
+from pathlib import Path
+import random
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+
+DEFAULT_REPEAT = 5
+BOOTSTRAP_CNT = 1000
+
+
+def _select_core() -> Optional[int]:
+    """固定先のコアを選ぶ (isolcpus で分離されたコアがあれば優先する)
+    """
+    if not hasattr(os, 'sched_getaffinity'):
+        return None
+    allowed = sorted(os.sched_getaffinity(0))
+    isolated_path = Path('/sys/devices/system/cpu/isolated')
+    try:
+        isolated = _parse_cpu_list(isolated_path.read_text().strip())
+    except OSError:
+        isolated = []
+    for core in isolated:
+        if core in allowed:
+            return core
+    # 分離されたコアがなければ、割り込みの少ない末尾のコアを使う
+    return allowed[-1] if allowed else None
+
+
+def _parse_cpu_list(text: str) -> list:
+    """'2-3,5' 形式のCPUリストを展開する
+    """
+    core_l = []
+    for part in text.split(','):
+        if not part:
+            continue
+        if '-' in part:
+            lo, hi = part.split('-')
+            core_l.extend(range(int(lo), int(hi) + 1))
+        else:
+            core_l.append(int(part))
+    return core_l
+
+
+def stable_preexec() -> Callable[[], None]:
+    """子プロセスの起動直後に実行する処理 (コアの固定と優先度の変更)
+    """
+    if os.name != 'posix':
+        raise RuntimeError('--stable はこの環境に対応していません')
+    core = _select_core()
+
+    def preexec() -> None:
+        if core is not None:
+            os.sched_setaffinity(0, {core})
+        try:
+            # 権限がない場合は変更しない
+            os.nice(-5)
+        except (OSError, AttributeError):
+            pass
+    return preexec
+
+
+def stable_env() -> Dict[str, str]:
+    """ハッシュのランダム化を無効にした環境変数
+    """
+    env = dict(os.environ)
+    env['PYTHONHASHSEED'] = '0'
+    return env
+
+
+def median_ci(sample_l: Sequence[float], confidence: float = 0.95) -> Tuple[float, float, float]:
+    """中央値と、ブートストラップ法による信頼区間を求める
+    """
+    def median(values: Sequence[float]) -> float:
+        values = sorted(values)
+        mid = len(values) // 2
+        if len(values) % 2:
+            return values[mid]
+        return (values[mid - 1] + values[mid]) / 2
+
+    if len(sample_l) == 1:
+        return sample_l[0], sample_l[0], sample_l[0]
+    rand = random.Random(0)
+    boot_l = sorted(
+        median([rand.choice(sample_l) for _ in sample_l]) for _ in range(BOOTSTRAP_CNT))
+    alpha = (1 - confidence) / 2
+    lo = boot_l[int(alpha * BOOTSTRAP_CNT)]
+    hi = boot_l[min(int((1 - alpha) * BOOTSTRAP_CNT), BOOTSTRAP_CNT - 1)]
+    return median(sample_l), lo, hi
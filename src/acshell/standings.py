@@ -0,0 +1,165 @@
+from logging import Logger
+import re
+from typing import Dict, List, Optional, Sequence
+
+from tabulate import tabulate
+
+from .contest.contest import Contest
+from .utils import (
+    is_offline, load_json, save_json, search_contest_json, user_cache_dir, CookieSession, URL,
+)
+
+
+REG_USER_NAME = re.compile(r'userScreenName\s*=\s*"([^"]*)"')
+# ペナルティ1回あたりに加算される時間 (ナノ秒, AtCoder のコンテストは5分)
+PENALTY_TIME = 5 * 60 * 10 ** 9
+
+
+def _fetch_standings(logger: Logger, contest: Contest, refresh: bool) -> Dict:
+    """順位表のjsonを取得する (取得済みならキャッシュを使う)
+    """
+    cache_path = user_cache_dir / 'standings' / f'{contest}.json'
+    if cache_path.is_file() and (not refresh or is_offline()):
+        logger.info('キャッシュされた順位表を使用します (--refresh で再取得)')
+        return load_json(cache_path)
+
+    with CookieSession() as session:
+        res = session.get(URL.standings(str(contest)))
+        if res.status_code != 200:
+            raise RuntimeError(f'順位表の取得に失敗しました: {contest}')
+        data = res.json()
+        # 自分のユーザー名も記録しておく
+        user_res = REG_USER_NAME.search(session.get(URL.SETTINGS).text)
+        data['_user'] = user_res.group(1) if user_res is not None else ''
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    save_json(cache_path, data)
+    return data
+
+
+def _task_point(task: Dict) -> Optional[int]:
+    """コンテスト情報にある問題の配点 (取得できていない場合は None)
+    """
+    try:
+        return int(task.get('score') or 0) or None
+    except ValueError:
+        return None
+
+
+def standings(logger: Logger, argv: Sequence[str]) -> int:
+    """順位表を取得し、自分の順位と問題ごとの得点分布を表示する
+
+    --user=<name>: 対象のユーザー (既定はログイン中のユーザー)
+    --refresh: キャッシュを使わずに順位表を取得し直す
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise RuntimeError('順位表の集計には numpy が必要です: pip install numpy')
+
+    contest = Contest(logger, search_contest_json())
+    data = _fetch_standings(logger, contest, '--refresh' in argv)
+    user: Optional[str] = data.get('_user')
+    for arg in argv:
+        if arg.startswith('--user='):
+            user = arg[len('--user='):]
+
+    row_l: List[Dict] = data['StandingsData']
+    task_l: List[Dict] = data['TaskInfo']
+    if not row_l:
+        logger.info('順位表に参加者がいません')
+        return 0
+
+    # 参加者 x 問題 の得点と、合計得点・時間 (スコアは100倍, 時間はナノ秒で格納されている)
+    task_code_l = [task['TaskScreenName'] for task in task_l]
+    result_l = [
+        [row['TaskResults'].get(code, {}) for code in task_code_l] for row in row_l
+    ]
+    score_mat = np.array(
+        [[res.get('Score', 0) for res in results] for results in result_l], dtype=np.int64,
+    ).reshape(len(row_l), len(task_code_l)) // 100
+    count_mat = np.array(
+        [[res.get('Count', 0) for res in results] for results in result_l], dtype=np.int64,
+    ).reshape(len(row_l), len(task_code_l))
+    total_score = np.array([row['TotalResult']['Score'] for row in row_l], dtype=np.int64) // 100
+    # 同点の場合は、最後に得点した時間 + ペナルティ x ペナルティ時間 で順位が決まる
+    total_time = np.array(
+        [row['TotalResult']['Elapsed'] + row['TotalResult'].get('Penalty', 0) * PENALTY_TIME
+         for row in row_l],
+        dtype=np.int64,
+    )
+    # 配点はコンテスト情報のもの (不明な問題は参加者の最高得点で代用する)
+    point_d = {task['code']: _task_point(task) for task in contest.tasks.values()}
+    full_score = score_mat.max(axis=0)
+    unknown_l = []
+    for j, task in enumerate(task_l):
+        point = point_d.get(task['TaskScreenName'])
+        if point:
+            full_score[j] = point
+        else:
+            unknown_l.append(task['Assignment'])
+    if unknown_l:
+        logger.warning(f'配点が不明な問題は参加者の最高得点を配点とします: {", ".join(unknown_l)}')
+
+    def rank_of(score: int, elapsed: int, exclude: Optional[int] = None) -> int:
+        better = (total_score > score) | ((total_score == score) & (total_time < elapsed))
+        if exclude is not None:
+            better[exclude] = False
+        return int(better.sum()) + 1
+
+    user_idx: Optional[int] = None
+    user_l = [row['UserScreenName'] for row in row_l]
+    if user in user_l:
+        user_idx = user_l.index(user)
+    elif user:
+        logger.warning(f'順位表に参加していません: {user}')
+
+    # 問題ごとの得点分布
+    solved_cnt = ((score_mat == full_score) & (full_score > 0)).sum(axis=0)
+    tried_cnt = (count_mat > 0).sum(axis=0)
+    out_l = []
+    for j, task in enumerate(task_l):
+        scores = score_mat[:, j]
+        positive = scores[scores > 0]
+        line = [
+            task['Assignment'], int(full_score[j]),
+            f'{int(solved_cnt[j])} / {int(tried_cnt[j])}',
+            f'{solved_cnt[j] / len(row_l) * 100:.1f}%',
+            f'{positive.mean():.1f}' if len(positive) else '-',
+        ]
+        if user_idx is not None:
+            my_score = int(score_mat[user_idx, j])
+            line.append(my_score)
+            if my_score < full_score[j]:
+                # この問題を (現在の経過時間・ペナルティで) 解いた場合の順位
+                what_if = rank_of(
+                    int(total_score[user_idx] - my_score + full_score[j]),
+                    int(total_time[user_idx]), exclude=user_idx)
+                line.append(what_if)
+            else:
+                line.append('')
+        out_l.append(line)
+
+    header = ['問題', '配点', '正解者数', '正解率', '平均得点']
+    if user_idx is not None:
+        header += ['自分', '解けた場合の順位']
+    print(tabulate(out_l, header, 'github'))
+
+    # 合計得点の分布 (上位10種類)
+    score_val, score_cnt = np.unique(total_score, return_counts=True)
+    dist_l = [
+        [int(val), int(cnt), int(score_cnt[i + 1:].sum()) + 1]
+        for i, (val, cnt) in list(enumerate(zip(score_val, score_cnt)))[::-1][:10]
+    ]
+    print(tabulate(dist_l, ['合計得点', '人数', '最高順位'], 'github'))
+
+    if user_idx is not None:
+        # 現在の順位は順位表の値を使う
+        my_rank = row_l[user_idx].get('Rank') or rank_of(
+            int(total_score[user_idx]), int(total_time[user_idx]), exclude=user_idx)
+        print(
+            f'{user}: {my_rank} 位 / {len(row_l)} 人 (上位 {my_rank / len(row_l) * 100:.1f}%), '
+            f'得点: {int(total_score[user_idx])}'
+        )
+
+    return 0
@@ -1,16 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
 from logging import Logger
-from typing import Sequence
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
 
 from .consts import LANG_UPDATED, LANG_TABLE, SUB_LANG_TABLE
-from .contest.task import Task
+from .contest.task import Task, fetch_submit_form
+from .runner import load_runners, submit_language
+from .stable import DEFAULT_REPEAT
 from .utils import (
-    search_task_json,
+    pop_format_option, pop_value_option, search_task_json, CookieSession, RateLimiter,
 )
 
 
+# まとめて提出する際の同時接続数と提出間隔 (秒)
+SUBMIT_CONCURRENCY = 2
+SUBMIT_INTERVAL = 1.0
+
+
+def _split_options(argv: Sequence[str]) -> Tuple[List[str], Set[str]]:
+    """位置引数と `--` で始まるオプションを分離する"""
+    args = [arg for arg in argv if not arg.startswith('--')]
+    options = {arg for arg in argv if arg.startswith('--')}
+    return args, options
+
+
+def _pop_lang_option(argv: Sequence[str]) -> List[str]:
+    """`--lang <lang>` / `--lang=<lang>` を位置引数の言語指定に変換する"""
+    args = list(argv)
+    for i, arg in enumerate(args):
+        if arg.startswith('--lang='):
+            lang = arg[len('--lang='):]
+            del args[i]
+            break
+        elif arg == '--lang' and i + 1 < len(args):
+            lang = args[i + 1]
+            del args[i:i + 2]
+            break
+    else:
+        return args
+
+    # 問題コードの後ろに言語を置く
+    positional = [a for a in args if not a.startswith('--')]
+    insert_at = args.index(positional[0]) + 1 if positional else 0
+    args.insert(insert_at, lang)
+    return args
+
+
+def _pop_stable_option(argv: Sequence[str]) -> Tuple[List[str], int]:
+    """`--stable` / `--stable=<回数>` を取り出す (指定がなければ 0)"""
+    args, value = pop_value_option(argv, 'stable')
+    repeat = 0
+    if value is not None:
+        try:
+            repeat = int(value)
+        except ValueError:
+            raise RuntimeError(f'不正な実行回数: {value}')
+        if repeat < 1:
+            raise RuntimeError(f'不正な実行回数: {value}')
+    if '--stable' in args:
+        args.remove('--stable')
+        repeat = repeat or DEFAULT_REPEAT
+    return args, repeat
+
+
+def _parse_lang_list(lang: str) -> List[str]:
+    """`all` またはカンマ区切りの言語指定を展開する"""
+    if lang == 'all':
+        return list(load_runners().keys())
+    return [x for x in lang.split(',') if x]
+
+
+def _precheck_lang(lang: str, options: Set[str]) -> Optional[str]:
+    """提出前の構文チェックに使う言語 (Python 以外のランナーはチェックしない)"""
+    runner = load_runners().get(lang)
+    if '--no-precheck' in options or (runner is not None and runner.interpreter is None):
+        return None
+    return lang
+
+
+def _check_runnable(lang: str, options: Set[str]) -> None:
+    """--check の場合は、ローカルで実行できる言語か確認する"""
+    if '--check' in options and lang not in load_runners():
+        raise RuntimeError(f'ローカルで実行できない言語のため、テストケースを実行できません: {lang}')
+
+
 def __pre_operate(logger, argv) -> Task:
     """共通の前処理"""
     # 引数の処理
+    argv, _ = _split_options(_pop_lang_option(argv))
     lang = list(LANG_TABLE.keys())[0]
     task_code = ''
     if len(argv) >= 2:
@@ -27,30 +104,124 @@ def __pre_operate(logger, argv) -> Task:
 
 def check_testcase(logger: Logger, argv: Sequence[str]) -> int:
     """公式のテストケースでチェックする
+
+    言語に `all` やカンマ区切りの複数の言語を指定した場合は、すべての言語で並列に実行する
+    --interactor=<path>: インタラクティブ問題のジャッジを指定する
+    --stable[=<回数>]: 計測を安定させて複数回実行し、実行時間の中央値を表示する
+    --no-cache: 前回の判定結果を使わずにすべてのケースを実行する
+    --format=ndjson: 各ケースの結果を終わり次第1行のjsonで出力する
     """
     task: Task
+    argv, interactor = pop_value_option(argv, 'interactor')
+    interactor_path = Path(interactor).resolve() if interactor else None
+    argv, repeat = _pop_stable_option(argv)
+    argv, fmt = pop_format_option(argv)
+    use_cache = '--no-cache' not in argv
     task, lang = __pre_operate(logger, argv)
-    task.run_testcase(lang)
+    lang_l = _parse_lang_list(lang)
+    if len(lang_l) > 1 or lang == 'all':
+        task.run_testcase_matrix(lang_l, interactor_path, repeat, use_cache, fmt)
+    else:
+        task.run_testcase(
+            lang, interactor_path=interactor_path, repeat=repeat, use_cache=use_cache, fmt=fmt)
     return 0
 
 
 def submit_code(logger: Logger, argv: Sequence[str]) -> int:
     """コードを提出する
+
+    問題をカンマ区切りで指定した場合は、まとめて並列に提出する
+    --check: 提出前に公式のテストケースを実行し、すべて OK の場合のみ提出する
+    --no-precheck: 提出前の構文チェックを行わない
     """
     task: Task
+    argv, options = _split_options(_pop_lang_option(argv))
+    if len(argv) >= 1 and ',' in argv[0]:
+        return __submit_multi(logger, argv, options)
+
     task, lang = __pre_operate(logger, argv)
-    task.submit_code(SUB_LANG_TABLE[lang])
+    sub_lang = submit_language(lang)
+    _check_runnable(lang, options)
+    if '--check' in options:
+        if not task.run_testcase(lang):
+            raise RuntimeError(f'テストケースが通らないため提出を中止しました: {task.key}')
+    task.submit_code(sub_lang, _precheck_lang(lang, options), lang)
 
     return 0
 
 
+def __submit_multi(logger: Logger, argv: Sequence[str], options: Set[str]) -> int:
+    """複数の問題をまとめて提出する
+
+    提出フォームは1度だけ取得し、csrf_token と言語IDを使い回す
+    """
+    lang = argv[1] if len(argv) >= 2 else list(LANG_TABLE.keys())[0]
+    sub_lang = submit_language(lang)
+    _check_runnable(lang, options)
+    task_l = [
+        Task(logger, search_task_json(task_code))
+        for task_code in argv[0].split(',') if task_code
+    ]
+    contest_l = sorted(set(task.contest for task in task_l))
+    if len(contest_l) != 1:
+        raise RuntimeError(f'異なるコンテストの問題はまとめて提出できません: {", ".join(contest_l)}')
+
+    # 提出前の確認はローカルで順に行う
+    summary: Dict[str, str] = dict()
+    code_d: Dict[str, str] = dict()
+    for task in task_l:
+        try:
+            if '--check' in options and not task.run_testcase(lang):
+                raise RuntimeError(f'テストケースが通らないため提出を中止しました: {task.key}')
+            code_d[task.key] = task.prepare_submission(_precheck_lang(lang, options), lang)
+        except RuntimeError as e:
+            summary[task.key] = f'NG: {e}'
+
+    limiter = RateLimiter(SUBMIT_INTERVAL)
+
+    def post(task: Task) -> None:
+        limiter.wait()
+        task.post_submission(session, form, sub_lang, code_d[task.key])
+
+    with CookieSession() as session:
+        form = fetch_submit_form(session, contest_l[0], task_l[0].code, sub_lang)
+        target_l = [task for task in task_l if task.key in code_d]
+        with ThreadPoolExecutor(max_workers=SUBMIT_CONCURRENCY) as executor:
+            future_l = [executor.submit(post, task) for task in target_l]
+            for task, future in zip(target_l, future_l):
+                try:
+                    future.result()
+                    summary[task.key] = f'OK: 提出しました (lang: {sub_lang})'
+                except RuntimeError as e:
+                    summary[task.key] = f'NG: {e}'
+
+    for task in task_l:
+        text = f'{task.key}: {summary[task.key]}'
+        if summary[task.key].startswith('OK'):
+            logger.info(text)
+        else:
+            logger.error(text)
+
+    return 0 if all(text.startswith('OK') for text in summary.values()) else 1
+
+
 def test_code(logger: Logger, argv: Sequence[str]) -> int:
     """単一のテストケースでチェックする
+
+    --interactor=<path>: インタラクティブ問題のジャッジを指定する
+    --stable[=<回数>]: 計測を安定させて複数回実行し、実行時間の中央値を表示する
+    --no-cache: 前回の判定結果を使わずに実行する
+    --format=ndjson: 結果を1行のjsonで出力する
     """
+    argv, interactor = pop_value_option(argv, 'interactor')
+    interactor_path = Path(interactor).resolve() if interactor else None
+    argv, repeat = _pop_stable_option(argv)
+    argv, fmt = pop_format_option(argv)
+    argv, options = _split_options(_pop_lang_option(argv))
     lang = list(LANG_TABLE.keys())[0]
     task_code = ''
     if len(argv) >= 3:
-        lang = argv[1]
+        lang = argv[2]
     if len(argv) >= 2:
         task_code = argv[0]
         test_num = argv[1]
@@ -59,7 +230,7 @@ def test_code(logger: Logger, argv: Sequence[str]) -> int:
 
     task_path = search_task_json(task_code)
     task = Task(logger, task_path)
-    task.run_testcase(lang, test_num)
+    task.run_testcase(lang, test_num, interactor_path, repeat, '--no-cache' not in options, fmt)
     return 0
 
 
@@ -68,8 +239,13 @@ def show_language(logger: Logger, _: Sequence[str]) -> int:
     """
     # テストに使える言語
     logger.info(f'実行可能な言語 (updated on {LANG_UPDATED})')
-    for key, cmd in LANG_TABLE.items():
-        print(f'\t{key}\t-> {cmd}')
+    for key, runner in load_runners().items():
+        text = f'\t{key}\t-> {runner.interpreter or runner.run}'
+        if runner.compile is not None:
+            text += f' (compile: {runner.compile})'
+        if runner.submit_language is not None and key not in SUB_LANG_TABLE:
+            text += f' [提出: {runner.submit_language}]'
+        print(text)
 
     print()
     # 提出できる言語
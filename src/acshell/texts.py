@@ -3,7 +3,7 @@
 HELP_TEXT = {
     'help': {
         'short': 'h',
-        'args': '',
+        'args': '[command]',
         'text': 'コマンド一覧を表示する',
     },
     'login': {
@@ -13,33 +13,69 @@ HELP_TEXT = {
     },
     'load': {
         'short': 'ld',
-        'args': '<contest_name>',
+        'args': '<contest_name> [--at-start]',
         'text': '<contest_name> のフォルダを現在のディレクトリに作成し、テストケースなどを取得する'
+                ' (--at-start でコンテスト開始まで待機し、開始と同時に取得する。'
+                'abc300..abc320 のような範囲やカンマ区切りで指定すると、まとめて取得する。'
+                'ローカルミラーにあるコンテストは通信せずに作成する)'
+    },
+    'mirror': {
+        'short': 'mr',
+        'args': 'sync <contest_name> [--force]',
+        'text': '<contest_name> (範囲やカンマ区切りも可) の問題情報とテストケースをローカルミラーに圧縮して保存する'
+                ' (終了後に保存したコンテストは飛ばす。--force で取得し直す)'
     },
     'test': {
         'short': 't',
-        'args': '<task_code> <test_num> [lang]',
+        'args': '<task_code> <test_num> [lang] [--interactor=<path>] [--stable[=<n>]] [--no-cache]'
+                ' [--format=<fmt>]',
         'text': '問題 <task_code> のテストケース <test_num> を [lang] で実行する'
+                ' (--stable で計測を安定させて <n> 回実行し、実行時間の中央値を表示する)'
     },
     'check': {
         'short': 'c',
-        'args': '<task_code> [lang]',
+        'args': '<task_code> [lang] [--interactor=<path>] [--stable[=<n>]] [--no-cache]'
+                ' [--format=<fmt>]',
         'text': '問題 <task_code> のテストケースを [lang] で実行する'
+                ' ([lang] に all やカンマ区切りの言語を指定すると並列に実行して比較する。'
+                '--stable で計測を安定させて <n> 回実行し、実行時間の中央値を表示する。'
+                'コードと入出力が変わっていないケースは前回の結果を表示する。'
+                '--format=ndjson で各ケースの結果を終わり次第1行のjsonで出力する)'
     },
     'submit': {
         'short': 's',
-        'args': '<task_code> <lang>',
+        'args': '<task_code> <lang> [--check] [--no-precheck]',
         'text': '問題 <task_code> のコードを <lang> で提出する'
+                ' (提出前に構文チェックを行う。--check でテストケースも実行する。'
+                'runners.json で追加した言語はそのソースを提出する。'
+                '<task_code> をカンマ区切りで指定するとまとめて提出する)'
+    },
+    'history': {
+        'short': 'hs',
+        'args': '<task_code> [--lang=<lang>] [--threshold=<percent>]',
+        'text': '問題 <task_code> の実行履歴をコードの版ごとに表示し、'
+                '最良の結果から <percent>% 以上遅くなったケースを報告する'
+    },
+    'memprof': {
+        'short': 'mp',
+        'args': '<task_code> [case] [--lang=<lang>] [--top=<n>] [--gen=<path>] [--sizes=<n,...>] [--target=<n>]',
+        'text': '問題 <task_code> のテストケースを tracemalloc で実行し、メモリを確保している行を元のファイルの行で表示する'
+                ' (gen.py があれば生成した入力で計測し、サイズ <n> でのピークを推定してメモリ制限と比較する)'
     },
     'recent': {
         'short': 'rc',
-        'args': '',
-        'text': 'コンテストへの直近の提出結果を取得する'
+        'args': '[--format=<fmt>]',
+        'text': 'コンテストへの直近の提出結果を取得する (--format=ndjson で提出ごとに1行のjsonで出力する)'
     },
     'status': {
         'short': 'rs',
-        'args': '',
-        'text': 'コンテストでの得点状況を取得する'
+        'args': '[--format=<fmt>]',
+        'text': 'コンテストでの得点状況を取得する (--format=ndjson で問題ごとに1行のjsonで出力する)'
+    },
+    'standings': {
+        'short': 'st',
+        'args': '[--user=<name>] [--refresh]',
+        'text': 'コンテストの順位表を取得し、順位・問題ごとの得点分布・もう1問解いた場合の順位を表示する'
     },
     'edit-cheat': {
         'short': 'ec',
@@ -55,5 +91,15 @@ HELP_TEXT = {
         'short': 'lc',
         'args': '',
         'text': 'チートシートの一覧を表示する'
+    },
+    'bench-cheat': {
+        'short': 'bc',
+        'args': '[cheatsheet_name ...] [--lang=<lang>] [--threshold=<percent>] [--no-save]',
+        'text': 'チートシートのベンチマーク (bench_<name>.py) を実行し、前回から <percent>% 以上遅くなったものを報告する'
+    },
+    'completion': {
+        'short': 'cm',
+        'args': '[bash|zsh]',
+        'text': 'シェルの補完スクリプトを出力する (eval "$(acsh completion bash)" のように読み込む)'
     }
 }
@@ -0,0 +1,112 @@
+"""処理ごとの実行時間を記録する (--trace)
+
+記録した区間は JSON Lines か Chrome の trace event 形式で出力する
+"""
+from contextlib import contextmanager
+import functools
+import json
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+_enabled = False
+_lock = threading.Lock()
+_events: List[Dict] = []
+_origin = time.perf_counter()
+
+
+def enable() -> None:
+    """記録を開始する
+    """
+    global _enabled, _origin
+    with _lock:
+        _enabled = True
+        _origin = time.perf_counter()
+        _events.clear()
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+@contextmanager
+def span(name: str, cat: str, **args) -> Iterator[Dict]:
+    """with ブロックの実行時間を記録する
+
+    yield される辞書に値を追加すると、区間の付加情報として出力される
+    """
+    if not _enabled:
+        yield dict()
+        return
+
+    sta = time.perf_counter()
+    try:
+        yield args
+    finally:
+        end = time.perf_counter()
+        event = {
+            'name': name,
+            'cat': cat,
+            'start': sta - _origin,
+            'dur': end - sta,
+            'tid': threading.get_ident(),
+            'args': {k: v if isinstance(v, (int, float, bool)) else str(v) for k, v in args.items()},
+        }
+        with _lock:
+            _events.append(event)
+
+
+def traced(name: str, cat: str) -> Callable:
+    """関数の実行時間を記録するデコレータ
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, cat):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def dump(dest: Optional[str] = None) -> None:
+    """記録した区間を出力する
+
+    dest が未指定なら標準エラーに JSON Lines で出力し、
+    拡張子が .json なら Chrome の trace event 形式 (chrome://tracing) で保存する
+    """
+    with _lock:
+        event_l = sorted(_events, key=lambda ev: ev['start'])
+
+    if dest is not None and Path(dest).suffix == '.json':
+        pid = os.getpid()
+        data = {
+            'traceEvents': [
+                {
+                    'name': ev['name'], 'cat': ev['cat'], 'ph': 'X',
+                    'ts': round(ev['start'] * 1e6, 1), 'dur': round(ev['dur'] * 1e6, 1),
+                    'pid': pid, 'tid': ev['tid'], 'args': ev['args'],
+                } for ev in event_l
+            ],
+            'displayTimeUnit': 'ms',
+        }
+        with open(dest, mode='w', encoding='utf-8') as f:
+            json.dump(data, f)
+        return
+
+    line_l = [
+        json.dumps({
+            'name': ev['name'], 'cat': ev['cat'],
+            'start_ms': round(ev['start'] * 1000, 3), 'dur_ms': round(ev['dur'] * 1000, 3),
+            'args': ev['args'],
+        }, ensure_ascii=False) for ev in event_l
+    ]
+    if dest is None:
+        for line in line_l:
+            print(line, file=sys.stderr)
+    else:
+        with open(dest, mode='w', encoding='utf-8') as f:
+            f.writelines(line + '\n' for line in line_l)
@@ -1,13 +1,19 @@
+from contextlib import contextmanager
 import http
 import json
 import os
 from pathlib import Path
-from typing import Dict, Optional, Union
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, FrozenSet, Iterator, List, Optional, Sequence, Tuple, Union
 
 import appdirs
 from bs4 import BeautifulSoup
 import requests
 
+from . import tracer
 from .consts import ENCODING
 
 
@@ -16,6 +22,38 @@ TASK_JSON_NAME = '.task.json'
 user_data_dir = Path(appdirs.user_data_dir('acshell'))
 user_cache_dir = Path(appdirs.user_cache_dir('acshell'))
 cookie_path = user_data_dir / 'cookie.jar'
+# 通信のタイムアウト (接続, 読み込み)
+REQUEST_TIMEOUT = (3.05, 30)
+# 結果の出力形式 (--format=<fmt>)
+OUTPUT_FORMATS = ('text', 'ndjson')
+REG_ANSI_COLOR = re.compile(r'\033\[[0-9;]*m')
+# 前回・過去の最良の結果より遅くなったとみなす割合 (%, --threshold=<percent>)
+DEFAULT_THRESHOLD = 10.0
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: ロックは行わない
+    fcntl = None
+
+
+class OfflineError(RuntimeError):
+    """オフラインのため通信が必要な処理を実行できない
+    """
+
+
+_offline = False
+
+
+def set_offline(offline: bool = True) -> None:
+    """オフラインモードを設定する (以降の通信はすべて即座に失敗する)
+    """
+    global _offline
+    _offline = offline
+
+
+def is_offline() -> bool:
+    return _offline
 
 
 def print_bar() -> None:
@@ -24,6 +62,66 @@ def print_bar() -> None:
     print('-' * 60)
 
 
+def pop_value_option(argv: Sequence[str], name: str) -> Tuple[List[str], Optional[str]]:
+    """`--<name>=<value>` を取り出す (指定がなければ None)
+    """
+    prefix = f'--{name}='
+    value = None
+    args = []
+    for arg in argv:
+        if arg.startswith(prefix):
+            value = arg[len(prefix):]
+        else:
+            args.append(arg)
+    return args, value
+
+
+def pop_regression_options(argv: Sequence[str]) -> Tuple[List[str], Optional[List[str]], float]:
+    """`--lang=<lang,...>` / `--threshold=<percent>` を取り出す
+
+    Returns:
+        残りの引数, 言語のリスト (指定がなければ None), 性能低下とみなす割合 (%)
+    """
+    args, lang = pop_value_option(argv, 'lang')
+    args, threshold = pop_value_option(args, 'threshold')
+    try:
+        threshold_val = DEFAULT_THRESHOLD if threshold is None else float(threshold)
+    except ValueError:
+        raise RuntimeError(f'不正な閾値: --threshold={threshold}')
+    return args, lang.split(',') if lang is not None else None, threshold_val
+
+
+def pop_format_option(argv: Sequence[str]) -> Tuple[List[str], str]:
+    """`--format=<fmt>` / `--format <fmt>` を取り出す (指定がなければ text)
+    """
+    args = list(argv)
+    fmt = 'text'
+    for i, arg in enumerate(args):
+        if arg.startswith('--format='):
+            fmt = arg[len('--format='):]
+            del args[i]
+            break
+        elif arg == '--format' and i + 1 < len(args):
+            fmt = args[i + 1]
+            del args[i:i + 2]
+            break
+    if fmt not in OUTPUT_FORMATS:
+        raise RuntimeError(f'対応していない出力形式: {fmt} ({" / ".join(OUTPUT_FORMATS)})')
+    return args, fmt
+
+
+def print_ndjson(record: Dict) -> None:
+    """1件の結果を1行のjsonとして出力する
+
+    逐次読み取れるように、出力のたびに書き出す (文字列の色は取り除く)
+    """
+    record = {
+        key: REG_ANSI_COLOR.sub('', value) if isinstance(value, str) else value
+        for key, value in record.items()
+    }
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+
+
 def load_json(json_path: Optional[Path] = None) -> Dict:
     """jsonを読み込む
     """
@@ -32,8 +130,9 @@ def load_json(json_path: Optional[Path] = None) -> Dict:
         json_path = current_dir / CONTEST_JSON_NAME
 
     if json_path.exists():
-        with json_path.open(encoding=ENCODING) as f:
-            data = json.load(f)
+        with tracer.span('load_json', 'json', path=json_path):
+            with json_path.open(encoding=ENCODING) as f:
+                data = json.load(f)
     else:
         raise RuntimeError
 
@@ -41,19 +140,35 @@ def load_json(json_path: Optional[Path] = None) -> Dict:
 
 
 def save_json(json_path: Path, data: Dict) -> Path:
-    """jsonに書き込む
+    """jsonに書き込む (書き込み途中で中断されても壊れないようにする)
     """
     try:
         if json_path.is_dir():
             json_path = json_path / CONTEST_JSON_NAME
-        with json_path.open(mode='w', encoding=ENCODING) as f:
-            json.dump(data, f)
+        with tracer.span('save_json', 'json', path=json_path):
+            write_atomic(json_path, json.dumps(data).encode(ENCODING))
     except Exception:
         raise RuntimeError(f'設定の保存に失敗しました: {json_path}')
 
     return json_path
 
 
+def write_atomic(target_path: Path, data: bytes) -> None:
+    """一時ファイルに書き込んでからリネームし、途中の状態が読まれないようにする
+    """
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(
+        prefix=target_path.name + '.', suffix='.tmp', dir=str(target_path.parent))
+    try:
+        with os.fdopen(fd, mode='wb') as f:
+            f.write(data)
+        os.replace(tmp_name, str(target_path))
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+
 def search_contest_json() -> Optional[Path]:
     """上位ディレクトリにcontest.jsonがあるかどうかを調べる
     """
@@ -99,15 +214,56 @@ def get_cheat_dir() -> Path:
     return Path(env_path)
 
 
+@contextmanager
+def file_lock(target_path: Path) -> Iterator[None]:
+    """target_path に対応するロックファイルで排他ロックを取得する
+    """
+    lock_path = target_path.with_name(target_path.name + '.lock')
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with lock_path.open(mode='a') as lf:
+        if fcntl is not None:
+            fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+
+
 def get_soup(session: requests.Session, url: str) -> BeautifulSoup:
     response = session.get(url)
     if response.status_code != 200:
         raise RuntimeError(f'Webページの取得に失敗しました: {url}')
 
-    soup = BeautifulSoup(response.text, 'lxml')
+    return parse_html(response.text)
+
+
+def parse_html(text: str) -> BeautifulSoup:
+    """HTMLを解析する
+    """
+    with tracer.span('parse_html', 'html', size=len(text)):
+        soup = BeautifulSoup(text, 'lxml')
     return soup
 
 
+class RateLimiter:
+    """リクエストの間隔を一定以上あける (複数スレッドから共有する)
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_t = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait_t = self._next_t - now
+            self._next_t = max(now, self._next_t) + self.interval
+        if wait_t > 0:
+            time.sleep(wait_t)
+
+
 class URL:
     """URLを格納する
     """
@@ -136,6 +292,10 @@ class URL:
 
         return _res
 
+    @classmethod
+    def standings(cls, contest: str) -> str:
+        return cls.contest(contest) + '/standings/json'
+
     @classmethod
     def result(
         cls, contest: str, task: str = None, submission_id: Union[int, str] = None, page: int = 1,
@@ -162,6 +322,8 @@ class CookieSession(requests.Session):
     """
 
     def __init__(self, *args, **kwargs) -> None:
+        if is_offline():
+            raise OfflineError('オフラインのため、通信が必要な処理は実行できません')
         super().__init__(*args, **kwargs)
         # Cookieの設定
         self.cookies: requests.models.cookies.RequestsCookieJar = \
@@ -169,29 +331,77 @@ class CookieSession(requests.Session):
         if cookie_path.exists():
             self.cookies.load(ignore_discard=True)
         self.cookies.clear_expired_cookies()
+        # 読み込み時点の状態 (変更がなければ保存しない)
+        self._loaded_cookies = self._cookie_snapshot()
         # ログインのフラグ設定
         self.is_logined: Optional[bool] = None
+        # 設定した場合は、リクエストの間隔を制限する (複数スレッドで共有する場合など)
+        self.rate_limiter: Optional[RateLimiter] = None
         self.get(URL.SETTINGS)
 
     def __enter__(self):
         return super().__enter__()
 
     def __exit__(self, exc_type, exc_value, traceback) -> None:
-        cookie_path.parent.mkdir(parents=True, exist_ok=True)
-        self.cookies.save(ignore_discard=True)
-        cookie_path.chmod(0o600)
+        self.save_cookies()
         return super().__exit__(exc_type, exc_value, traceback)
 
+    def _cookie_snapshot(self) -> FrozenSet[Tuple]:
+        """Cookieの内容を比較可能な形で取得する
+        """
+        return frozenset(
+            (c.domain, c.path, c.name, c.value, c.expires, c.secure)
+            for c in self.cookies
+        )
+
+    @property
+    def cookies_changed(self) -> bool:
+        return self._cookie_snapshot() != self._loaded_cookies
+
+    def save_cookies(self) -> bool:
+        """Cookieが変更されていれば保存する
+
+        一時ファイルに書き込んでからリネームすることで、並列実行時にも壊れないようにする
+        """
+        if cookie_path.exists() and not self.cookies_changed:
+            return False
+
+        # LWPCookieJar.save と同じ内容
+        data = '#LWP-Cookies-2.0\n' + self.cookies.as_lwp_str(ignore_discard=True, ignore_expires=False)
+        cookie_path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(cookie_path):
+            write_atomic(cookie_path, data.encode(ENCODING))
+            os.chmod(str(cookie_path), 0o600)
+
+        self._loaded_cookies = self._cookie_snapshot()
+        return True
+
     def quit(self) -> None:
         self.__exit__(None, None, None)
 
-    def request(self, *args, **kwargs):
+    def request(self, method, url, *args, **kwargs):
         """レスポンスを読んでログインしているかどうかを確認する
         """
         # 有効期限の切れたCookieを破棄する
         self.cookies.clear_expired_cookies()
+        if is_offline():
+            raise OfflineError(f'オフラインのため、通信できません: {url}')
         # 処理を行う
-        response = super().request(*args, **kwargs)
+        kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
+        with tracer.span(f'{method} {url}', 'http', method=method, url=url) as sp:
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except requests.ConnectionError:
+                # 接続できない場合 (ConnectTimeout を含む) はオフラインとみなし、以降の通信を行わない
+                set_offline()
+                raise OfflineError(f'サーバーに接続できません (オフライン): {url}')
+            except requests.ReadTimeout:
+                # 応答が遅いだけなのでオフラインにはしない (送信した内容は届いている可能性がある)
+                note = ' (送信した内容は受け付けられている可能性があります)' if method.upper() == 'POST' else ''
+                raise RuntimeError(f'サーバーの応答がありません: {url}{note}')
+            sp['status'] = response.status_code
         # ログイン状態にあるかどうかを確認する
         if URL.LOGIN in response.url:
             self.is_logined = False
@@ -0,0 +1,72 @@
+"""テストケースの判定結果のキャッシュ
+
+(結合後のコード, インタプリタ, 入力, 想定出力) が同じケースは結果が変わらないので、
+前回の判定結果を再利用する
+"""
+import hashlib
+import json
+from pathlib import Path
+import threading
+from typing import Dict, Optional
+
+from .consts import ENCODING
+from .utils import file_lock, user_cache_dir, write_atomic
+
+
+verdict_cache_dir = user_cache_dir / 'verdicts'
+# 問題ごとに保持する件数 (古いものから捨てる)
+MAX_ENTRIES = 1000
+# 実行時間に左右される判定はキャッシュしない
+CACHEABLE_VERDICTS = ('OK', 'NG', 'RE')
+
+
+def _file_hash(path: Path) -> str:
+    if not path.is_file():
+        return ''
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+class VerdictCache:
+    """問題ごとの判定結果のキャッシュ
+
+    実行中はメモリ上で読み書きし (複数スレッドから共有する)、最後に save でまとめて保存する
+    """
+
+    def __init__(self, contest: str, task_code: str) -> None:
+        self.path = verdict_cache_dir / contest / f'{task_code}.json'
+        self.entries: Dict[str, Dict] = dict()
+        self.updated = False
+        self._lock = threading.Lock()
+        if self.path.is_file():
+            try:
+                with self.path.open(encoding=ENCODING) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                # 壊れていれば作り直す
+                pass
+
+    @staticmethod
+    def key(code_hash: str, interpreter: str, in_path: Path, out_path: Path) -> str:
+        return ':'.join((code_hash, interpreter, _file_hash(in_path), _file_hash(out_path)))
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            return self.entries.get(key)
+
+    def put(self, key: str, record: Dict) -> None:
+        if record['verdict'] not in CACHEABLE_VERDICTS:
+            return
+        with self._lock:
+            # 新しいものを末尾に置く
+            self.entries.pop(key, None)
+            self.entries[key] = record
+            self.updated = True
+
+    def save(self) -> None:
+        if not self.updated:
+            return
+        with self._lock:
+            entries = dict(list(self.entries.items())[-MAX_ENTRIES:])
+        with file_lock(self.path):
+            write_atomic(self.path, json.dumps(entries).encode(ENCODING))
+        self.updated = False
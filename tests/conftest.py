@@ -0,0 +1,81 @@
+import http.server
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import pytest
+
+from acshell import utils
+
+
+class StubServer:
+    """AtCoder の代わりに応答するローカルのサーバー
+
+    respond(method, path, form) が (ステータス, 本文) を返す (None なら 404)
+    """
+
+    def __init__(self) -> None:
+        # (時刻, メソッド, パス, フォーム)
+        self.requests: List[Tuple[float, str, str, dict]] = []
+        self.respond: Callable[[str, str, dict], Optional[Tuple[int, str]]] = lambda *_: None
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def _handle(self, method: str) -> None:
+                length = int(self.headers.get('Content-Length') or 0)
+                form = {
+                    key: value[0]
+                    for key, value in parse_qs(self.rfile.read(length).decode()).items()
+                }
+                with stub.lock:
+                    stub.requests.append((time.monotonic(), method, self.path, form))
+                if self.path.startswith('/settings'):
+                    result = (200, '<html>settings</html>')
+                else:
+                    result = stub.respond(method, self.path, form)
+                status, body = result or (404, '')
+                data = body.encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except OSError:
+                    # クライアントがタイムアウトして切断した
+                    pass
+
+            def do_GET(self) -> None:
+                self._handle('GET')
+
+            def do_POST(self) -> None:
+                self._handle('POST')
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.base = f'http://127.0.0.1:{self.server.server_port}/'
+
+    def hits(self, method: str, prefix: str) -> List[Tuple[float, str, str, dict]]:
+        return [req for req in self.requests if req[1] == method and req[2].startswith(prefix)]
+
+
+@pytest.fixture
+def stub_server(tmp_path, monkeypatch):
+    """URL をローカルのサーバーに向け、Cookie を一時フォルダに保存する"""
+    stub = StubServer()
+    thread = threading.Thread(target=stub.server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(utils.URL, 'BASE', stub.base)
+    monkeypatch.setattr(utils.URL, 'LOGIN', stub.base + 'login')
+    monkeypatch.setattr(utils.URL, 'SETTINGS', stub.base + 'settings')
+    monkeypatch.setattr(utils, 'cookie_path', tmp_path / 'cookie.jar')
+    utils.set_offline(False)
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+    utils.set_offline(False)
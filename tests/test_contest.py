@@ -0,0 +1,63 @@
+import json
+import logging
+
+import pytest
+
+from acshell import cheatsheet, complete, mirror, utils
+from acshell.contest.contest import load_contest
+
+
+def make_record(contest_code):
+    return {
+        'code': contest_code, 'title': contest_code.upper(),
+        'start_dt': '2023-04-22 21:00:00+0900', 'end_dt': '2023-04-22 22:40:00+0900',
+        'tasks': {
+            'A': {'code': f'{contest_code}_a', 'name': 'TA', 'score': 100,
+                  'time_limit': 2, 'memory_limit': 1024,
+                  'testcases': [{'input': '1 2\n', 'output': '3\n'}]},
+            # 入力例のない問題
+            'B': {'code': f'{contest_code}_b', 'name': 'TB', 'score': 200,
+                  'time_limit': 2, 'memory_limit': 1024, 'testcases': []},
+        },
+    }
+
+
+@pytest.fixture
+def mirrored(tmp_path, monkeypatch):
+    monkeypatch.setattr(mirror, 'mirror_dir', tmp_path / 'mirror')
+    monkeypatch.setattr(mirror, 'index_path', tmp_path / 'mirror' / 'index.json')
+    monkeypatch.setattr(complete, 'completion_path', tmp_path / 'completion.json')
+    monkeypatch.setattr(complete, 'cheat_index_path', tmp_path / 'cheat_index.json')
+    monkeypatch.setattr(cheatsheet, 'cheat_index_path', tmp_path / 'cheat_index.json')
+    monkeypatch.setenv('ACSHELL_PATH', str(tmp_path / 'cheat'))
+    mirror.load_index.cache_clear()
+    mirror.contest_record.cache_clear()
+    mirror.save_records([make_record('abc300'), make_record('abc301')])
+
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    monkeypatch.chdir(work_dir)
+    utils.set_offline(True)
+    yield work_dir
+    utils.set_offline(False)
+    mirror.load_index.cache_clear()
+    mirror.contest_record.cache_clear()
+
+
+def check_restored(contest_dir):
+    task_a = json.loads((contest_dir / 'A' / '.task.json').read_text())
+    task_b = json.loads((contest_dir / 'B' / '.task.json').read_text())
+    assert task_a['testcases'] == [{'name': '01'}]
+    assert (contest_dir / 'A' / 'in' / '01.txt').read_text() == '1 2\n'
+    assert task_b['testcases'] == []
+
+
+def test_restore_with_empty_testcases(mirrored):
+    assert load_contest(logging.getLogger(__name__), ['abc300']) == 0
+    check_restored(mirrored / 'abc300')
+
+
+def test_bulk_restore_with_empty_testcases(mirrored):
+    assert load_contest(logging.getLogger(__name__), ['abc300,abc301']) == 0
+    for contest_code in ('abc300', 'abc301'):
+        check_restored(mirrored / contest_code)
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+from acshell.interactive import run_interactive
+
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'wait4'), reason='wait4 が必要')
+
+# 1行受け取り、同じ行が返ってくれば正解
+INTERACTOR = '''\
+import sys
+block = bytearray({inter_mb} << 20)
+print("hello", flush=True)
+sys.exit(0 if input() == "hello" else 1)
+'''
+SOLUTION = '''\
+block = bytearray({sol_mb} << 20)
+print(input(), flush=True)
+'''
+
+
+def run(sol_mb: int, inter_mb: int, limit: int):
+    return run_interactive(
+        [sys.executable, '-c', SOLUTION.format(sol_mb=sol_mb)],
+        [sys.executable, '-c', INTERACTOR.format(inter_mb=inter_mb)],
+        5, limit,
+    )
+
+
+def test_ok():
+    res = run(1, 1, 256)
+    assert res['verdict'] == 'OK'
+    assert res['query_cnt'] == 1
+
+
+def test_mle():
+    res = run(512, 1, 256)
+    assert res['verdict'] == 'MLE'
+    assert res['memory'] > 256 * 1024
+
+
+def test_interactor_not_limited():
+    res = run(1, 512, 256)
+    assert res['verdict'] == 'OK'
+    assert res['interactor_memory'] > 512 * 1024
+
+
+def test_memory_excludes_spawner():
+    # このプロセスが大きなメモリを使った後でも、解答の最大メモリに含めない
+    block = bytearray(512 << 20)
+    res = run(1, 1, 256)
+    del block
+    assert res['verdict'] == 'OK'
+    assert res['memory'] is None or res['memory'] < 256 * 1024
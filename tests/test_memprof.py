@@ -0,0 +1,72 @@
+import json
+import platform
+import subprocess
+import sys
+
+import pytest
+
+from acshell import memprof
+
+
+pytestmark = pytest.mark.skipif(
+    platform.python_implementation() != 'CPython', reason='tracemalloc は CPython のみ')
+
+# 2行目の辞書の確保中にピークになる (1行目のリストは残ったまま)
+SOLUTION = '''\
+a = [(i, i) for i in range(200000)]
+d = {i: str(i) for i in range(200000)}
+print(len(a), len(d))
+'''
+PLAIN_SCRIPT = '''\
+import json, runpy, sys, tracemalloc
+tracemalloc.start()
+runpy.run_path(sys.argv[1], run_name="__main__")
+print(json.dumps(tracemalloc.get_traced_memory()[1]))
+'''
+
+
+@pytest.fixture
+def solution(tmp_path, monkeypatch):
+    monkeypatch.setitem(memprof.LANG_TABLE, 'python', sys.executable)
+    src_path = tmp_path / 'main.py'
+    src_path.write_text(SOLUTION)
+    in_path = tmp_path / 'in.txt'
+    in_path.write_text('\n')
+    return src_path, in_path
+
+
+def test_peak_matches_plain_tracemalloc(solution):
+    src_path, in_path = solution
+    res = subprocess.run(
+        [sys.executable, '-c', PLAIN_SCRIPT, str(src_path)],
+        stdout=subprocess.PIPE, check=True)
+    plain_peak = json.loads(res.stdout.decode().splitlines()[-1])
+
+    prof = memprof._profile('python', src_path, in_path, 10, 60)
+    assert plain_peak * 0.9 <= prof['peak'] <= plain_peak * 1.1
+
+
+def test_sites_include_peak_line(solution):
+    src_path, in_path = solution
+    prof = memprof._profile('python', src_path, in_path, 10, 60)
+    lineno_l = [lineno for lineno, _, _ in prof['sites']]
+    assert lineno_l[0] == 2
+    assert 1 in lineno_l
+
+
+def test_sites_include_stdlib_caller(solution):
+    # json (標準ライブラリの Python のコード) の中での確保は、呼び出した3行目に含める
+    src_path, in_path = solution
+    src_path.write_text(
+        'import json\n'
+        's = "[" + ",".join(["{}"] * 300000) + "]"\n'
+        'd = json.loads(s)\n'
+        'print(len(d))\n')
+    prof = memprof._profile('python', src_path, in_path, 10, 60)
+    assert prof['sites'][0][0] == 3
+
+
+def test_fit_power():
+    a, b = memprof._fit_power([10, 100, 1000], [20, 200, 2000])
+    assert b == pytest.approx(1.0)
+    assert a == pytest.approx(2.0)
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from acshell.process import run_process
+
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'wait4'), reason='wait4 が必要')
+
+
+def test_result():
+    res = run_process([sys.executable, '-c', 'print(1)'], subprocess.DEVNULL, 10)
+    assert res.returncode == 0
+    assert res.stdout == b'1\n'
+    assert res.cpu_t is not None
+
+
+def test_memory_excludes_spawner():
+    # wait4 の最大メモリに含まれる、このプロセスの使用量を除く
+    block = bytearray(512 << 20)
+    res = run_process([sys.executable, '-c', 'pass'], subprocess.DEVNULL, 10)
+    del block
+    assert res.memory is None
+
+    res = run_process(
+        [sys.executable, '-c', 'block = bytearray(1 << 30)'], subprocess.DEVNULL, 10)
+    assert 1 << 20 < res.memory < (1 << 20) + 256 * 1024
+
+
+def test_timeout_kills_grandchildren():
+    # sh の子の sleep がパイプを開いたままでも、タイムアウトで戻る
+    sta = time.perf_counter()
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_process('sleep 6; true', subprocess.DEVNULL, 0.5, shell=True)
+    assert time.perf_counter() - sta < 3
+
+
+def test_background_grandchild():
+    sta = time.perf_counter()
+    res = run_process('echo hi; (sleep 6 &)', subprocess.DEVNULL, 5, shell=True)
+    assert res.stdout == b'hi\n'
+    assert time.perf_counter() - sta < 3
@@ -0,0 +1,78 @@
+import json
+import logging
+
+import pytest
+
+from acshell import standings
+
+
+pytest.importorskip('numpy')
+
+MINUTE = 60 * 10 ** 9
+
+
+def row(user, rank, scores, elapsed_min, penalty):
+    return {
+        'Rank': rank, 'UserScreenName': user,
+        'TaskResults': {
+            f'abc300_{key.lower()}': {'Score': score * 100, 'Count': 1}
+            for key, score in scores.items()
+        },
+        'TotalResult': {
+            'Score': sum(scores.values()) * 100, 'Elapsed': elapsed_min * MINUTE,
+            'Penalty': penalty,
+        },
+    }
+
+
+@pytest.fixture
+def standings_cache(tmp_path, monkeypatch):
+    contest_dir = tmp_path / 'abc300'
+    contest_dir.mkdir()
+    (contest_dir / '.contest.json').write_text(json.dumps({
+        'code': 'abc300', 'title': 'ABC300', 'start_dt': '', 'end_dt': '',
+        'tasks': {
+            key: {'code': f'abc300_{key.lower()}', 'name': key, 'score': str(score)}
+            for key, score in zip('ABCDE', (100, 200, 100, 500, 300))
+        },
+    }))
+    monkeypatch.chdir(contest_dir)
+    monkeypatch.setattr(standings, 'user_cache_dir', tmp_path / 'cache')
+    cache_path = tmp_path / 'cache' / 'standings' / 'abc300.json'
+    cache_path.parent.mkdir(parents=True)
+    # me は経過時間では u2 より早いが、ペナルティ3回 (15分) で u2 より後ろ
+    cache_path.write_text(json.dumps({
+        '_user': 'me',
+        'TaskInfo': [
+            {'Assignment': key, 'TaskScreenName': f'abc300_{key.lower()}'} for key in 'ABCDE'
+        ],
+        'StandingsData': [
+            row('u1', 1, {'A': 100, 'B': 200, 'C': 100}, 52, 0),
+            row('u2', 2, {'A': 100, 'B': 200}, 50, 0),
+            row('me', 3, {'A': 100, 'B': 200}, 40, 3),
+            row('u4', 4, {'A': 100, 'E': 100}, 10, 0),
+        ],
+    }))
+
+
+def test_rank_with_penalty(standings_cache, capsys):
+    assert standings.standings(logging.getLogger(__name__), []) == 0
+    out = capsys.readouterr().out
+    assert 'me: 3 位 / 4 人' in out
+    # C を解いた場合は 400 点で 55 分 (u1 は 52 分) なので 2 位
+    c_row = next(line for line in out.splitlines() if line.startswith('| C'))
+    assert c_row.rstrip(' |').split('|')[-1].strip() == '2'
+
+
+def test_full_score_from_contest(standings_cache, capsys):
+    assert standings.standings(logging.getLogger(__name__), []) == 0
+    out = capsys.readouterr().out
+    task_row = {
+        line.split('|')[1].strip(): [cell.strip() for cell in line.strip(' |').split('|')]
+        for line in out.splitlines() if line.startswith('| ') and len(line.split('|')) > 8
+    }
+    # 誰も解いていない D も、解けば 800 点で 1 位
+    assert task_row['D'][1:3] == ['500', '0 / 0']
+    assert task_row['D'][-1] == '1'
+    # E は部分点 (100 / 300) のみなので正解者はいない
+    assert task_row['E'][1:3] == ['300', '0 / 1']
@@ -0,0 +1,75 @@
+import json
+import logging
+import sys
+
+import pytest
+
+from acshell import cheatsheet, complete
+from acshell.consts import LANG_TABLE
+from acshell.contest.task import Task
+
+
+@pytest.fixture
+def task_dir(tmp_path, monkeypatch):
+    cheat_dir = tmp_path / 'cheat'
+    (cheat_dir / 'cheatsheets').mkdir(parents=True)
+    (cheat_dir / 'uf.py').write_text('UF = "library"\n')
+    (cheat_dir / 'cheatsheets' / 'seg.py').write_text('SEG = "library"\n')
+    monkeypatch.setenv('ACSHELL_PATH', str(cheat_dir))
+    monkeypatch.setattr(cheatsheet, 'cheat_index_path', tmp_path / 'cheat_index.json')
+    monkeypatch.setattr(complete, 'completion_path', tmp_path / 'completion.json')
+    monkeypatch.setattr(complete, 'cheat_index_path', tmp_path / 'cheat_index.json')
+
+    task_dir = tmp_path / 'abc300' / 'A'
+    task_dir.mkdir(parents=True)
+    (task_dir / '.task.json').write_text(json.dumps({
+        'contest': 'abc300', 'key': 'A', 'code': 'abc300_a',
+        'time_limit': 2, 'memory_limit': 1024, 'testcases': [],
+    }))
+    (task_dir / 'abc300_a.py').write_text('from uf import UF\nfrom seg import SEG\nprint(UF, SEG)\n')
+    return task_dir
+
+
+def test_merge_uses_cheatsheets(task_dir):
+    merged = Task(logging.getLogger(__name__), task_dir / '.task.json').merge_code().read_text()
+    assert 'UF = "library"' in merged
+    assert 'SEG = "library"' in merged
+
+
+def test_cheat_conflict_shallowest_wins(task_dir, caplog):
+    # チートシートフォルダ直下と cheatsheets/ 以下に同名のファイルがある
+    sub_dir = task_dir.parents[1] / 'cheat' / 'cheatsheets' / 'graph'
+    sub_dir.mkdir()
+    (sub_dir / 'uf.py').write_text('UF = "nested"\n')
+    with caplog.at_level(logging.WARNING):
+        merged = Task(logging.getLogger(__name__), task_dir / '.task.json').merge_code().read_text()
+    assert 'UF = "library"' in merged
+    assert 'UF = "nested"' not in merged
+    assert 'cheatsheets/graph/uf.py' in caplog.text
+
+
+def test_task_folder_file_wins(task_dir, caplog):
+    # add-cheat でコピーしてから編集したファイル
+    (task_dir / 'uf.py').write_text('UF = "edited"\n')
+    (task_dir / 'seg.py').write_text('SEG = "library"\n')
+    with caplog.at_level(logging.WARNING):
+        merged = Task(logging.getLogger(__name__), task_dir / '.task.json').merge_code().read_text()
+    assert 'UF = "edited"' in merged
+    assert 'UF = "library"' not in merged
+    # 編集したファイルのみ報告する
+    assert any('uf' in record.getMessage() for record in caplog.records)
+    assert not any('seg' in record.getMessage() for record in caplog.records)
+
+
+def test_precheck_reports_original_line(task_dir, monkeypatch, caplog):
+    monkeypatch.setitem(LANG_TABLE, 'python', sys.executable)
+    (task_dir / 'uf.py').write_text('UF = "edited"\ndef broken(:\n')
+    task = Task(logging.getLogger(__name__), task_dir / '.task.json')
+    with caplog.at_level(logging.ERROR):
+        assert not task.precheck_code('python')
+    assert 'uf.py, line 2' in caplog.text
+
+    (task_dir / 'uf.py').write_text('UF = "edited"\n')
+    assert task.precheck_code('python')
+    # コンパイル結果は保存しない
+    assert not (task_dir / '__pycache__').exists()
@@ -0,0 +1,137 @@
+import json
+import logging
+import threading
+import time
+
+import pytest
+
+from acshell import cheatsheet, complete, task_run
+from acshell.consts import SUB_LANG_TABLE
+from acshell.contest import task as task_module
+from acshell.runner import load_runners
+
+
+LANG = SUB_LANG_TABLE['python']
+SUBMIT_PAGE = '''\
+<form>
+<input type="hidden" name="csrf_token" value="TOKEN&#43;1">
+<div id="select-lang-{code}"><select name="data.LanguageId">
+<option value=""></option>
+<option value="5055">{lang}</option>
+<option value="5078">Python (PyPy 3.10-v7.3.12)</option>
+</select></div>
+</form>
+'''
+# 言語の選択肢を含まないページ (キャッシュした言語IDを使う場合)
+TOKEN_ONLY_PAGE = '<form><input type="hidden" name="csrf_token" value="TOKEN&#43;2"></form>'
+
+
+@pytest.fixture
+def contest_dir(tmp_path, monkeypatch):
+    cheat_dir = tmp_path / 'cheat'
+    cheat_dir.mkdir()
+    monkeypatch.setenv('ACSHELL_PATH', str(cheat_dir))
+    monkeypatch.setattr(cheatsheet, 'cheat_index_path', tmp_path / 'cheat_index.json')
+    monkeypatch.setattr(complete, 'completion_path', tmp_path / 'completion.json')
+    monkeypatch.setattr(complete, 'cheat_index_path', tmp_path / 'cheat_index.json')
+    monkeypatch.setattr(task_module, 'user_cache_dir', tmp_path / 'cache')
+    monkeypatch.setattr(task_run, 'SUBMIT_INTERVAL', 0.2)
+    load_runners.cache_clear()
+
+    contest_dir = tmp_path / 'abc300'
+    contest_dir.mkdir()
+    (contest_dir / '.contest.json').write_text(json.dumps({
+        'code': 'abc300', 'title': 'ABC300', 'start_dt': '', 'end_dt': '',
+        'tasks': {key: {'code': f'abc300_{key.lower()}', 'name': key, 'score': 100} for key in 'ABC'},
+    }))
+    for key in 'ABC':
+        task_dir = contest_dir / key
+        task_dir.mkdir()
+        (task_dir / '.task.json').write_text(json.dumps({
+            'contest': 'abc300', 'key': key, 'code': f'abc300_{key.lower()}',
+            'time_limit': 2, 'memory_limit': 1024, 'testcases': [],
+        }))
+        (task_dir / f'abc300_{key.lower()}.py').write_text(f'print("{key}")\n')
+    monkeypatch.chdir(contest_dir)
+    yield contest_dir
+    load_runners.cache_clear()
+
+
+class SubmitServer:
+    """提出ページと提出を受け付ける (abc300_c の提出は失敗させる)"""
+
+    def __init__(self, page: str) -> None:
+        self.page = page
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, method, path, form):
+        if method == 'GET' and path.startswith('/contests/abc300/submit'):
+            return 200, self.page
+        if method == 'POST' and path.startswith('/contests/abc300/submit'):
+            with self.lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            time.sleep(0.3)
+            with self.lock:
+                self.running -= 1
+            if form['data.TaskScreenName'] == 'abc300_c':
+                return 500, 'error'
+            return 200, 'submitted'
+        return None
+
+
+def submit(caplog):
+    with caplog.at_level(logging.INFO):
+        return task_run.submit_code(logging.getLogger(__name__), ['A,B,C', 'python', '--no-precheck'])
+
+
+def test_submit_multi(stub_server, contest_dir, caplog):
+    server = SubmitServer(SUBMIT_PAGE.format(code='abc300_a', lang=LANG))
+    stub_server.respond = server
+
+    assert submit(caplog) == 1
+
+    # 提出フォームは1度だけ取得する
+    assert len(stub_server.hits('GET', '/contests/abc300/submit')) == 1
+    post_l = stub_server.hits('POST', '/contests/abc300/submit')
+    assert sorted(form['data.TaskScreenName'] for _, _, _, form in post_l) == \
+        ['abc300_a', 'abc300_b', 'abc300_c']
+    # csrf_token と言語IDを使い回す
+    assert {form['csrf_token'] for _, _, _, form in post_l} == {'TOKEN+1'}
+    assert {form['data.LanguageId'] for _, _, _, form in post_l} == {'5055'}
+    # 提出の間隔をあけつつ、並列に送信する
+    time_l = sorted(t for t, _, _, _ in post_l)
+    assert all(b - a >= 0.15 for a, b in zip(time_l, time_l[1:]))
+    assert server.max_running == task_run.SUBMIT_CONCURRENCY
+
+    # 問題ごとに1行ずつ結果を表示する
+    summary_l = [
+        record for record in caplog.records
+        if record.getMessage()[:3] in ('A: ', 'B: ', 'C: ')
+    ]
+    assert [record.getMessage()[:6] for record in summary_l] == ['A: OK:', 'B: OK:', 'C: NG:']
+    assert summary_l[2].levelno == logging.ERROR
+
+
+def test_submit_multi_uses_cached_languages(stub_server, contest_dir, caplog):
+    stub_server.respond = SubmitServer(SUBMIT_PAGE.format(code='abc300_a', lang=LANG))
+    submit(caplog)
+
+    # 2回目は言語の選択肢がなくても、キャッシュした言語IDで提出する
+    stub_server.requests.clear()
+    stub_server.respond = SubmitServer(TOKEN_ONLY_PAGE)
+    assert submit(caplog) == 1
+    post_l = stub_server.hits('POST', '/contests/abc300/submit')
+    assert len(post_l) == 3
+    assert {form['csrf_token'] for _, _, _, form in post_l} == {'TOKEN+2'}
+    assert {form['data.LanguageId'] for _, _, _, form in post_l} == {'5055'}
+
+
+def test_submit_check_requires_local_language(stub_server, contest_dir):
+    # mamba は提出のみできる言語
+    for task_code in ('A', 'A,B'):
+        with pytest.raises(RuntimeError, match='ローカルで実行できない'):
+            task_run.submit_code(logging.getLogger(__name__), [task_code, 'mamba', '--check'])
+    assert not stub_server.requests
@@ -0,0 +1,65 @@
+import http.cookiejar
+import socket
+import time
+
+import pytest
+
+from acshell import utils
+from acshell.utils import CookieSession, OfflineError
+
+
+def test_read_timeout_keeps_online(stub_server, monkeypatch):
+    def respond(method, path, form):
+        time.sleep(1)
+        return 200, 'late'
+
+    stub_server.respond = respond
+    with CookieSession() as session:
+        monkeypatch.setattr(utils, 'REQUEST_TIMEOUT', (3.05, 0.2))
+        with pytest.raises(RuntimeError) as exc_info:
+            session.get(stub_server.base + 'contests/abc300')
+        assert not isinstance(exc_info.value, OfflineError)
+        assert not utils.is_offline()
+
+        # 送信した内容は届いている可能性がある
+        with pytest.raises(RuntimeError, match='受け付けられている可能性'):
+            session.post(stub_server.base + 'contests/abc300/submit', data={'a': '1'})
+        assert not utils.is_offline()
+
+
+def test_connection_error_sets_offline(stub_server):
+    with CookieSession() as session:
+        # 使われていないポート
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        with pytest.raises(OfflineError):
+            session.get(f'http://127.0.0.1:{port}/')
+        assert utils.is_offline()
+        with pytest.raises(OfflineError):
+            session.get(stub_server.base + 'contests/abc300')
+
+
+def test_pop_regression_options():
+    args, lang_l, threshold = utils.pop_regression_options(
+        ['uf', '--lang=python,pypy', '--threshold=5', '--no-save'])
+    assert args == ['uf', '--no-save']
+    assert lang_l == ['python', 'pypy']
+    assert threshold == 5.0
+
+    assert utils.pop_regression_options(['uf']) == (['uf'], None, utils.DEFAULT_THRESHOLD)
+    with pytest.raises(RuntimeError):
+        utils.pop_regression_options(['--threshold=x'])
+
+
+def test_save_cookies_round_trip(stub_server):
+    with CookieSession() as session:
+        session.cookies.set_cookie(http.cookiejar.Cookie(
+            0, 'REVEL_SESSION', 'abc', None, False, 'atcoder.jp', False, False, '/', True,
+            True, 4102444800, False, None, None, {'HttpOnly': None}))
+        assert session.save_cookies()
+    assert utils.cookie_path.stat().st_mode & 0o777 == 0o600
+    assert list(utils.cookie_path.parent.glob('*.tmp')) == []
+    jar = http.cookiejar.LWPCookieJar(str(utils.cookie_path))
+    jar.load(ignore_discard=True)
+    assert [(cookie.name, cookie.value) for cookie in jar] == [('REVEL_SESSION', 'abc')]